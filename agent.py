@@ -1,60 +1,513 @@
-from llm_response import get_response
+from llm_response import aget_response, get_response
 # Assuming azure_di is a local file with the get_layout_as_markdown function
-from azure_di import get_layout_as_markdown
+from azure_di import aget_layout_as_markdown, get_layout_as_markdown
+import argparse
+import asyncio
+import glob
 import os
 from pathlib import Path
 import random
+import threading
 import json
 import csv
 import time
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-import sys
+from watcher import DebouncedFileHandler, is_supported
+import metrics
+from structured_log import setup_logging, shutdown_logging
+from metrics import timings
+from ocr_cache import file_sha256
+from results_store import get_store
+from worker_pool import AsyncStageLimits, MemoryCeiling, StageLimits, WorkerPool
+from clients import aclose_clients, close_clients, load_environment
+from rate_limit import RetriesExhausted
+from dead_letter import get_dead_letter_queue
+from preprocess import get_preprocessor
+from compaction import compact_for_prompt, estimate_tokens
+from fast_path import extract_locally
+from chunking import merge_extractions, split_windows, window_tokens
+from job_ledger import FAILED, SAVED, JobLedger, get_ledger
+from work_queue import QueueWorker, WorkQueue, get_work_queue, serve_queue
 
 # --- Configuration ---
-LOG_FILE_PATH = Path("agent_outputs") / "processing_log.txt"
-# Ensure the output folder is created right away
-os.makedirs(Path("agent_outputs"), exist_ok=True)
-
-
-# --- FileLogger Class (Fixed for UTF-8 Encoding) ---
-class FileLogger:
-    def __init__(self, filename):
-        self.terminal = sys.stdout
-        # FIX 1: Open the log file with UTF-8 encoding to prevent UnicodeEncodeError
-        self.log = open(filename, 'a', encoding='utf-8') 
-
-    def write(self, message):
-        self.terminal.write(message)
-        # FIX 2: Correctly write to the opened log file and flush immediately
-        self.log.write(message) 
-        self.log.flush() 
-
-    def flush(self):
-        self.terminal.flush()
-        self.log.flush()
-
-# Overwrite the system standard output for all print statements
-sys.stdout = FileLogger(LOG_FILE_PATH)
-# --- END of Log Redirection Code ---
-    
+OUTPUT_FOLDER = "agent_outputs"
+
+
+# Print output is routed to a rotating JSON-lines log by setup_logging(),
+# which main() installs (see structured_log.py).
+
+# Per-stage concurrency caps (AZURE_DI_CONCURRENCY / GEMINI_CONCURRENCY in .env)
+STAGE_LIMITS = StageLimits()
+
+# Failed jobs are retried by the startup reconciliation this many times
+MAX_RECONCILE_ATTEMPTS = 3
+
+# Multi-receipt packing (batch --pack); the token budget is the real limit
+DEFAULT_PACK_MAX_PROMPT_TOKENS = 8000
+DEFAULT_PACK_MAX_DOCS = 10
+
+
 def agent(file_path):
-    
-    if not Path(file_path).is_file() or Path(file_path).name.startswith('~'):
+    """
+    Runs one document through OCR, extraction and save. Returns the saved
+    record, or None when the file was skipped or parked in the dead-letter
+    queue.
+    """
+    if not _should_process(file_path):
         return
         
     print("="*60)
     print(f"🚀 Starting agent for file: {Path(file_path).name}")
-    
-    # 1. Get OCR Data
-    ocr_output = get_layout_as_markdown(file_path)
 
-    # 2. Define the strict JSON prompt
-    prompt = f"""
+    with metrics.track_document(Path(file_path).name):
+        metrics.note(image_bytes=os.path.getsize(file_path))
+
+        # The ledger remembers finished stages, so a restart resumes from them
+        content_hash = file_sha256(file_path)
+        job = get_ledger().start(file_path, content_hash)
+        try:
+            validated_data = resume_result(job)
+            if validated_data is None:
+                ocr_output = resume_ocr(job)
+                if ocr_output is None:
+                    # 1. Get OCR Data
+                    with STAGE_LIMITS.stage("azure_di"), metrics.stage("azure_di"):
+                        ocr_output = get_layout_as_markdown(file_path)
+                    get_ledger().mark_ocr_done(content_hash, ocr_output)
+                metrics.note(markdown_chars=len(ocr_output))
+                ocr_output = compact_for_prompt(ocr_output)
+
+                # 2-4. Prompt, LLM response and validation
+                validated_data = extract(file_path, ocr_output)
+                get_ledger().mark_llm_done(content_hash, validated_data)
+
+            with metrics.stage("save"):
+                save_result(file_path, validated_data, content_hash=content_hash)
+            return validated_data
+        except RetriesExhausted as e:
+            get_ledger().mark_failed(content_hash, e)
+            dead_letter(file_path, e)
+        except Exception as e:
+            get_ledger().mark_failed(content_hash, e)
+            raise
+
+
+def resume_result(job):
+    """
+    The validated record checkpointed before a crash, or None.
+    """
+    validated_data = JobLedger.checkpointed_result(job)
+    if validated_data is not None:
+        print(f"♻️ Resuming {Path(job['file_path']).name} from its saved extraction.")
+        metrics.increment("resumed_llm")
+    return validated_data
+
+
+def resume_ocr(job):
+    """
+    The OCR markdown checkpointed before a crash, or None.
+    """
+    if job.get("ocr_text") is not None:
+        print(f"♻️ Resuming {Path(job['file_path']).name} from its OCR checkpoint.")
+        metrics.increment("resumed_ocr")
+    return job.get("ocr_text")
+
+
+def dead_letter(file_path, error):
+    """
+    Parks a document whose API calls kept failing instead of saving a
+    PROCESS_FAIL record; `python agent.py replay` retries it later.
+    """
+    metrics.increment("dead_lettered")
+    get_dead_letter_queue().add(file_path, error.service, error.last_error)
+
+
+def extract(file_path, ocr_output):
+    """
+    Extracts a receipt from its OCR output (rule-based fast path first,
+    Gemini otherwise) and returns the validated record.
+    """
+    validated_data = fast_path_extract(file_path, ocr_output)
+    if validated_data is None:
+        windows = split_windows(ocr_output)
+        if len(windows) > 1:
+            # 2-3. Long documents: one bounded prompt per window, merged
+            response = extract_windows(windows)
+        else:
+            # 2. Define the strict JSON prompt
+            prompt = build_prompt(ocr_output)
+
+            # 3. Get LLM Response
+            with STAGE_LIMITS.stage("gemini"), metrics.stage("gemini"):
+                response = get_response(prompt)
+
+        # 4. Validate
+        with metrics.stage("validate"):
+            validated_data = validate_response(file_path, response)
+    return validated_data
+
+
+def _window_record(response):
+    """
+    The record parsed from one window's response, or None if the window failed.
+    """
+    try:
+        record = json.loads(response)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    return record if isinstance(record, dict) and not record.get('error') else None
+
+
+def _start_windows(windows):
+    print(f"🪟 OCR text is over {window_tokens()} tokens, extracting it in {len(windows)} windows...")
+    metrics.note(prompt_windows=len(windows))
+    metrics.increment("windowed_documents")
+
+
+def extract_windows(windows):
+    """
+    Extracts OCR text that is over the prompt budget window by window, one
+    Gemini call at a time so only one window's prompt and response are held
+    at once. Returns the merged record as a JSON string; if a window fails,
+    its response is returned instead so validate_response() records the failure.
+    """
+    _start_windows(windows)
+    records = []
+    for index, window in enumerate(windows, 1):
+        with STAGE_LIMITS.stage("gemini"), metrics.stage("gemini"):
+            response = get_response(build_prompt(window, part=(index, len(windows))))
+        record = _window_record(response)
+        if record is None:
+            return response
+        records.append(record)
+    return json.dumps(merge_extractions(records))
+
+
+async def aextract_windows(windows, limits):
+    """
+    Coroutine version of extract_windows().
+    """
+    _start_windows(windows)
+    records = []
+    for index, window in enumerate(windows, 1):
+        async with limits.stage("gemini"):
+            with metrics.stage("gemini"):
+                response = await aget_response(build_prompt(window, part=(index, len(windows))))
+        record = _window_record(response)
+        if record is None:
+            return response
+        records.append(record)
+    return json.dumps(merge_extractions(records))
+
+
+def fast_path_extract(file_path, ocr_output):
+    """
+    Rule-based extraction for simple receipts. Returns the validated record
+    when the rules found items and a total that pass the items-sum check,
+    or None to fall back to Gemini. Set FAST_PATH=0 to always use Gemini.
+    """
+    if os.getenv("FAST_PATH", "1") == "0":
+        return None
+    with metrics.stage("fast_path"):
+        record, reason = extract_locally(ocr_output)
+        validated_data = None
+        if record is not None:
+            validated_data = validate_response(file_path, json.dumps(record))
+            if not validated_data.get('internal_check_passed'):
+                validated_data, reason = None, "items sum check failed"
+
+    if validated_data is None:
+        print(f"🤖 Fast path skipped ({reason}), using Gemini.")
+        metrics.increment("path_llm")
+        metrics.note(extraction_path="llm", fast_path_reason=reason)
+        return None
+    print(f"⚡ Extracted {Path(file_path).name} locally, Gemini call skipped.")
+    metrics.increment("path_fast")
+    metrics.note(extraction_path="fast")
+    return validated_data
+
+
+async def async_agent(file_path, limits):
+    """
+    Coroutine version of agent(). Same stages, checkpoints and outputs, but
+    OCR polling and the Gemini call are awaited, so one thread can drive many
+    documents. limits is an AsyncStageLimits created on the running event loop.
+    Returns the saved record, or None, like agent().
+    """
+    if not _should_process(file_path):
+        return
+
+    print("="*60)
+    print(f"🚀 Starting async agent for file: {Path(file_path).name}")
+
+    with metrics.track_document(Path(file_path).name):
+        metrics.note(image_bytes=os.path.getsize(file_path))
+
+        # Hashing and ledger writes (fsynced) are file I/O, keep them off the event loop
+        content_hash = await asyncio.to_thread(file_sha256, file_path)
+        job = await asyncio.to_thread(get_ledger().start, file_path, content_hash)
+        try:
+            validated_data = resume_result(job)
+            if validated_data is None:
+                ocr_output = resume_ocr(job)
+                if ocr_output is None:
+                    async with limits.stage("azure_di"):
+                        with metrics.stage("azure_di"):
+                            ocr_output = await aget_layout_as_markdown(file_path)
+                    await asyncio.to_thread(get_ledger().mark_ocr_done, content_hash, ocr_output)
+                metrics.note(markdown_chars=len(ocr_output))
+                ocr_output = compact_for_prompt(ocr_output)
+
+                validated_data = fast_path_extract(file_path, ocr_output)
+                if validated_data is None:
+                    windows = split_windows(ocr_output)
+                    if len(windows) > 1:
+                        response = await aextract_windows(windows, limits)
+                    else:
+                        prompt = build_prompt(ocr_output)
+
+                        async with limits.stage("gemini"):
+                            with metrics.stage("gemini"):
+                                response = await aget_response(prompt)
+
+                    with metrics.stage("validate"):
+                        validated_data = validate_response(file_path, response)
+                await asyncio.to_thread(get_ledger().mark_llm_done, content_hash, validated_data)
+
+            with metrics.stage("save"):
+                await asyncio.to_thread(save_result, file_path, validated_data, content_hash=content_hash)
+            return validated_data
+        except RetriesExhausted as e:
+            await asyncio.to_thread(get_ledger().mark_failed, content_hash, e)
+            await asyncio.to_thread(dead_letter, file_path, e)
+        except Exception as e:
+            await asyncio.to_thread(get_ledger().mark_failed, content_hash, e)
+            raise
+
+
+async def run_async_batch(file_paths, concurrency=None):
+    """
+    Processes many documents concurrently from a single thread.
+    At most `concurrency` documents are in flight; the per-stage limits from
+    .env still cap the Azure DI and Gemini calls individually.
+    Returns the saved record for each file, in order; None where it failed.
+    """
+    concurrency = concurrency or int(os.getenv("AGENT_ASYNC_CONCURRENCY", "64"))
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = AsyncStageLimits(STAGE_LIMITS.limits)
+    memory = MemoryCeiling.for_workers(concurrency)
+
+    async def _run_one(file_path):
+        async with semaphore, memory.aadmit():
+            try:
+                return await async_agent(file_path, limits)
+            except Exception as e:
+                print(f"❌ Async agent failed for {file_path}: {e}")
+                return None
+
+    try:
+        return await asyncio.gather(*(_run_one(str(p)) for p in file_paths))
+    finally:
+        await aclose_clients()
+
+
+# ==============================================================================
+# 2b. MULTI-RECEIPT PACKING (several receipts per Gemini call)
+# ==============================================================================
+
+def pack_documents(docs, max_prompt_tokens, max_docs=None):
+    """
+    Greedily groups (file_path, ocr_output) pairs so that each group's batch
+    prompt stays within max_prompt_tokens. A document that does not fit on its
+    own ends up alone in its group and takes the single-document path.
+    """
+    max_docs = max_docs or int(os.getenv("PACK_MAX_DOCS", DEFAULT_PACK_MAX_DOCS))
+    overhead = estimate_tokens(build_batch_prompt([]))
+    groups, current, current_tokens = [], [], overhead
+    for file_path, ocr_output in docs:
+        doc_tokens = estimate_tokens(ocr_output) + 20  # + file header line
+        if current and (current_tokens + doc_tokens > max_prompt_tokens or len(current) >= max_docs):
+            groups.append(current)
+            current, current_tokens = [], overhead
+        current.append((file_path, ocr_output))
+        current_tokens += doc_tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def build_batch_prompt(group):
+    """
+    Builds one prompt that asks for a JSON array with one object per receipt.
+    """
+    receipts = "\n".join(
+        f"### FILE: {Path(file_path).name}\n{ocr_output}\n" for file_path, ocr_output in group
+    )
+    return f"""
+# Role: 
+    you are an assistant working in the finance department
+# Context:
+    you are given the ocr responses of {len(group)} receipts. Each receipt starts with a line "### FILE: <file name>".
+{receipts}
+# Task:
+for every receipt, identify all the items mentioned in it and their amounts and the total amount. Never mix items between receipts.
+
+# Output format:
+**STRICTLY** output only a single, valid JSON array with exactly one object per receipt. Do not include any text, notes, or markdown formatting (like ```json) outside of the JSON array itself.
+Each JSON object must have the following fields: 
+file_name (string, exactly as given after "### FILE:"), 
+total_amount_before_tax (float), 
+total_amount_after_tax (float), 
+items (list of dicts).
+items must be a list of dicts with fields: item_name (string), item_amount (float).
+"""
+
+
+def split_batch_response(response):
+    """
+    Maps file_name -> per-receipt record from a batch response. Entries that are
+    missing or malformed are simply absent from the result.
+    """
+    try:
+        data = json.loads(response)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    if isinstance(data, dict):
+        # Tolerate {"receipts": [...]} style wrappers
+        data = next((v for v in data.values() if isinstance(v, list)), [])
+    if not isinstance(data, list):
+        return {}
+
+    records = {}
+    for record in data:
+        if (isinstance(record, dict) and isinstance(record.get('file_name'), str)
+                and 'total_amount_before_tax' in record and isinstance(record.get('items'), list)):
+            records[record['file_name']] = record
+    return records
+
+
+def agent_packed(file_paths, max_prompt_tokens=None):
+    """
+    Batched variant of agent(): OCRs every file, then packs the markdown of
+    several receipts into one Gemini request (bounded by a prompt token budget)
+    and splits the JSON array back into the usual per-file outputs.
+    Receipts missing or malformed in the batch response fall back to the
+    single-document path, reusing their OCR output.
+
+    Each document gets its own metrics record and ledger job, as in agent(),
+    and a document that fails does not stop the others. Its "total" timing is
+    its own OCR time plus the time its group took up to its save; the whole
+    call is timed as "packed_batch". Returns the saved records.
+    """
+    max_prompt_tokens = max_prompt_tokens or int(
+        os.getenv("PACK_MAX_PROMPT_TOKENS", DEFAULT_PACK_MAX_PROMPT_TOKENS)
+    )
+    start = time.perf_counter()
+    saved = []
+
+    def save(file_path, content_hash, validated_data):
+        get_ledger().mark_llm_done(content_hash, validated_data)
+        with metrics.stage("save"):
+            save_result(file_path, validated_data, content_hash=content_hash)
+        saved.append(validated_data)
+
+    def fail(file_path, content_hash, error):
+        if content_hash is not None:
+            get_ledger().mark_failed(content_hash, error)
+        if isinstance(error, RetriesExhausted):
+            dead_letter(file_path, error)
+        else:
+            print(f"❌ Packed agent failed for {file_path}: {error}")
+
+    docs = []
+    pending = {}  # file path -> (metrics record, content hash, OCR seconds)
+    for file_path in file_paths:
+        if not _should_process(file_path):
+            continue
+        print("="*60)
+        print(f"🚀 Starting packed agent for file: {Path(file_path).name}")
+        doc = metrics.DocumentMetrics(Path(file_path).name)
+        doc_start = time.perf_counter()
+        content_hash = None
+        with metrics.document_scope(doc):
+            try:
+                metrics.note(image_bytes=os.path.getsize(file_path))
+                content_hash = file_sha256(file_path)
+                job = get_ledger().start(file_path, content_hash)
+                validated_data = resume_result(job)
+                if validated_data is None:
+                    ocr_output = resume_ocr(job)
+                    if ocr_output is None:
+                        with STAGE_LIMITS.stage("azure_di"), metrics.stage("azure_di"):
+                            ocr_output = get_layout_as_markdown(file_path)
+                        get_ledger().mark_ocr_done(content_hash, ocr_output)
+                    metrics.note(markdown_chars=len(ocr_output))
+                    ocr_output = compact_for_prompt(ocr_output)
+                    validated_data = fast_path_extract(file_path, ocr_output)
+                    if validated_data is None:
+                        # Finished with its group below
+                        docs.append((file_path, ocr_output))
+                        pending[file_path] = (doc, content_hash, time.perf_counter() - doc_start)
+                        continue
+                # Simple receipts never reach the packed Gemini request
+                save(file_path, content_hash, validated_data)
+            except Exception as e:
+                fail(file_path, content_hash, e)
+        metrics.finish_document(doc, time.perf_counter() - doc_start)
+
+    for group in pack_documents(docs, max_prompt_tokens):
+        group_start = time.perf_counter()
+        records, group_error = {}, None
+        if len(group) > 1:
+            print(f"📦 Packing {len(group)} receipts into one Gemini request...")
+            try:
+                with STAGE_LIMITS.stage("gemini"), metrics.stage("gemini_packed"):
+                    records = split_batch_response(get_response(build_batch_prompt(group)))
+            except Exception as e:
+                group_error = e
+
+        for file_path, ocr_output in group:
+            doc, content_hash, ocr_seconds = pending[file_path]
+            with metrics.document_scope(doc):
+                try:
+                    if group_error is not None:
+                        raise group_error
+                    record = records.get(Path(file_path).name)
+                    if record is None:
+                        if len(group) > 1:
+                            print(f"↩️ {Path(file_path).name} missing from batch response, "
+                                  "using single-document path.")
+                        validated_data = extract(file_path, ocr_output)
+                    else:
+                        record.pop('file_name', None)
+                        with metrics.stage("validate"):
+                            validated_data = validate_response(file_path, json.dumps(record))
+                    save(file_path, content_hash, validated_data)
+                except Exception as e:
+                    fail(file_path, content_hash, e)
+            metrics.finish_document(doc, ocr_seconds + time.perf_counter() - group_start)
+
+    timings.record("packed_batch", time.perf_counter() - start)
+    return saved
+
+
+def _should_process(file_path):
+    return Path(file_path).is_file() and not Path(file_path).name.startswith('~')
+
+
+def build_prompt(ocr_output, part=None):
+    """
+    Builds the strict JSON extraction prompt for one receipt, or for one
+    window of it when part is (index, count).
+    """
+    part_note = ""
+    if part is not None:
+        part_note = (f"\n    this is part {part[0]} of {part[1]} of the receipt; list only the items in this part, "
+                     f"and use 0 for totals that do not appear in it")
+    return f"""
 # Role: 
     you are an assistant working in the finance department
 # Context:
-    you are given the ocr response from a receipt: {ocr_output}
+    you are given the ocr response from a receipt: {ocr_output}{part_note}
 # Task:
 your job is to identify all the items mentioned in the receipt and their amounts and the total amount
 
@@ -67,9 +520,12 @@ items (list of dicts).
 items must be a list of dicts with fields: item_name (string), item_amount (float).
 """
 
-    # 3. Get LLM Response
-    response = get_response(prompt)
 
+def validate_response(file_path, response):
+    """
+    Parses the LLM response, runs the internal items-sum check and returns the
+    record to save (or a JSON_FAIL / PROCESS_FAIL record).
+    """
     # --- Initialization ---
     validated_data = None 
     
@@ -107,6 +563,7 @@ items must be a list of dicts with fields: item_name (string), item_amount (floa
         
     except json.JSONDecodeError as e:
         print(f"❌ WARNING: Failed to decode response as JSON. Error: {e}")
+        metrics.increment("failures")
         validated_data = {
             'file_name': Path(file_path).name,
             'total_amount_before_tax': 'JSON_FAIL',
@@ -116,6 +573,7 @@ items must be a list of dicts with fields: item_name (string), item_amount (floa
         }
     except Exception as e:
          print(f"❌ WARNING: An error occurred during processing: {e}")
+         metrics.increment("failures")
          validated_data = {
             'file_name': Path(file_path).name,
             'total_amount_before_tax': 'PROCESS_FAIL',
@@ -124,52 +582,124 @@ items must be a list of dicts with fields: item_name (string), item_amount (floa
             'error_details': str(e)
         }
 
+    return validated_data
+
 
-    # --- File Saving Logic (.JSON) ---
-    output_folder = "agent_outputs"
-    file_name_only = Path(file_path).stem 
-    json_save_path = os.path.join(output_folder, f"{file_name_only}.json")
+def save_result(file_path, validated_data, content_hash=None):
+    """
+    Records the validated result in the results store, marks the job saved
+    in the ledger and, unless EXPORT_JSON=0, also writes
+    agent_outputs/<stem>.json for compatibility.
+    """
+    if not validated_data:
+        return
 
-    if validated_data:
+    # --- Results Store ---
+    if content_hash is None:
         try:
-            # Save the structured data as a .JSON file (which the UI now reads)
-            with open(json_save_path, "w", encoding="utf-8") as json_file:
-                json.dump(validated_data, json_file, indent=4) 
+            content_hash = file_sha256(file_path)
+        except OSError:
+            content_hash = None
+    try:
+        get_store().save(validated_data, content_hash=content_hash)
+        print(f"✅ Saved result for {validated_data['file_name']} to the results store.")
+    except Exception as e:
+        print(f"❌ Error saving result to the results store: {e}")
+        raise
+
+    if os.getenv("EXPORT_JSON", "1") != "0":
+        # --- File Saving Logic (.JSON) ---
+        output_folder = OUTPUT_FOLDER
+        file_name_only = Path(file_path).stem 
+        json_save_path = os.path.join(output_folder, f"{file_name_only}.json")
+
+        try:
+            # Save the structured data as a .JSON file (optional per-file export)
+            write_json_atomic(json_save_path, validated_data)
             print(f"✅ Successfully saved structured JSON data to: {json_save_path}")
         except Exception as e:
             print(f"❌ Error saving JSON file {json_save_path}: {e}")
-            
-    
+            raise
+
+    if content_hash is not None:
+        get_ledger().mark_saved(content_hash, file_path)
+
+
+def write_json_atomic(path, data):
+    """
+    Writes JSON to a temporary file in the same folder and renames it over
+    path, so readers never see a half-written file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
 
 # ==============================================================================
 # 3. MAIN EXECUTION BLOCK (Watchdog Monitoring)
 # ==============================================================================
 
 # 1. Define the handler class that watches for new files
-class NewFileHandler(FileSystemEventHandler):
-    
-    # We use on_modified for reliable file drop detection
-    def on_modified(self, event):
-        if not event.is_directory and event.src_path.lower().endswith('.jpg'):
-            # Pause to ensure the file is completely written before reading
-            time.sleep(0.5) 
-            agent(event.src_path)
+class NewFileHandler(DebouncedFileHandler):
+    """
+    Waits until a dropped file has settled (see watcher.py), then only
+    enqueues it; the worker pool does the OCR + LLM work.
+    """
+    def __init__(self, pool):
+        super().__init__(on_ready=pool.submit, is_known=is_saved_or_running)
 
-if __name__ == "__main__":
-    
-    image_directory = "img" 
+
+def is_saved_or_running(content_hash):
+    """
+    True when the ledger has this content saved or mid-run; a failed job is
+    not, so dropping the same file again retries it.
+    """
+    job = get_ledger().get(content_hash)
+    return job is not None and job["state"] != FAILED
+
+
+def watch(image_directory="img"):
+    """
+    Real-time mode: process every file dropped into image_directory.
+    """
     os.makedirs(image_directory, exist_ok=True)
     
     print(f"⭐ Starting real-time file monitor on folder: {image_directory}...")
     print("⭐ Press Ctrl+C to stop monitoring.")
 
+    metrics.start_metrics_server()
+
+    # Start the worker pool before the observer so no event is lost
+    pool = WorkerPool(agent).start()
+    print(f"⭐ Stage limits: {STAGE_LIMITS.limits}")
+
     # Set up the watchdog observer
     path = image_directory
-    event_handler = NewFileHandler()
+    event_handler = NewFileHandler(pool).start()
+    from watchdog.observers import Observer
+
     observer = Observer()
     
     observer.schedule(event_handler, path, recursive=False)
     observer.start()
+
+    # Catch up on files dropped while the agent was down or interrupted
+    pending = reconcile(image_directory)
+    if pending:
+        print(f"🔁 Reconciliation: queuing {len(pending)} unfinished file(s) from {image_directory}.")
+    for file_path in pending:
+        pool.submit(file_path)
     
     try:
         while True:
@@ -178,4 +708,362 @@ if __name__ == "__main__":
         observer.stop()
         print("\nMonitor stopped by user.")
         
-    observer.join()
\ No newline at end of file
+    observer.join()
+    event_handler.stop()
+
+    # Graceful drain: finish everything already queued. A second Ctrl+C aborts.
+    try:
+        pool.shutdown(wait=True)
+        print("✅ All queued files processed.")
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False)
+        print("\n⚠️ Drain aborted, pending files were not processed.")
+    finally:
+        close_clients()
+
+
+# ==============================================================================
+# 4. BATCH / BACKFILL MODE
+# ==============================================================================
+
+def collect_files(source):
+    """
+    Expands a directory or a glob pattern into the list of supported input files.
+    """
+    if os.path.isdir(source):
+        paths = (os.path.join(source, name) for name in sorted(os.listdir(source)))
+    else:
+        paths = sorted(glob.glob(source, recursive=True))
+    return [p for p in paths if os.path.isfile(p) and is_supported(p)]
+
+
+def is_up_to_date(file_path):
+    """
+    True when the results store (or the exported JSON) holds a result that is
+    newer than the input file.
+    """
+    try:
+        input_mtime = os.path.getmtime(file_path)
+    except OSError:
+        return False
+    record = get_store().get(Path(file_path).name)
+    if record is not None:
+        return record['processed_at'] >= input_mtime
+    json_path = Path(OUTPUT_FOLDER) / f"{Path(file_path).stem}.json"
+    try:
+        return os.path.getmtime(json_path) >= input_mtime
+    except OSError:
+        return False
+
+
+def reconcile(folder):
+    """
+    Startup scan: returns the files in folder that have no saved result,
+    i.e. dropped while the agent was down or interrupted mid-run. Jobs that
+    already failed MAX_RECONCILE_ATTEMPTS times are left to `replay`.
+    """
+    ledger, store = get_ledger(), get_store()
+    pending = []
+    for file_path in collect_files(folder):
+        try:
+            content_hash = file_sha256(file_path)
+        except OSError:
+            continue
+        job = ledger.get(content_hash)
+        if job is None and store.get_by_hash(content_hash) is not None:
+            # Processed before the ledger existed
+            ledger.mark_saved(content_hash, file_path)
+            continue
+        if job is not None and (job["state"] == SAVED or
+                                (job["state"] == FAILED and job["attempts"] >= MAX_RECONCILE_ATTEMPTS)):
+            continue
+        pending.append(file_path)
+    return pending
+
+
+class BatchTally:
+    """
+    Counts, across worker threads, the documents that saved a result and
+    those that did not (errors, dead letters, skipped files).
+    """
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def add(self, succeeded, failed):
+        with self._lock:
+            self.succeeded += succeeded
+            self.failed += failed
+
+    def counting(self, handler):
+        """
+        Wraps a one-document handler that returns the saved record or None.
+        """
+        def run(file_path):
+            result = None
+            try:
+                result = handler(file_path)
+                return result
+            finally:
+                self.add(int(result is not None), int(result is None))
+        return run
+
+
+def print_summary(tally, elapsed):
+    # Only saved documents count towards throughput
+    print("="*60)
+    print(f"📊 Batch summary: {tally.succeeded} document(s) saved, {tally.failed} failed, in {elapsed:.1f}s "
+          f"({tally.succeeded / elapsed if elapsed else 0.0:.2f} docs/sec)")
+    counts = metrics.counters.snapshot()
+    fast, llm = counts.get("path_fast", 0), counts.get("path_llm", 0)
+    if fast + llm:
+        print(f"   Extraction paths: fast {fast} ({fast / (fast + llm):.0%}), "
+              f"Gemini {llm} ({llm / (fast + llm):.0%})")
+    for stage, stats in timings.summary().items():
+        print(f"   {stage:<14} n={stats['count']:<6} p50={stats['p50']:.2f}s  "
+              f"p95={stats['p95']:.2f}s  p99={stats['p99']:.2f}s")
+
+
+def batch(source, workers=None, skip_existing=False, use_async=False, pack=False, pack_tokens=None):
+    """
+    Backfill mode: process every supported file in a directory or glob with
+    parallel workers, then print a throughput summary. With pack=True each
+    worker takes a chunk of files and extracts several receipts per Gemini call.
+    """
+    files = collect_files(source)
+    if skip_existing:
+        pending = [f for f in files if not is_up_to_date(f)]
+        print(f"⏭️ Skipping {len(files) - len(pending)} file(s) with up-to-date output.")
+        files = pending
+    print(f"⭐ Batch processing {len(files)} file(s) from: {source}")
+    if not files:
+        return
+
+    metrics.start_metrics_server()
+    start = time.perf_counter()
+    tally = BatchTally()
+    try:
+        if use_async:
+            results = asyncio.run(run_async_batch(files, concurrency=workers))
+            succeeded = sum(1 for r in results if r is not None)
+            tally.add(succeeded, len(results) - succeeded)
+        else:
+            if pack:
+                chunk = int(os.getenv("PACK_MAX_DOCS", DEFAULT_PACK_MAX_DOCS))
+                items = [files[i:i + chunk] for i in range(0, len(files), chunk)]
+
+                def handler(paths):
+                    saved = []
+                    try:
+                        saved = agent_packed(paths, max_prompt_tokens=pack_tokens)
+                    finally:
+                        tally.add(len(saved), len(paths) - len(saved))
+            else:
+                items, handler = files, tally.counting(agent)
+            pool = WorkerPool(handler, workers=workers).start()
+            try:
+                for item in items:
+                    pool.submit(item)
+                pool.shutdown(wait=True)
+            except KeyboardInterrupt:
+                pool.shutdown(wait=False)
+                print("\n⚠️ Batch interrupted, remaining files were not processed.")
+    finally:
+        close_clients()
+        print_summary(tally, time.perf_counter() - start)
+
+
+def replay(workers=None):
+    """
+    Reprocesses every document in the dead-letter queue. An entry is removed
+    once its document is saved; documents that exhaust their retries again,
+    or are not reached before an interruption, stay in the queue.
+    """
+    dlq = get_dead_letter_queue()
+    entries = dlq.latest()
+    files = [e["file_path"] for e in entries if os.path.isfile(e["file_path"])]
+    missing = [e["file_path"] for e in entries if e["file_path"] not in files]
+    for file_path in missing:
+        dlq.remove(file_path)
+    if missing:
+        print(f"⚠️ Dropped {len(missing)} dead-letter entr{'y' if len(missing) == 1 else 'ies'} "
+              "whose file no longer exists.")
+    print(f"⭐ Replaying {len(files)} dead-lettered file(s).")
+    if not files:
+        return
+
+    def replay_one(file_path):
+        result = agent(file_path)
+        if result is not None:
+            dlq.remove(file_path)
+        return result
+
+    start = time.perf_counter()
+    tally = BatchTally()
+    pool = WorkerPool(tally.counting(replay_one), workers=workers).start()
+    try:
+        for file_path in files:
+            pool.submit(file_path)
+        pool.shutdown(wait=True)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False)
+        print("\n⚠️ Replay interrupted, remaining files stay in the dead-letter queue.")
+    finally:
+        close_clients()
+        print_summary(tally, time.perf_counter() - start)
+        remaining = len(dlq.latest())
+        if remaining:
+            print(f"☠️ {remaining} file(s) are still in the dead-letter queue.")
+
+
+# ==============================================================================
+# 5. DISTRIBUTED MODE (coordinator + queue workers)
+# ==============================================================================
+
+def coordinate(image_directory="img", status_interval=30.0):
+    """
+    Coordinator: watches image_directory like watch(), but only publishes the
+    settled files to the shared work queue. `python agent.py worker`
+    processes do the OCR + LLM work: on this host directly, on other hosts
+    through the queue served when WORK_QUEUE_PORT is set.
+    """
+    os.makedirs(image_directory, exist_ok=True)
+    # The coordinator owns the SQLite queue; remote workers reach it through serve_queue()
+    work_queue = WorkQueue()
+    print(f"⭐ Coordinator publishing files from {image_directory} to {work_queue.db_path}")
+    print("⭐ Press Ctrl+C to stop.")
+
+    def store_remote_result(job, result):
+        # Results computed on other hosts are saved here, under the original file name
+        save_result(job["file_path"], result, content_hash=job["content_hash"])
+
+    server = serve_queue(work_queue, on_complete=store_remote_result)
+
+    def publish(file_path):
+        try:
+            if work_queue.publish(file_path):
+                print(f"📬 Queued {Path(file_path).name}")
+        except OSError as e:
+            print(f"❌ Could not queue {file_path}: {e}")
+        return True
+
+    event_handler = DebouncedFileHandler(on_ready=publish).start()
+    from watchdog.observers import Observer
+
+    observer = Observer()
+    observer.schedule(event_handler, image_directory, recursive=False)
+    observer.start()
+
+    # Files dropped while nothing was running
+    for file_path in reconcile(image_directory):
+        publish(file_path)
+
+    last_counts, last_report = None, 0.0
+    try:
+        while True:
+            time.sleep(1)
+            if time.monotonic() - last_report >= status_interval:
+                counts = work_queue.counts()
+                if counts != last_counts:
+                    print(f"📊 Queue: {counts}")
+                last_counts, last_report = counts, time.monotonic()
+    except KeyboardInterrupt:
+        print("\nCoordinator stopped by user.")
+    finally:
+        observer.stop()
+        observer.join()
+        event_handler.stop()
+        if server is not None:
+            server.shutdown()
+
+
+def work(workers=None, lease_seconds=None, exit_when_idle=False):
+    """
+    Queue worker: leases jobs from the shared work queue (the coordinator's
+    served queue when WORK_QUEUE_URL is set) and runs agent() on them until
+    stopped. Start more of these, on any host, at any time to add capacity.
+    """
+    metrics.start_metrics_server()
+    start = time.perf_counter()
+    tally = BatchTally()
+    worker = QueueWorker(tally.counting(agent), get_work_queue(), workers=workers, lease_seconds=lease_seconds,
+                         exit_when_idle=exit_when_idle).start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        print("\n⏳ Finishing the running jobs (Ctrl+C again hands them back)...")
+        try:
+            worker.stop(wait=True)
+        except KeyboardInterrupt:
+            worker.stop(wait=False)
+            print("⚠️ Running jobs were handed back to the queue.")
+    finally:
+        close_clients()
+        print_summary(tally, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Finance AI agent: OCR + LLM invoice extraction.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    watch_parser = subparsers.add_parser("watch", help="Monitor a folder for new invoices (default).")
+    watch_parser.add_argument("directory", nargs="?", default="img")
+
+    batch_parser = subparsers.add_parser("batch", help="Process an existing directory or glob.")
+    batch_parser.add_argument("source", help="Directory or glob pattern, e.g. 'img_processed/*.jpg'")
+    batch_parser.add_argument("--workers", type=int, default=None,
+                              help="Parallel workers (default: AGENT_WORKERS)")
+    batch_parser.add_argument("--skip-existing", action="store_true",
+                              help="Skip files whose output JSON is newer than the input")
+    batch_parser.add_argument("--async", dest="use_async", action="store_true",
+                              help="Use the asyncio pipeline instead of worker threads")
+    batch_parser.add_argument("--pack", action="store_true",
+                              help="Extract several receipts per Gemini call")
+    batch_parser.add_argument("--pack-tokens", type=int, default=None,
+                              help="Prompt token budget per packed request (default: PACK_MAX_PROMPT_TOKENS)")
+
+    replay_parser = subparsers.add_parser("replay", help="Retry documents from the dead-letter queue.")
+    replay_parser.add_argument("--workers", type=int, default=None,
+                               help="Parallel workers (default: AGENT_WORKERS)")
+
+    coordinator_parser = subparsers.add_parser(
+        "coordinator", help="Watch a folder and publish its files to the shared work queue.")
+    coordinator_parser.add_argument("directory", nargs="?", default="img")
+
+    worker_parser = subparsers.add_parser("worker", help="Process jobs from the shared work queue.")
+    worker_parser.add_argument("--workers", type=int, default=None,
+                               help="Parallel workers in this process (default: QUEUE_WORKERS)")
+    worker_parser.add_argument("--lease", type=float, default=None,
+                               help="Lease length in seconds (default: WORK_QUEUE_LEASE_SECONDS)")
+    worker_parser.add_argument("--exit-when-idle", action="store_true",
+                               help="Exit once the queue is empty instead of waiting for more jobs")
+
+    args = parser.parse_args(argv)
+
+    # Startup work that used to happen on import: .env, the output folder,
+    # and the stage limits, which read their caps from .env
+    global STAGE_LIMITS
+    load_environment()
+    os.makedirs(Path(OUTPUT_FOLDER), exist_ok=True)
+    STAGE_LIMITS = StageLimits()
+    setup_logging()
+    try:
+        if args.command == "batch":
+            batch(args.source, workers=args.workers, skip_existing=args.skip_existing,
+                  use_async=args.use_async, pack=args.pack, pack_tokens=args.pack_tokens)
+        elif args.command == "replay":
+            replay(workers=args.workers)
+        elif args.command == "coordinator":
+            coordinate(args.directory)
+        elif args.command == "worker":
+            work(workers=args.workers, lease_seconds=args.lease, exit_when_idle=args.exit_when_idle)
+        else:
+            watch(getattr(args, "directory", "img"))
+    finally:
+        get_preprocessor().shutdown()
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import json
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+
+# --- Configuration ---
+UNKNOWN_VENDOR = "Unknown"
+VENDOR_FIELDS = ("vendor_name", "vendor", "merchant_name")
+
+
+def _amount(value):
+    if isinstance(value, bool):
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _vendor_of(data):
+    for field in VENDOR_FIELDS:
+        value = data.get(field)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return UNKNOWN_VENDOR
+
+
+def _day_of(timestamp):
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+class SpendingAggregates:
+    """
+    Running spending totals over the results store, updated one row at a time
+    as results land. Nothing is ever recomputed from the full set: a row that
+    replaces an earlier result for the same file first takes the old
+    contribution back out.
+
+    Alongside the running sums, every contribution is appended to typed
+    columns (processed_at, before tax, after tax, passed), which frame()
+    hands to pandas without copying for ad-hoc re-bucketing.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self.count = 0
+        self.total_before_tax = 0.0
+        self.total_after_tax = 0.0
+        self.by_status = Counter()
+        self.by_day = defaultdict(float)
+        self.by_vendor = defaultdict(float)
+        self.item_counts = Counter()
+        self.item_amounts = defaultdict(float)
+        # file name -> (column slot, contribution) of its current result
+        self._current = {}
+        self._processed_at = array("d")
+        self._before = array("d")
+        self._after = array("d")
+        self._passed = array("b")
+        self._live = array("b")
+        self._vendors = []
+
+    @staticmethod
+    def _contribution(row):
+        try:
+            data = json.loads(row["data"])
+        except (json.JSONDecodeError, TypeError):
+            data = {}
+        items = []
+        for item in data.get("items") or []:
+            if isinstance(item, dict) and item.get("item_name"):
+                items.append((str(item["item_name"]).strip(), _amount(item.get("item_amount"))))
+        return {
+            "processed_at": row["processed_at"],
+            "day": _day_of(row["processed_at"]),
+            "vendor": _vendor_of(data),
+            "before": _amount(row["total_before_tax"]),
+            "after": _amount(row["total_after_tax"]),
+            "status": row["check_status"],
+            "items": items,
+        }
+
+    def _apply(self, c, sign):
+        self.count += sign
+        self.total_before_tax += sign * c["before"]
+        self.total_after_tax += sign * c["after"]
+        self.by_status[c["status"]] += sign
+        self.by_day[c["day"]] += sign * c["after"]
+        self.by_vendor[c["vendor"]] += sign * c["after"]
+        for name, amount in c["items"]:
+            self.item_counts[name] += sign
+            self.item_amounts[name] += sign * amount
+            if self.item_counts[name] <= 0:
+                del self.item_counts[name]
+                del self.item_amounts[name]
+
+    def add(self, row):
+        """
+        Folds one results store row (as returned by changes_since) into the
+        aggregates. Costs time proportional to the row's items only.
+        """
+        c = self._contribution(row)
+        with self._lock:
+            previous = self._current.get(row["file_name"])
+            if previous is not None:
+                slot, old = previous
+                self._apply(old, -1)
+                self._live[slot] = 0
+            self._apply(c, +1)
+            self._current[row["file_name"]] = (len(self._live), c)
+            self._processed_at.append(c["processed_at"])
+            self._before.append(c["before"])
+            self._after.append(c["after"])
+            self._passed.append(1 if c["status"] == "passed" else 0)
+            self._live.append(1)
+            self._vendors.append(c["vendor"])
+            self.version += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            checked = self.by_status["passed"] + self.by_status["failed"]
+            return {
+                "count": self.count,
+                "total_before_tax": round(self.total_before_tax, 2),
+                "total_after_tax": round(self.total_after_tax, 2),
+                "by_status": {s: n for s, n in self.by_status.items() if n},
+                "pass_rate": self.by_status["passed"] / checked if checked else None,
+            }
+
+    def daily_window(self, days, end=None) -> list:
+        """
+        (day, spent that day, cumulative spend) for the `days` calendar days
+        ending at `end` (default: today). Costs O(days), whatever the number
+        of results: the cumulative start is the grand total minus the window.
+        """
+        end = time.time() if end is None else end
+        labels = [_day_of(end - 86400 * offset) for offset in range(days - 1, -1, -1)]
+        with self._lock:
+            daily = [self.by_day.get(day, 0.0) for day in labels]
+            running = self.total_after_tax - sum(daily)
+        window = []
+        for day, spent in zip(labels, daily):
+            running += spent
+            window.append((day, spent, running))
+        return window
+
+    def top_vendors(self, n=5) -> list:
+        with self._lock:
+            return sorted(self.by_vendor.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+    def top_items(self, n=5) -> list:
+        """
+        (item name, times seen, total amount) for the most frequent items.
+        """
+        with self._lock:
+            return [(name, count, round(self.item_amounts[name], 2))
+                    for name, count in self.item_counts.most_common(n)]
+
+    def frame(self):
+        """
+        The current results as a pandas DataFrame (one row per file), built
+        from the typed columns, for re-bucketing that the running sums do not
+        cover. Needs numpy and pandas.
+        """
+        import numpy as np
+        import pandas as pd
+
+        with self._lock:
+            live = np.frombuffer(self._live, dtype=np.int8).astype(bool)
+            frame = pd.DataFrame({
+                "processed_at": pd.to_datetime(np.frombuffer(self._processed_at)[live], unit="s"),
+                "total_before_tax": np.frombuffer(self._before)[live],
+                "total_after_tax": np.frombuffer(self._after)[live],
+                "passed": np.frombuffer(self._passed, dtype=np.int8)[live].astype(bool),
+                "vendor": np.asarray(self._vendors, dtype=object)[live],
+            })
+        return frame
+
+    def rebucket(self, freq="W", by=None):
+        """
+        Spending and pass rate per `freq` period (any pandas offset alias, e.g.
+        "h", "D", "W", "MS"), optionally split by "vendor".
+        """
+        frame = self.frame().set_index("processed_at")
+        keys = [frame.index.to_period(freq)] + ([by] if by else [])
+        return frame.groupby(keys).agg(
+            invoices=("total_after_tax", "size"),
+            total_before_tax=("total_before_tax", "sum"),
+            total_after_tax=("total_after_tax", "sum"),
+            pass_rate=("passed", "mean"),
+        )
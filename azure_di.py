@@ -1,59 +1,287 @@
+import asyncio
+import contextvars
 import os
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from clients import get_async_document_intelligence_client, get_document_intelligence_client
+from ocr_cache import OCRCache, file_sha256
+from preprocess import get_preprocessor
+import pdf_pages
+from compaction import render_structured, structured_enabled
+from rate_limit import get_limiter
+import metrics
 
-# Load environment variables from .env file
-load_dotenv()
+# 1️⃣ Azure Document Intelligence credentials are read from .env by clients.py,
+# when the first client is created
 
-# 1️⃣ Get Azure Document Intelligence credentials from .env
+MODEL_ID = "prebuilt-layout"
+OUTPUT_FORMAT = "markdown"
 
+# Long PDFs are analyzed as page ranges in parallel and merged in order
+DEFAULT_PDF_PAGES_PER_RANGE = 10
+DEFAULT_PDF_RANGE_CONCURRENCY = 4
+PAGE_BREAK = "\n\n<!-- PageBreak -->\n\n"
 
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
 
-def get_layout_as_markdown(document_path: str) -> str:
+
+def get_ocr_cache() -> OCRCache:
+    """
+    Returns the shared on-disk OCR cache, creating it on first use.
+    """
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = OCRCache()
+            metrics.register_collector("ocr_cache", _ocr_cache.stats)
+    return _ocr_cache
+
+
+def get_layout_as_markdown(document_path: str, endpoint=None, key=None) -> str:
     """
     Analyzes a document (PDF or image) using the 'prebuilt-layout' model
     and returns the full content as a single Markdown string.
+    Results are cached by document content, so a repeated file skips the network call.
+    endpoint / key override AZURE_DI_ENDPOINT / AZURE_DI_KEY.
+    """
+    cache, cache_key, cached = _lookup_cache(document_path)
+    if cached is not None:
+        return cached
+
+    # 2️⃣ Get the shared, connection-pooled client (credentials are validated there)
+    client = get_document_intelligence_client(endpoint, key)
+
+    print(f"Analyzing document: {document_path}...")
+
+    ranges = _page_ranges(document_path)
+    if ranges:
+        markdown = _analyze_ranges(client, document_path, ranges, cache, cache_key)
+        cache.put(cache_key, markdown)
+        return markdown
+
+    # Optionally shrink the image first (PREPROCESS_ENABLED=1)
+    preprocessor = get_preprocessor()
+    upload_path = preprocessor.prepare(document_path)
+    try:
+        # Throttled and retried on 429/5xx; raises RetriesExhausted when it gives up
+        content = get_limiter("azure_di").call(_analyze, client, upload_path)
+    finally:
+        preprocessor.cleanup(upload_path, document_path)
+
+    # 4️⃣ The content is a single string containing the Markdown
+    return _store_result(cache, cache_key, content)
+
+
+async def aget_layout_as_markdown(document_path: str, endpoint=None, key=None) -> str:
+    """
+    Async variant of get_layout_as_markdown() built on the aio client.
+    The long-running operation is awaited, so no thread is blocked while polling.
+    """
+    # Hashing and cache reads are file I/O, keep them off the event loop
+    cache, cache_key, cached = await asyncio.to_thread(_lookup_cache, document_path)
+    if cached is not None:
+        return cached
+
+    client = get_async_document_intelligence_client(endpoint, key)
+
+    print(f"Analyzing document (async): {document_path}...")
+
+    ranges = await asyncio.to_thread(_page_ranges, document_path)
+    if ranges:
+        markdown = await _aanalyze_ranges(client, document_path, ranges, cache, cache_key)
+        await asyncio.to_thread(cache.put, cache_key, markdown)
+        return markdown
+
+    preprocessor = get_preprocessor()
+    upload_path = await preprocessor.aprepare(document_path)
+    try:
+        content = await get_limiter("azure_di").acall(_aanalyze, client, upload_path)
+    finally:
+        preprocessor.cleanup(upload_path, document_path)
+
+    return await asyncio.to_thread(_store_result, cache, cache_key, content)
+
+
+def analyze_document(document_path: str) -> str:
+    """
+    One uncached analysis of the file as-is, returning its markdown.
+    Used by the benchmarks to compare uploads.
+    """
+    client = get_document_intelligence_client()
+    return get_limiter("azure_di").call(_analyze, client, document_path)
+
+
+def _analyze(client, document_path: str):
+    """
+    One upload + poll attempt, returning the OCR text. The file is streamed
+    from disk and reopened on every retry. Only the text is kept: the full
+    AnalyzeResult (words, polygons, spans for every page) is dropped as soon
+    as the text has been taken from it.
+    """
+    with open(document_path, "rb") as f:
+        # 3️⃣ Use 'prebuilt-layout' and request 'markdown' output
+        with metrics.stage("di_upload"):
+            poller = client.begin_analyze_document(
+                MODEL_ID,                     # <-- Change 1: Use layout model
+                body=f,
+                output_content_format=OUTPUT_FORMAT  # <-- Change 2: Request markdown
+            )
+        with metrics.stage("di_poll"):
+            return _content_of(poller.result())
+
+
+async def _aanalyze(client, document_path: str):
+    with open(document_path, "rb") as f:
+        with metrics.stage("di_upload"):
+            poller = await client.begin_analyze_document(
+                MODEL_ID,
+                body=f,
+                output_content_format=OUTPUT_FORMAT
+            )
+        with metrics.stage("di_poll"):
+            return _content_of(await poller.result())
+
+
+# --- Page-range splitting for long PDFs ---
+def _page_ranges(document_path: str):
+    """
+    Page ranges to analyze separately, or [] to send the document as one request.
+    Splitting needs pypdf: without it each range would re-upload the whole
+    file with pages=, which costs more than the single request it replaces.
     """
-    endpoint = os.getenv("AZURE_DI_ENDPOINT")
-    key = os.getenv("AZURE_DI_KEY")
+    if Path(document_path).suffix.lower() != ".pdf" or not pdf_pages.can_split():
+        return []
+    per_range = int(os.getenv("PDF_PAGES_PER_RANGE", DEFAULT_PDF_PAGES_PER_RANGE))
+    if per_range <= 0:
+        return []
+    page_count = pdf_pages.count_pages(document_path)
+    if page_count <= per_range:
+        return []
+    metrics.note(pdf_pages=page_count)
+    return pdf_pages.page_ranges(page_count, per_range)
 
-    # 2️⃣ Validate environment variables
-    if not endpoint or not key:
-        raise ValueError(
-            "❌ Missing Azure credentials. "
-            "Please set AZURE_ENDPOINT and AZURE_KEY in your .env file"
-        )
 
-    # 3️⃣ Initialize Azure Document Intelligence client
-    client = DocumentIntelligenceClient(endpoint, AzureKeyCredential(key))
+def _range_cache_key(cache: OCRCache, cache_key: str, first: int, last: int) -> str:
+    # Finished ranges are cached on their own, so a retry only redoes the rest
+    return cache.make_key(cache_key, MODEL_ID, f"pages={first}-{last}")
+
+
+def _analyze_range(client, splitter, first: int, last: int, cache: OCRCache, cache_key: str) -> str:
+    range_key = _range_cache_key(cache, cache_key, first, last)
+    cached = cache.get(range_key)
+    if cached is not None:
+        return cached
+
+    # Upload only these pages
+    part_path = splitter.write_range(first, last)
+    try:
+        content = get_limiter("azure_di").call(_analyze, client, part_path)
+    finally:
+        os.remove(part_path)
+    cache.put(range_key, content)
+    return content
+
+
+def _analyze_ranges(client, document_path: str, ranges, cache: OCRCache, cache_key: str) -> str:
+    concurrency = int(os.getenv("PDF_RANGE_CONCURRENCY", DEFAULT_PDF_RANGE_CONCURRENCY))
+    print(f"📄 Splitting {Path(document_path).name} into {len(ranges)} page range(s), "
+          f"{min(concurrency, len(ranges))} at a time...")
+    # One parsed PDF shared by every range, rather than one per range
+    with pdf_pages.PdfSplitter(document_path) as splitter, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="di-range") as executor:
+        # Each range runs in a copy of this context so its stages count towards the document
+        futures = [
+            executor.submit(contextvars.copy_context().run, _analyze_range,
+                            client, splitter, first, last, cache, cache_key)
+            for first, last in ranges
+        ]
+        parts = [future.result() for future in futures]
+    return PAGE_BREAK.join(parts)
+
+
+async def _aanalyze_range(client, splitter, first: int, last: int,
+                          cache: OCRCache, cache_key: str, semaphore) -> str:
+    range_key = _range_cache_key(cache, cache_key, first, last)
+    cached = await asyncio.to_thread(cache.get, range_key)
+    if cached is not None:
+        return cached
+
+    async with semaphore:
+        part_path = await asyncio.to_thread(splitter.write_range, first, last)
+        try:
+            content = await get_limiter("azure_di").acall(_aanalyze, client, part_path)
+        finally:
+            os.remove(part_path)
+    await asyncio.to_thread(cache.put, range_key, content)
+    return content
+
+
+async def _aanalyze_ranges(client, document_path: str, ranges, cache: OCRCache, cache_key: str) -> str:
+    concurrency = int(os.getenv("PDF_RANGE_CONCURRENCY", DEFAULT_PDF_RANGE_CONCURRENCY))
+    print(f"📄 Splitting {Path(document_path).name} into {len(ranges)} page range(s) (async)...")
+    semaphore = asyncio.Semaphore(concurrency)
+    splitter = await asyncio.to_thread(pdf_pages.PdfSplitter, document_path)
+    try:
+        parts = await asyncio.gather(*(
+            _aanalyze_range(client, splitter, first, last, cache, cache_key, semaphore)
+            for first, last in ranges
+        ))
+    finally:
+        splitter.close()
+    return PAGE_BREAK.join(parts)
+
+
+def _lookup_cache(document_path: str):
+    """
+    Returns (cache, cache_key, cached_markdown_or_None) for a document.
+    """
     if not os.path.exists(document_path):
         raise FileNotFoundError(f"❌ File not found: {document_path}")
 
-    print(f"Analyzing document: {document_path}...")
+    cache = get_ocr_cache()
+    cache_key = cache.make_key(
+        file_sha256(document_path), MODEL_ID, _output_format() + get_preprocessor().signature()
+    )
+    cached = cache.get(cache_key)
+    if cached is not None:
+        print(f"⚡ OCR cache hit: {document_path} ({cache.stats()})")
+        metrics.increment("ocr_cache_hits")
+    else:
+        metrics.increment("ocr_cache_misses")
+    return cache, cache_key, cached
 
-    with open(document_path, "rb") as f:
-        # 4️⃣ Use 'prebuilt-layout' and request 'markdown' output
-        poller = client.begin_analyze_document(
-            "prebuilt-layout",            # <-- Change 1: Use layout model
-            body=f,
-            output_content_format="markdown"  # <-- Change 2: Request markdown
-        )
-        result = poller.result()
-
-    # 5️⃣ The result.content will be a single string containing the Markdown
-    if result.content:
-        return result.content
+
+def _output_format() -> str:
+    return OUTPUT_FORMAT + ("+structured" if structured_enabled() else "")
+
+
+def _content_of(result) -> str:
+    """
+    The OCR text of a result: DI's markdown, or with OCR_STRUCTURED=1 a
+    rendering of its paragraphs and tables without page headers/footers.
+    """
+    if structured_enabled():
+        return render_structured(result) or result.content or ""
+    return result.content or ""
+
+
+def _store_result(cache: OCRCache, cache_key: str, content: str) -> str:
+    if content:
+        cache.put(cache_key, content)
+        return content
     else:
         return "No content extracted."
 
 
 # --- UPDATED EXECUTION BLOCK ---
 if __name__ == "__main__":
-    
-    # Path to your image (JPG works perfectly fine)
-    doc_path = r"C:\Users\91956\OneDrive\Documents\Azure doc\img\X00016469619.jpg"
-    
+    import sys
+
+    # Usage: python azure_di.py [path/to/receipt.jpg]
+    doc_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("img_processed", "X00016469619.jpg")
+
     try:
         markdown_output = get_layout_as_markdown(doc_path)
         print("\n----- 🦾 Extracted Markdown -----")
@@ -66,4 +294,4 @@ if __name__ == "__main__":
         print(f"\n✅ Markdown content also saved to: {output_md_file}")
 
     except Exception as e:
-        print(f"❌ Error: {e}")
\ No newline at end of file
+        print(f"❌ Error: {e}")
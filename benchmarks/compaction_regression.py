@@ -0,0 +1,112 @@
+"""
+Regression check for OCR compaction: extracts every sample receipt once from
+the raw DI markdown and once from the compacted text, and reports the prompt
+token savings and any document whose totals or item amounts changed.
+
+OCR output comes from the OCR cache when present, so only the first run
+calls Document Intelligence. Gemini responses are persisted in LLM_CACHE_DB,
+which defaults to .cache/llm.db here (the pipeline itself keeps them in
+memory only), so reruns do not call Gemini again either.
+Exits with status 1 when any extraction differs.
+
+Usage:
+    python benchmarks/compaction_regression.py [--images img_processed] [--limit 20] [--tokens-only]
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from agent import build_prompt, validate_response  # noqa: E402
+from azure_di import get_layout_as_markdown  # noqa: E402
+from clients import load_environment  # noqa: E402
+from compaction import compact_markdown, estimate_tokens  # noqa: E402
+from llm_response import get_response  # noqa: E402
+from watcher import is_supported  # noqa: E402
+
+# A value from the environment or .env wins; set before llm_response creates
+# its cache on the first call
+load_environment()
+os.environ.setdefault("LLM_CACHE_DB", str(ROOT / ".cache" / "llm.db"))
+
+
+def extract(file_path, ocr_text):
+    return validate_response(file_path, get_response(build_prompt(ocr_text)))
+
+
+def fingerprint(record):
+    """
+    The parts of a record the regression compares: totals and item amounts.
+    """
+    def amount(value):
+        try:
+            return round(float(value), 2)
+        except (TypeError, ValueError):
+            return value
+
+    items = record.get("items") or []
+    return (
+        amount(record.get("total_amount_before_tax")),
+        amount(record.get("total_amount_after_tax")),
+        tuple(sorted(amount(i.get("item_amount")) for i in items if isinstance(i, dict))),
+    )
+
+
+def item_names(record):
+    return sorted(" ".join(str(i.get("item_name", "")).upper().split())
+                  for i in record.get("items") or [] if isinstance(i, dict))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=str(ROOT / "img_processed"))
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--tokens-only", action="store_true", help="Only report token savings, skip Gemini")
+    args = parser.parse_args(argv)
+
+    files = sorted(p for p in Path(args.images).iterdir() if is_supported(p))
+    files = files[:args.limit] if args.limit else files
+
+    total_before = total_after = 0
+    changed, renamed = [], []
+    print(f"{'document':<28} {'tokens':>7} {'compact':>7} {'saved':>6}  result")
+    for path in files:
+        markdown = get_layout_as_markdown(str(path))
+        compacted = compact_markdown(markdown)
+        before, after = estimate_tokens(markdown), estimate_tokens(compacted)
+        total_before += before
+        total_after += after
+
+        status = ""
+        if not args.tokens_only:
+            raw_record = extract(path, markdown)
+            compact_record = extract(path, compacted)
+            if fingerprint(raw_record) != fingerprint(compact_record):
+                changed.append((path.name, fingerprint(raw_record), fingerprint(compact_record)))
+                status = "CHANGED"
+            elif item_names(raw_record) != item_names(compact_record):
+                renamed.append(path.name)
+                status = "same amounts, item names differ"
+            else:
+                status = "unchanged"
+        print(f"{path.name:<28} {before:>7} {after:>7} {1 - after / before:>6.0%}  {status}")
+
+    print("-" * 70)
+    if total_before:
+        print(f"Total prompt tokens (OCR part): {total_before} -> {total_after} "
+              f"({1 - total_after / total_before:.0%} saved over {len(files)} document(s))")
+    if args.tokens_only:
+        return 0
+    for name, raw, compact in changed:
+        print(f"❌ {name}: raw {raw} != compact {compact}")
+    if renamed:
+        print(f"⚠️ Item names differ (amounts identical) for: {', '.join(renamed)}")
+    print("✅ Extraction unchanged on all documents." if not changed else f"❌ {len(changed)} document(s) changed.")
+    return 1 if changed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
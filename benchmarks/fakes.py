@@ -0,0 +1,242 @@
+"""
+Local stand-ins for the Azure Document Intelligence and Gemini clients, so
+the pipeline can be benchmarked without keys or network access. Installed
+with clients.set_client_overrides().
+
+FakeDocumentIntelligenceClient replays recorded markdown from
+benchmarks/recordings/<stem>.md, or builds a receipt from the saved
+agent_outputs/<stem>.json. FakeGenaiClient replays agent_outputs/<stem>.txt.
+Both take a FakeService that sets latency, jitter and error injection.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+RECORDINGS_DIR = Path(__file__).resolve().parent / "recordings"
+OUTPUTS_DIR = ROOT / "agent_outputs"
+
+# The fake OCR text names its source, so the fake Gemini knows what to replay
+_SOURCE_LINE = "Receipt ref {name}"
+_SOURCE = re.compile(r"Receipt ref (\S+)")
+
+
+class InjectedError(Exception):
+    """
+    Error raised by the fakes, shaped like the SDK errors that rate_limit.py
+    inspects (status_code plus response headers).
+    """
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"injected HTTP {status_code}")
+        self.status_code = status_code
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+
+class FakeService:
+    """
+    Latency model and fault injection for one fake service. Each call sleeps
+    for latency +/- jitter (uniform, never negative). error_rate of the calls
+    fail with a 503 and throttle_rate with a 429 carrying Retry-After.
+    """
+    def __init__(self, latency=1.0, jitter=0.3, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            roll = self._random.random()
+            error = None
+            if roll < self.throttle_rate:
+                error = InjectedError(429, self.retry_after)
+            elif roll < self.throttle_rate + self.error_rate:
+                error = InjectedError(503)
+            if error is not None:
+                self.errors += 1
+        return delay, error
+
+    def wait(self):
+        delay, error = self._draw()
+        time.sleep(delay)
+        if error is not None:
+            raise error
+
+    async def await_(self):
+        delay, error = self._draw()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+
+
+def _load_record(stem):
+    """
+    The saved extraction agent_outputs/<stem>.json, or None.
+    """
+    try:
+        with open(OUTPUTS_DIR / f"{stem}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+# --- Document Intelligence ---
+def _synthesized_markdown(stem):
+    """
+    Receipt-like markdown rebuilt from a saved extraction, for images that
+    have no recording.
+    """
+    record = _load_record(stem)
+    if record is None:
+        return "TAX INVOICE\nITEM 1.00\nTOTAL 1.00"
+    lines = ["# SAMPLE STORE SDN BHD", "CO-REG : 000000-X", "Tel: 03-0000 0000", "TAX INVOICE"]
+    for item in record.get("items", []):
+        amount = item.get("item_amount") or 0
+        lines += [str(item.get("item_name", "ITEM")), f"1 PC * {amount:.2f} {amount:.2f}"]
+    for label, key in (("SUB TOTAL", "total_amount_before_tax"), ("TOTAL", "total_amount_after_tax")):
+        if isinstance(record.get(key), (int, float)):
+            lines.append(f"{label} {record[key]:.2f}")
+    lines += ["THANK YOU. PLEASE COME AGAIN.", "<!-- PageNumber=\"1\" -->"]
+    return "\n".join(lines)
+
+
+def recorded_markdown(name):
+    stem = Path(name).stem
+    recording = RECORDINGS_DIR / f"{stem}.md"
+    if recording.exists():
+        markdown = recording.read_text(encoding="utf-8")
+    else:
+        markdown = _synthesized_markdown(stem)
+    return _SOURCE_LINE.format(name=Path(name).name) + "\n" + markdown
+
+
+class _FakePoller:
+    def __init__(self, service, content):
+        self._service = service
+        self._content = content
+
+    def result(self):
+        self._service.wait()
+        return SimpleNamespace(content=self._content, paragraphs=None, tables=None)
+
+
+class _FakeAsyncPoller(_FakePoller):
+    async def result(self):
+        await self._service.await_()
+        return SimpleNamespace(content=self._content, paragraphs=None, tables=None)
+
+
+class FakeDocumentIntelligenceClient:
+    """
+    begin_analyze_document() reads the whole upload (so upload cost stays
+    realistic), then the poller waits on the latency model.
+    upload_service models the upload, poll_service the analysis.
+    """
+    poller_class = _FakePoller
+
+    def __init__(self, poll_service, upload_service=None):
+        self.poll_service = poll_service
+        self.upload_service = upload_service or FakeService(latency=0.05, jitter=0.02)
+
+    def _content_for(self, body):
+        name = getattr(body, "name", "document")
+        while body.read(1024 * 1024):
+            pass
+        return recorded_markdown(name)
+
+    def begin_analyze_document(self, model_id, body=None, **kwargs):
+        self.upload_service.wait()
+        return self.poller_class(self.poll_service, self._content_for(body))
+
+    def close(self):
+        pass
+
+
+class FakeAsyncDocumentIntelligenceClient(FakeDocumentIntelligenceClient):
+    poller_class = _FakeAsyncPoller
+
+    async def begin_analyze_document(self, model_id, body=None, **kwargs):
+        await self.upload_service.await_()
+        return self.poller_class(self.poll_service, self._content_for(body))
+
+    async def close(self):
+        pass
+
+
+# --- Gemini ---
+def recorded_response(name):
+    """
+    The saved Gemini answer for a receipt, without the ```json fence that the
+    older .txt files carry (JSON mode never returns one). A .txt that is not
+    valid JSON (X00016469619.txt holds merge-conflict markers) is replaced by
+    the answer fields of the saved agent_outputs/<stem>.json.
+    """
+    stem = Path(name).stem
+    try:
+        text = (OUTPUTS_DIR / f"{stem}.txt").read_text(encoding="utf-8").strip()
+        text = re.sub(r"^```(json)?\s*|\s*```$", "", text)
+        json.loads(text)
+        return text
+    except (OSError, json.JSONDecodeError):
+        pass
+    record = _load_record(stem) or {}
+    return json.dumps({
+        "total_amount_before_tax": record.get("total_amount_before_tax", 0.0),
+        "total_amount_after_tax": record.get("total_amount_after_tax", 0.0),
+        "items": record.get("items", []),
+    })
+
+
+def _response_for(prompt):
+    names = _SOURCE.findall(prompt)
+    if len(names) <= 1:
+        text = recorded_response(names[0] if names else "unknown")
+    else:
+        # Packed request: one record per receipt, tagged with its file name
+        records = []
+        for name in names:
+            try:
+                record = json.loads(recorded_response(name))
+            except json.JSONDecodeError:
+                continue
+            record["file_name"] = name
+            records.append(record)
+        text = json.dumps(records)
+    usage = SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+class _FakeModels:
+    def __init__(self, service):
+        self._service = service
+
+    def generate_content(self, model=None, contents=None, config=None):
+        self._service.wait()
+        return _response_for(contents)
+
+
+class _FakeAsyncModels(_FakeModels):
+    async def generate_content(self, model=None, contents=None, config=None):
+        await self._service.await_()
+        return _response_for(contents)
+
+
+class FakeGenaiClient:
+    def __init__(self, service):
+        self.service = service
+        self.models = _FakeModels(service)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(service))
@@ -0,0 +1,177 @@
+"""
+Peak memory against document size: runs agent() on synthetic documents of
+growing size, each in a fresh interpreter, with fake Azure DI and Gemini
+clients. The upload is a file of the given size, and the OCR text grows with
+it (--items-per-mb receipt lines per MB). Peak RSS should stay roughly flat:
+uploads are streamed, only the OCR text of the DI result is kept, and long
+text goes to Gemini in PROMPT_WINDOW_TOKENS windows.
+
+Each run also checks that the windowed extraction found every item once.
+
+Usage:
+    python benchmarks/memory_benchmark.py [--sizes 1,16,64,256] [--items-per-mb 200]
+        [--window-tokens 6000]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+_ITEM = re.compile(r"^ITEM (\d+)$")
+_ITEM_AMOUNT = re.compile(r"^1 PC \* ([\d.]+) ([\d.]+)$")
+_SUBTOTAL = re.compile(r"^SUB TOTAL ([\d.]+)$", re.M)
+_TOTAL = re.compile(r"^TOTAL ([\d.]+)$", re.M)
+
+
+def synthetic_markdown(items):
+    lines = ["# MEMORY BENCHMARK STORE", "TAX INVOICE"]
+    total = 0.0
+    for i in range(items):
+        amount = 1 + i % 50
+        total += amount
+        lines += [f"ITEM {i}", f"1 PC * {amount:.2f} {amount:.2f}"]
+    lines += [f"SUB TOTAL {total:.2f}", f"TOTAL {total:.2f}"]
+    return "\n".join(lines)
+
+
+def window_response(prompt):
+    """
+    What a model would extract from one prompt: the complete item lines in
+    it, and the totals if they are in it.
+    """
+    lines = [line.strip() for line in prompt.splitlines()]
+    items = []
+    for name_line, amount_line in zip(lines, lines[1:]):
+        match = _ITEM_AMOUNT.match(amount_line)
+        if _ITEM.match(name_line) and match:
+            items.append({"item_name": name_line, "item_amount": float(match.group(2))})
+    before, after = _SUBTOTAL.search(prompt), _TOTAL.search(prompt)
+    return json.dumps({
+        "total_amount_before_tax": float(before.group(1)) if before else 0.0,
+        "total_amount_after_tax": float(after.group(1)) if after else 0.0,
+        "items": items,
+    })
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def run_child(size_mb, items_per_mb, window_tokens):
+    from pipeline_benchmark import configure_environment, current_rss_mb
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure_environment(work_dir, SimpleNamespace(fast_path=False, rpm=1_000_000, retry_base_delay=0.1))
+        os.environ["PROMPT_WINDOW_TOKENS"] = str(window_tokens)
+
+        import agent as pipeline
+        from clients import set_client_overrides
+        from fakes import FakeDocumentIntelligenceClient, FakeService
+        from results_store import get_store
+
+        items = max(1, int(size_mb * items_per_mb))
+        markdown = synthetic_markdown(items)
+
+        class SizedDocumentClient(FakeDocumentIntelligenceClient):
+            def _content_for(self, body):
+                while body.read(1024 * 1024):
+                    pass
+                return markdown
+
+        class WindowModels:
+            def generate_content(self, model=None, contents=None, config=None):
+                return SimpleNamespace(text=window_response(contents), usage_metadata=None)
+
+        set_client_overrides(
+            document_intelligence=SizedDocumentClient(FakeService(latency=0.0, jitter=0.0)),
+            genai_client=SimpleNamespace(models=WindowModels()),
+        )
+
+        # A sparse file: large on paper, no disk space used
+        document = Path(work_dir) / "large_document.jpg"
+        with open(document, "wb") as f:
+            f.truncate(int(size_mb * 1024 * 1024))
+
+        baseline = current_rss_mb()
+        start = time.perf_counter()
+        pipeline.agent(str(document))
+        elapsed = time.perf_counter() - start
+
+        record = json.loads(get_store().get(document.name)["data"])
+        return {
+            "size_mb": size_mb,
+            "items": items,
+            "markdown_mb": len(markdown) / 1e6,
+            "extracted_items": len(record.get("items", [])),
+            "check_passed": bool(record.get("internal_check_passed")),
+            "baseline_rss_mb": baseline,
+            "peak_rss_mb": peak_rss_mb(),
+            "seconds": elapsed,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,16,64,256", help="Upload sizes in MB")
+    parser.add_argument("--items-per-mb", type=float, default=200)
+    parser.add_argument("--window-tokens", type=int, default=6000, help="0 sends one prompt per document")
+    parser.add_argument("--child", type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                result = run_child(args.child, args.items_per_mb, args.window_tokens)
+            finally:
+                sys.stdout = stdout
+        print(json.dumps(result))
+        return 0
+
+    print(f"{'upload MB':>9} {'items':>7} {'OCR MB':>7} {'found':>7} {'check':>5} "
+          f"{'base MB':>8} {'peak MB':>8} {'secs':>6}")
+    results, failed = [], False
+    for size in (float(s) for s in args.sizes.split(",")):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", str(size), "--items-per-mb", str(args.items_per_mb),
+             "--window-tokens", str(args.window_tokens)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{size:>9.0f} failed: {proc.stderr.strip().splitlines()[-1:]}")
+            failed = True
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(r)
+        ok = r["extracted_items"] == r["items"] and r["check_passed"]
+        failed = failed or not ok
+        print(f"{r['size_mb']:>9.0f} {r['items']:>7} {r['markdown_mb']:>7.2f} {r['extracted_items']:>7} "
+              f"{'ok' if ok else 'FAIL':>5} {r['baseline_rss_mb'] or 0:>8.0f} {r['peak_rss_mb'] or 0:>8.0f} "
+              f"{r['seconds']:>6.1f}")
+
+    if len(results) >= 2 and results[0]["peak_rss_mb"] and results[-1]["peak_rss_mb"]:
+        growth = results[-1]["peak_rss_mb"] - results[0]["peak_rss_mb"]
+        span = results[-1]["size_mb"] - results[0]["size_mb"]
+        print(f"\nPeak RSS grew {growth:.1f} MB over {span:.0f} MB of upload "
+              f"({growth / span * 1024:.1f} MB per GB).")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Offline pipeline benchmark: drives agent() over the sample receipts with the
+fake Azure DI and Gemini clients from fakes.py, at several concurrency levels,
+and reports throughput, per-stage latency percentiles, retries and memory.
+
+Caches, JSON export and the metrics file are disabled; results go to a
+temporary database, so the working tree is never touched. Each concurrency
+level gets its own job ledger. Throughput counts only documents that saved a
+usable result: an exception, or a JSON_FAIL / PROCESS_FAIL record from an
+unparseable or invalid response, counts as a failure, and the benchmark exits
+non-zero if any document failed.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--concurrency 1,4,8,16] [--docs 100]
+        [--di-latency 1.5 --di-jitter 0.5] [--gemini-latency 2.0 --gemini-jitter 0.8]
+        [--error-rate 0.02] [--throttle-rate 0.01] [--async] [--fast-path]
+        [--save results.json] [--baseline results.json --tolerance 0.1]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+REPORTED_STAGES = ("total", "azure_di", "gemini")
+
+
+def configure_environment(work_dir, args):
+    """
+    Must run before the pipeline modules are imported: several of them read
+    their configuration at import time.
+    """
+    os.environ.update({
+        "OCR_CACHE_ENABLED": "0",
+        "LLM_CACHE_ENABLED": "0",
+        "EXPORT_JSON": "0",
+        "METRICS_JSONL": "",
+        "FAST_PATH": "1" if args.fast_path else "0",
+        "RESULTS_DB": os.path.join(work_dir, "results.db"),
+        "DEAD_LETTER_FILE": os.path.join(work_dir, "dead_letter.jsonl"),
+        "JOBS_DB": os.path.join(work_dir, "jobs.db"),
+        # Keep the client-side limits out of the way unless asked for
+        "AZURE_DI_RPM": str(args.rpm),
+        "GEMINI_RPM": str(args.rpm),
+        "GEMINI_TPM": str(args.rpm * 10000),
+        "RETRY_BASE_DELAY": str(args.retry_base_delay),
+    })
+
+
+def current_rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakMemory:
+    """
+    Samples the resident set size in the background and keeps the maximum.
+    """
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = current_rss_mb()
+            if rss is not None:
+                self.peak = rss if self.peak is None else max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_once(pipeline, files, concurrency, use_async, verbose, work_dir):
+    import metrics
+    from job_ledger import reset_ledger
+    from results_store import check_status
+    from rate_limit import reset_limiters
+    from worker_pool import StageLimits, WorkerPool
+
+    os.environ["AZURE_DI_CONCURRENCY"] = str(concurrency)
+    os.environ["GEMINI_CONCURRENCY"] = str(concurrency)
+    # A fresh ledger per run: checkpoints left by an earlier run would let
+    # documents skip Azure DI
+    os.environ["JOBS_DB"] = os.path.join(work_dir, f"jobs_{concurrency}.db")
+    reset_ledger()
+    pipeline.STAGE_LIMITS = StageLimits()
+    reset_limiters()
+    metrics.timings.reset()
+    metrics.counters.reset()
+
+    outcomes, outcomes_lock = [], threading.Lock()
+
+    def process(file_path):
+        result = None
+        try:
+            result = pipeline.agent(file_path)
+        finally:
+            with outcomes_lock:
+                outcomes.append(result)
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output, PeakMemory() as memory:
+        start = time.perf_counter()
+        if use_async:
+            outcomes = asyncio.run(pipeline.run_async_batch(files, concurrency=concurrency))
+        else:
+            pool = WorkerPool(process, workers=concurrency).start()
+            for file_path in files:
+                pool.submit(file_path)
+            pool.shutdown(wait=True)
+        elapsed = time.perf_counter() - start
+
+    summary = metrics.timings.summary()
+    counters = metrics.counters.snapshot()
+    # Only documents that saved a usable result count towards throughput
+    succeeded = sum(1 for r in outcomes if r is not None and not check_status(r).endswith("_FAIL"))
+    return {
+        "concurrency": concurrency,
+        "docs": succeeded,
+        "errors": len(files) - succeeded,
+        "seconds": elapsed,
+        "docs_per_sec": succeeded / elapsed if elapsed else 0.0,
+        "stages": {s: summary[s] for s in REPORTED_STAGES if s in summary},
+        "retries": counters.get("retries", 0),
+        "dead_lettered": counters.get("dead_lettered", 0),
+        "failures": counters.get("failures", 0),
+        "peak_rss_mb": memory.peak,
+    }
+
+
+def print_results(results):
+    print(f"{'conc':>4} {'docs':>5} {'err':>4} {'wall s':>7} {'docs/s':>7} "
+          f"{'total p50/p95/p99':>20} {'di p95':>7} {'llm p95':>7} {'retry':>5} {'dlq':>4} {'RSS MB':>7}")
+    for r in results:
+        total = r["stages"].get("total", {})
+        di = r["stages"].get("azure_di", {})
+        llm = r["stages"].get("gemini", {})
+        print(f"{r['concurrency']:>4} {r['docs']:>5} {r['errors']:>4} {r['seconds']:>7.1f} {r['docs_per_sec']:>7.2f} "
+              f"{total.get('p50', 0):>6.2f}/{total.get('p95', 0):>5.2f}/{total.get('p99', 0):>5.2f} "
+              f"{di.get('p95', 0):>7.2f} {llm.get('p95', 0):>7.2f} {r['retries']:>5} {r['dead_lettered']:>4} "
+              f"{r['peak_rss_mb'] or 0:>7.0f}")
+
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    """
+    Returns the runs whose throughput fell more than tolerance below the baseline.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["concurrency"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get(r["concurrency"])
+        if base and r["docs_per_sec"] < base["docs_per_sec"] * (1 - tolerance):
+            regressions.append((r["concurrency"], base["docs_per_sec"], r["docs_per_sec"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=str(ROOT / "img_processed"))
+    parser.add_argument("--docs", type=int, default=None, help="Documents per run (cycles through the images)")
+    parser.add_argument("--concurrency", default="1,4,8,16")
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--fast-path", action="store_true", help="Let simple receipts skip Gemini")
+    parser.add_argument("--di-latency", type=float, default=1.5)
+    parser.add_argument("--di-jitter", type=float, default=0.5)
+    parser.add_argument("--gemini-latency", type=float, default=2.0)
+    parser.add_argument("--gemini-jitter", type=float, default=0.8)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of calls failing with 429")
+    parser.add_argument("--retry-base-delay", type=float, default=0.1)
+    parser.add_argument("--rpm", type=int, default=1_000_000, help="Client-side requests/minute limit")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", default=None, help="Write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="Fail if throughput drops below this saved run")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure_environment(work_dir, args)
+
+        import agent as pipeline
+        from clients import set_client_overrides
+        from watcher import is_supported
+        from fakes import (FakeAsyncDocumentIntelligenceClient, FakeDocumentIntelligenceClient,
+                           FakeGenaiClient, FakeService)
+
+        def service(latency, jitter, offset):
+            return FakeService(latency, jitter, args.error_rate, args.throttle_rate, seed=args.seed + offset)
+
+        di_service = service(args.di_latency, args.di_jitter, 0)
+        set_client_overrides(
+            document_intelligence=FakeDocumentIntelligenceClient(di_service),
+            async_document_intelligence=FakeAsyncDocumentIntelligenceClient(di_service),
+            genai_client=FakeGenaiClient(service(args.gemini_latency, args.gemini_jitter, 1)),
+        )
+
+        images = sorted(str(p) for p in Path(args.images).iterdir() if is_supported(p))
+        if not images:
+            print(f"No supported files in {args.images}")
+            return 1
+        count = args.docs or len(images)
+        files = [images[i % len(images)] for i in range(count)]
+
+        print(f"Benchmarking {count} document(s) ({'async' if args.use_async else 'threads'}), "
+              f"DI {args.di_latency}±{args.di_jitter}s, Gemini {args.gemini_latency}±{args.gemini_jitter}s, "
+              f"errors {args.error_rate:.0%}, throttling {args.throttle_rate:.0%}")
+        results = []
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            results.append(run_once(pipeline, files, concurrency, args.use_async, args.verbose, work_dir))
+            print(f"  concurrency {concurrency}: {results[-1]['docs_per_sec']:.2f} docs/s, "
+                  f"{results[-1]['errors']} failed")
+        print()
+        print_results(results)
+
+        set_client_overrides()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nSaved to {args.save}")
+    failed = sum(r["errors"] for r in results)
+    if failed:
+        # A run where documents fail is not a valid measurement
+        print(f"❌ {failed} document(s) did not produce a usable result; rerun with --verbose to see why.")
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        for concurrency, before, after in regressions:
+            print(f"❌ Throughput regression at concurrency {concurrency}: {before:.2f} -> {after:.2f} docs/s")
+        if regressions:
+            return 1
+        print("✅ No throughput regression against the baseline.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Image preprocessing benchmark: upload size and preprocessing time for a grid
+of settings over the sample receipts, and with --ocr the Document
+Intelligence latency and accuracy of each setting against the raw upload.
+
+Accuracy is measured two ways:
+  - similarity: word-level diff ratio against the markdown of the original image
+  - amount recall: share of the totals and item amounts in the saved
+    agent_outputs/<stem>.json that appear in the markdown
+
+Usage:
+    python benchmarks/preprocess_benchmark.py [--images img_processed] [--limit 20] [--ocr]
+"""
+import argparse
+import csv
+import difflib
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from preprocess import IMAGE_EXTENSIONS, ImagePreprocessor, preprocess_image  # noqa: E402
+
+# (label, ImagePreprocessor options)
+CONFIGS = [
+    ("gray-2600-q85", {"max_long_edge": 2600, "quality": 85}),
+    ("gray-2000-q80", {"max_long_edge": 2000, "quality": 80}),
+    ("gray-1600-q75", {"max_long_edge": 1600, "quality": 75}),
+    ("gray-1200-q70", {"max_long_edge": 1200, "quality": 70}),
+    ("nocrop-2000-q80", {"max_long_edge": 2000, "quality": 80, "crop": False}),
+]
+
+
+def words(text):
+    return re.findall(r"\S+", text or "")
+
+
+def similarity(reference, candidate):
+    return difflib.SequenceMatcher(None, words(reference), words(candidate), autojunk=False).ratio()
+
+
+def expected_amounts(stem):
+    """
+    Amounts from a previously saved extraction, formatted as they print on receipts.
+    """
+    path = ROOT / "agent_outputs" / f"{stem}.json"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return []
+    values = [record.get("total_amount_after_tax")]
+    values += [item.get("item_amount") for item in record.get("items", []) if isinstance(item, dict)]
+    return [f"{v:.2f}" for v in values if isinstance(v, (int, float)) and v > 0]
+
+
+def amount_recall(stem, markdown):
+    amounts = expected_amounts(stem)
+    if not amounts:
+        return None
+    text = (markdown or "").replace(",", "")
+    return sum(1 for a in amounts if a in text) / len(amounts)
+
+
+def timed_ocr(path):
+    from azure_di import analyze_document
+    start = time.perf_counter()
+    markdown = analyze_document(str(path))
+    return markdown, time.perf_counter() - start
+
+
+def mean(values):
+    values = [v for v in values if v is not None]
+    return statistics.mean(values) if values else None
+
+
+def fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=str(ROOT / "img_processed"))
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N images")
+    parser.add_argument("--ocr", action="store_true", help="Also call Document Intelligence (uses quota)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--csv", default=None, help="Write per-image rows to this CSV file")
+    args = parser.parse_args(argv)
+
+    images = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    images = images[:args.limit] if args.limit else images
+    if not images:
+        print(f"No images found in {args.images}")
+        return
+    print(f"Benchmarking {len(images)} image(s) from {args.images}")
+
+    reference = {}
+    if args.ocr:
+        for path in images:
+            reference[path] = timed_ocr(path)
+
+    rows = []
+    summary = []
+    with tempfile.TemporaryDirectory() as work_dir, ProcessPoolExecutor(args.workers) as pool:
+        for label, overrides in CONFIGS:
+            options = ImagePreprocessor(enabled=True, **overrides).options
+            outputs = {path: os.path.join(work_dir, f"{label}-{path.stem}.jpg") for path in images}
+            start = time.perf_counter()
+            futures = {path: pool.submit(preprocess_image, str(path), outputs[path], options) for path in images}
+            stats = {path: future.result() for path, future in futures.items()}
+            wall = time.perf_counter() - start
+
+            for path in images:
+                row = {"config": label, "image": path.name, **{
+                    k: stats[path][k] for k in ("before_bytes", "after_bytes", "cropped", "seconds")
+                }}
+                if args.ocr:
+                    markdown, latency = timed_ocr(outputs[path])
+                    ref_markdown, ref_latency = reference[path]
+                    row.update(
+                        ocr_seconds=latency,
+                        ref_ocr_seconds=ref_latency,
+                        similarity=similarity(ref_markdown, markdown),
+                        amount_recall=amount_recall(path.stem, markdown),
+                        ref_amount_recall=amount_recall(path.stem, ref_markdown),
+                    )
+                rows.append(row)
+
+            config_rows = [r for r in rows if r["config"] == label]
+            before = sum(r["before_bytes"] for r in config_rows)
+            after = sum(r["after_bytes"] for r in config_rows)
+            summary.append({
+                "config": label,
+                "reduction": 1 - after / before,
+                "mb_before": before / 1e6,
+                "mb_after": after / 1e6,
+                "prep_ms": mean(r["seconds"] for r in config_rows) * 1000,
+                "images_per_sec": len(images) / wall,
+                "ocr_s": mean(r.get("ocr_seconds") for r in config_rows),
+                "ref_ocr_s": mean(r.get("ref_ocr_seconds") for r in config_rows),
+                "similarity": mean(r.get("similarity") for r in config_rows),
+                "recall": mean(r.get("amount_recall") for r in config_rows),
+                "ref_recall": mean(r.get("ref_amount_recall") for r in config_rows),
+            })
+
+    print()
+    print(f"{'config':<16} {'MB in':>7} {'MB out':>7} {'saved':>6} {'prep ms':>8} {'img/s':>6} "
+          f"{'ocr s':>6} {'raw s':>6} {'sim':>5} {'recall':>6} {'raw':>5}")
+    for s in summary:
+        print(f"{s['config']:<16} {s['mb_before']:>7.2f} {s['mb_after']:>7.2f} {s['reduction']:>6.0%} "
+              f"{s['prep_ms']:>8.0f} {s['images_per_sec']:>6.1f} {fmt(s['ocr_s'], '>6.2f')} "
+              f"{fmt(s['ref_ocr_s'], '>6.2f')} {fmt(s['similarity'], '>5.2f')} "
+              f"{fmt(s['recall'], '>6.0%')} {fmt(s['ref_recall'], '>5.0%')}")
+
+    if args.csv:
+        fields = list(dict.fromkeys(key for row in rows for key in row))
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\nPer-image rows written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Scaling of the distributed mode: publishes synthetic documents to a fresh
+work queue, then drains it with 1, 2, 4... worker processes (the same code
+path as `python agent.py worker`). The fake Azure DI and Gemini clients
+from fakes.py stand in for the APIs. Reports throughput per process count,
+speedup and efficiency, and checks that every document was processed
+exactly once.
+
+Usage:
+    python benchmarks/queue_benchmark.py [--processes 1,2,4] [--docs 200]
+        [--threads 4] [--di-latency 0.5] [--gemini-latency 0.5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+ITEMS_PER_DOC = 10
+
+
+def configure(work_dir, threads):
+    from pipeline_benchmark import configure_environment
+
+    configure_environment(work_dir, SimpleNamespace(fast_path=False, rpm=1_000_000, retry_base_delay=0.1))
+    os.environ.update({
+        "WORK_QUEUE_DB": os.path.join(work_dir, "work_queue.db"),
+        "WORK_QUEUE_POLL_SECONDS": "0.1",
+        "AZURE_DI_CONCURRENCY": str(threads),
+        "GEMINI_CONCURRENCY": str(threads),
+    })
+
+
+def run_worker_process(work_dir, threads, di_latency, gemini_latency, seed):
+    """
+    Child process: one queue worker with `threads` threads, until the queue is empty.
+    """
+    configure(work_dir, threads)
+
+    import agent as pipeline
+    from clients import set_client_overrides
+    from fakes import FakeDocumentIntelligenceClient, FakeService
+    from memory_benchmark import synthetic_markdown, window_response
+    from work_queue import QueueWorker, get_work_queue
+
+    markdown = synthetic_markdown(ITEMS_PER_DOC)
+
+    class DocumentClient(FakeDocumentIntelligenceClient):
+        def _content_for(self, body):
+            while body.read(1024 * 1024):
+                pass
+            return markdown
+
+    gemini = FakeService(latency=gemini_latency, jitter=gemini_latency / 4, seed=seed + 1)
+
+    class Models:
+        def generate_content(self, model=None, contents=None, config=None):
+            gemini.wait()
+            return SimpleNamespace(text=window_response(contents), usage_metadata=None)
+
+    set_client_overrides(
+        document_intelligence=DocumentClient(FakeService(latency=di_latency, jitter=di_latency / 4, seed=seed)),
+        genai_client=SimpleNamespace(models=Models()),
+    )
+    QueueWorker(pipeline.agent, get_work_queue(), workers=threads, exit_when_idle=True).start().join()
+
+
+def run_once(processes, args):
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure(work_dir, args.threads)
+        from work_queue import DONE, WorkQueue
+
+        # Distinct content per document: the queue is keyed by content hash
+        work_queue = WorkQueue(os.environ["WORK_QUEUE_DB"])
+        docs_dir = Path(work_dir) / "docs"
+        docs_dir.mkdir()
+        for i in range(args.docs):
+            path = docs_dir / f"doc_{i:05d}.jpg"
+            path.write_bytes(f"synthetic receipt {i}\n".encode() * 64)
+            work_queue.publish(str(path))
+
+        start = time.perf_counter()
+        children = [
+            subprocess.Popen(
+                [sys.executable, __file__, "--child", work_dir, "--threads", str(args.threads),
+                 "--di-latency", str(args.di_latency), "--gemini-latency", str(args.gemini_latency),
+                 "--seed", str(n)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            )
+            for n in range(processes)
+        ]
+        errors = [child.communicate()[1] for child in children]
+        elapsed = time.perf_counter() - start
+        failed = [e.strip().splitlines()[-1] for child, e in zip(children, errors) if child.returncode and e.strip()]
+
+        with work_queue._lock:
+            attempts = work_queue._conn.execute(
+                "SELECT COALESCE(SUM(attempts), 0) FROM work_items WHERE state = ?", (DONE,)
+            ).fetchone()[0]
+        counts = work_queue.counts()
+        work_queue.close()
+
+        from results_store import ResultsStore
+        store = ResultsStore(os.environ["RESULTS_DB"])
+        saved = store.count()
+        store.close()
+
+    return {
+        "processes": processes,
+        "docs": args.docs,
+        "seconds": elapsed,
+        "docs_per_sec": args.docs / elapsed if elapsed else 0.0,
+        "done": counts.get(DONE, 0),
+        "attempts": attempts,
+        "saved": saved,
+        "errors": failed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", default="1,2,4")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4, help="Queue worker threads per process")
+    parser.add_argument("--di-latency", type=float, default=0.5)
+    parser.add_argument("--gemini-latency", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default=None, help="Write the results as JSON")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        run_worker_process(args.child, args.threads, args.di_latency, args.gemini_latency, args.seed)
+        return 0
+
+    print(f"{'procs':>5} {'docs':>5} {'wall s':>7} {'docs/s':>7} {'speedup':>7} {'effic.':>6} {'exactly once':>12}")
+    results, problems = [], False
+    for processes in (int(p) for p in args.processes.split(",")):
+        r = run_once(processes, args)
+        results.append(r)
+        base = results[0]["docs_per_sec"] / results[0]["processes"]
+        speedup = r["docs_per_sec"] / results[0]["docs_per_sec"] if results[0]["docs_per_sec"] else 0.0
+        once = r["done"] == r["docs"] == r["saved"] == r["attempts"]
+        problems = problems or not once or bool(r["errors"])
+        print(f"{processes:>5} {r['docs']:>5} {r['seconds']:>7.1f} {r['docs_per_sec']:>7.2f} {speedup:>7.2f} "
+              f"{r['docs_per_sec'] / processes / base if base else 0.0:>6.0%} {'yes' if once else 'NO':>12}")
+        for error in r["errors"]:
+            print(f"      worker error: {error}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nSaved to {args.save}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
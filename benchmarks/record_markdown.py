@@ -0,0 +1,36 @@
+"""
+Saves the real Document Intelligence markdown of the sample receipts to
+benchmarks/recordings/, where the fake DI client replays it. Needs Azure
+credentials once; files already in the OCR cache cost no API call.
+
+Usage:
+    python benchmarks/record_markdown.py [--images img_processed]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from azure_di import get_layout_as_markdown  # noqa: E402
+from fakes import RECORDINGS_DIR  # noqa: E402
+from watcher import is_supported  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=str(ROOT / "img_processed"))
+    args = parser.parse_args(argv)
+
+    RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
+    for path in sorted(p for p in Path(args.images).iterdir() if is_supported(p)):
+        target = RECORDINGS_DIR / f"{path.stem}.md"
+        if target.exists():
+            continue
+        target.write_text(get_layout_as_markdown(str(path)), encoding="utf-8")
+        print(f"Recorded {target.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Cold-start cost of each entry point: imports the module in a fresh
+interpreter under `python -X importtime` and reports the wall time, the
+total import time, the slowest imports, and whether the import already
+loaded an SDK or replaced sys.stdout (neither should happen until the
+pipeline actually runs).
+
+Usage:
+    python benchmarks/startup_benchmark.py [--modules agent,ui,extract_text]
+        [--repeat 5] [--top 8] [--save startup.json]
+        [--baseline startup.json --tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENTRY_POINTS = ("agent", "ui", "extract_text")
+# Modules that must not be imported as a side effect of importing an entry point
+HEAVY_MODULES = ("google.genai", "azure.ai.documentintelligence", "httpx", "requests", "aiohttp", "dotenv")
+
+# json is imported after the module, so it is not charged to the probe
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+stdout = sys.stdout
+import {module}
+import json
+print(json.dumps({{
+    "wall_ms": (time.perf_counter() - start) * 1000,
+    "stdout_replaced": sys.stdout is not stdout,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}), file=stdout)
+"""
+
+
+def parse_importtime(stderr):
+    """
+    (module, cumulative microseconds, nesting depth) for every line of
+    -X importtime output.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            imports.append((name.strip(), int(cumulative), depth))
+        except ValueError:
+            continue
+    return imports
+
+
+def measure(module):
+    """
+    One cold import of module in a new interpreter. If the import fails
+    (e.g. a dependency is not installed), only the error is returned.
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()
+        return {"module": module, "error": error[-1] if error else f"exit code {proc.returncode}"}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(proc.stderr)
+    # Top-level imports add up to the total; nested ones are included in them
+    result["import_ms"] = sum(us for _, us, depth in imports if depth == 0) / 1000
+    result["slowest"] = sorted(((name, us / 1000) for name, us, _ in imports),
+                               key=lambda kv: kv[1], reverse=True)
+    result["module"] = module
+    return result
+
+
+def best_of(module, repeat):
+    """
+    The fastest of `repeat` cold imports: the least disturbed by other load.
+    """
+    runs = [measure(module) for _ in range(repeat)]
+    ok = [r for r in runs if "error" not in r]
+    return min(ok, key=lambda r: r["wall_ms"]) if ok else runs[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=",".join(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports listed per module")
+    parser.add_argument("--save", default=None, help="Write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="Fail if startup got slower than this saved run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = [best_of(module, args.repeat) for module in args.modules.split(",")]
+    problems = []
+    for r in results:
+        if "error" in r:
+            print(f"{r['module']}: import failed ({r['error']})")
+            problems.append(r["module"])
+            continue
+        print(f"{r['module']}: {r['wall_ms']:.0f} ms wall, {r['import_ms']:.0f} ms in imports")
+        for name, ms in r["slowest"][:args.top]:
+            print(f"    {ms:8.1f} ms  {name}")
+        if r["heavy"]:
+            print(f"    ❌ loaded on import: {', '.join(r['heavy'])}")
+            problems.append(r["module"])
+        if r["stdout_replaced"]:
+            print("    ❌ replaced sys.stdout on import")
+            problems.append(r["module"])
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+        print(f"\nSaved to {args.save}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = {r["module"]: r for r in json.load(f)["results"] if "error" not in r}
+        for r in results:
+            base = baseline.get(r["module"])
+            if base and "error" not in r and r["wall_ms"] > base["wall_ms"] * (1 + args.tolerance):
+                print(f"❌ Startup regression for {r['module']}: {base['wall_ms']:.0f} -> {r['wall_ms']:.0f} ms")
+                problems.append(r["module"])
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
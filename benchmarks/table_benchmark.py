@@ -0,0 +1,80 @@
+"""
+Times the dashboard's results table operations (results_index.ResultsIndex)
+on a synthetic result set: loading, column sorts, status filters, file name
+search, and fetching one screen of rows. Fails if any operation takes longer
+than the budget.
+
+Usage:
+    python benchmarks/table_benchmark.py [--rows 100000] [--budget-ms 100]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from results_index import ResultsIndex  # noqa: E402
+
+STATUSES = ["passed"] * 7 + ["failed", "JSON_FAIL", "PROCESS_FAIL"]
+SCREEN_ROWS = 25
+
+
+def build_index(rows, seed):
+    rng = random.Random(seed)
+    index = ResultsIndex()
+    for _ in range(rows):
+        status = rng.choice(STATUSES)
+        before = status if status.endswith("_FAIL") else round(rng.uniform(1, 500), 2)
+        after = status if status.endswith("_FAIL") else round(rng.uniform(1, 550), 2)
+        name = f"X{rng.randrange(10 ** 11):011d}.jpg"
+        index.upsert((name, before, after, status == "passed"), status)
+    return index
+
+
+def timed(index, label, **view_args):
+    # A new version drops the cached views, so every call measures a cold query
+    index.version += 1
+    start = time.perf_counter()
+    view = index.view(**view_args)
+    index.window(view, max(0, len(view) // 2), SCREEN_ROWS)
+    return label, len(view), (time.perf_counter() - start) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    index = build_index(args.rows, args.seed)
+    print(f"Loaded {len(index)} rows in {time.perf_counter() - start:.2f}s")
+
+    results = [
+        timed(index, "unsorted window"),
+        timed(index, "sort by file", sort_column="file"),
+        timed(index, "sort by before tax", sort_column="total_pre_tax"),
+        timed(index, "sort by after tax desc", sort_column="total_post_tax", descending=True),
+        timed(index, "filter any failure", status_filter="Any failure"),
+        timed(index, "filter JSON_FAIL", status_filter="JSON_FAIL"),
+        timed(index, "search '123'", search="123"),
+        timed(index, "sort + filter + search", sort_column="total_post_tax", status_filter="Passed", search="9"),
+    ]
+    print(f"{'operation':<26} {'rows':>7} {'ms':>7}")
+    for label, rows, ms in results:
+        print(f"{label:<26} {rows:>7} {ms:>7.1f}")
+
+    slow = [label for label, _, ms in results if ms > args.budget_ms]
+    if slow:
+        print(f"❌ Over the {args.budget_ms:.0f} ms budget: {', '.join(slow)}")
+        return 1
+    print(f"✅ Every operation within {args.budget_ms:.0f} ms.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
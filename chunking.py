@@ -0,0 +1,98 @@
+import os
+
+from compaction import estimate_tokens
+
+# --- Configuration ---
+# OCR text over PROMPT_WINDOW_TOKENS is sent to Gemini as several windows
+# instead of one prompt; set it to 0 to always send a single prompt.
+DEFAULT_WINDOW_TOKENS = 6000
+DEFAULT_WINDOW_OVERLAP_LINES = 4   # Lines repeated at the start of the next window
+
+
+def window_tokens() -> int:
+    try:
+        return int(os.getenv("PROMPT_WINDOW_TOKENS", DEFAULT_WINDOW_TOKENS))
+    except ValueError:
+        return DEFAULT_WINDOW_TOKENS
+
+
+def split_windows(text, max_tokens=None, overlap_lines=None) -> list:
+    """
+    Splits OCR text into windows of at most max_tokens (estimated), on line
+    boundaries. Each window repeats the last overlap_lines lines of the one
+    before, so an item whose name and amount sit on adjacent lines is whole
+    in at least one window. Text within the budget comes back as one window.
+    """
+    max_tokens = window_tokens() if max_tokens is None else max_tokens
+    if overlap_lines is None:
+        overlap_lines = int(os.getenv("PROMPT_WINDOW_OVERLAP_LINES", DEFAULT_WINDOW_OVERLAP_LINES))
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    max_chars = max_tokens * 4
+    # A single line longer than a window is cut into window-sized pieces
+    lines = []
+    for line in text.splitlines():
+        lines.extend(line[i:i + max_chars] for i in range(0, max(len(line), 1), max_chars))
+
+    windows, current, size = [], [], 0
+    for line in lines:
+        if current and size + len(line) + 1 > max_chars:
+            windows.append("\n".join(current))
+            current = current[-overlap_lines:] if overlap_lines else []
+            # The carried-over lines must leave room for new ones
+            while current and sum(len(c) + 1 for c in current) + len(line) + 1 > max_chars:
+                current.pop(0)
+            size = sum(len(c) + 1 for c in current)
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        windows.append("\n".join(current))
+    return windows
+
+
+def _item_key(item):
+    name = " ".join(str(item.get("item_name", "")).lower().split())
+    try:
+        amount = round(float(item.get("item_amount", 0.0)), 2)
+    except (TypeError, ValueError):
+        amount = item.get("item_amount")
+    return name, amount
+
+
+def _is_amount(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def merge_extractions(records, overlap_items=None) -> dict:
+    """
+    Merges the records extracted from consecutive windows into one.
+
+    Items are concatenated in window order. Where a window starts with the
+    same items that ended the previous one (the overlapping lines), the
+    repeats are dropped: the longest run of matching items, up to
+    overlap_items, is skipped. Identical items elsewhere are kept, since a
+    receipt can list the same thing twice.
+
+    Totals come from the last window that reports a non-zero amount, as
+    receipts print them at the end.
+    """
+    if overlap_items is None:
+        overlap_items = int(os.getenv("PROMPT_WINDOW_OVERLAP_LINES", DEFAULT_WINDOW_OVERLAP_LINES))
+    items, keys = [], []
+    merged = {"total_amount_before_tax": 0.0, "total_amount_after_tax": 0.0}
+    for record in records:
+        window_items = [i for i in record.get("items") or [] if isinstance(i, dict)]
+        window_keys = [_item_key(i) for i in window_items]
+        skip = 0
+        for k in range(min(overlap_items, len(keys), len(window_keys)), 0, -1):
+            if keys[-k:] == window_keys[:k]:
+                skip = k
+                break
+        items.extend(window_items[skip:])
+        keys.extend(window_keys[skip:])
+        for field in ("total_amount_before_tax", "total_amount_after_tax"):
+            if _is_amount(record.get(field)) and record[field]:
+                merged[field] = record[field]
+    merged["items"] = items
+    return merged
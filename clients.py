@@ -0,0 +1,262 @@
+import asyncio
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from worker_pool import StageLimits
+
+if TYPE_CHECKING:
+    from azure.ai.documentintelligence import DocumentIntelligenceClient
+    from azure.ai.documentintelligence.aio import DocumentIntelligenceClient as AsyncDocumentIntelligenceClient
+
+# The Azure and Gemini SDKs (and their HTTP stacks) take a noticeable share of
+# startup time, so they are imported by the getters below on first use, and
+# .env is read by load_environment() rather than at import.
+
+# --- Configuration ---
+# HTTP_POOL_SIZE defaults to the largest per-stage concurrency so every worker
+# inside a stage can hold its own keep-alive connection.
+DEFAULT_KEEPALIVE_SECONDS = 60
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+
+_clients = {}
+_async_sessions = {}
+_overrides = {}
+_lock = threading.Lock()
+_env_loaded = False
+
+
+def load_environment():
+    """
+    Loads the .env file into os.environ, once per process. Variables already
+    set in the environment win. Entry points call this before reading their
+    configuration; the client getters call it too.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    _env_loaded = True
+
+
+def set_client_overrides(document_intelligence=None, async_document_intelligence=None, genai_client=None):
+    """
+    Makes the getters below return the given objects instead of real clients,
+    e.g. the local stand-ins in benchmarks/fakes.py. Call with no arguments
+    to go back to the real clients.
+    """
+    with _lock:
+        _overrides.clear()
+        for name, client in (("azure_di", document_intelligence),
+                             ("azure_di_async", async_document_intelligence),
+                             ("genai", genai_client)):
+            if client is not None:
+                _overrides[name] = client
+
+
+def is_override(client) -> bool:
+    """
+    True if client is one of the stand-ins installed by set_client_overrides().
+    """
+    return client is not None and any(client is c for c in _overrides.values())
+
+
+def _pool_size() -> int:
+    try:
+        return int(os.getenv("HTTP_POOL_SIZE"))
+    except (TypeError, ValueError):
+        return max(StageLimits().limits.values())
+
+
+def _keepalive_seconds() -> float:
+    return float(os.getenv("HTTP_KEEPALIVE_SECONDS", DEFAULT_KEEPALIVE_SECONDS))
+
+
+def _azure_credentials(endpoint, key):
+    load_environment()
+    endpoint = endpoint or os.getenv("AZURE_DI_ENDPOINT")
+    key = key or os.getenv("AZURE_DI_KEY")
+    if not endpoint or not key:
+        raise ValueError(
+            "❌ Missing Azure credentials. "
+            "Please set AZURE_DI_ENDPOINT and AZURE_DI_KEY in your .env file"
+        )
+    return endpoint, key
+
+
+def get_document_intelligence_client(endpoint=None, key=None) -> "DocumentIntelligenceClient":
+    """
+    Returns one shared DocumentIntelligenceClient per endpoint/key pair.
+    The client is backed by a pooled requests session, so TLS connections are
+    reused across documents instead of being renegotiated on every call.
+    """
+    if "azure_di" in _overrides:
+        return _overrides["azure_di"]
+    endpoint, key = _azure_credentials(endpoint, key)
+    cache_key = ("azure_di", endpoint, key)
+    with _lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from azure.core.credentials import AzureKeyCredential
+            from azure.core.pipeline.transport import RequestsTransport
+            from azure.ai.documentintelligence import DocumentIntelligenceClient
+
+            pool_size = _pool_size()
+            session = requests.Session()
+            adapter = _keepalive_adapter(HTTPAdapter)(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Connection"] = "keep-alive"
+            transport = RequestsTransport(
+                session=session,
+                session_owner=False,
+                connection_timeout=DEFAULT_CONNECT_TIMEOUT,
+                read_timeout=DEFAULT_READ_TIMEOUT,
+            )
+            # Retries are handled by rate_limit.py; the SDK's own retry policy
+            # would multiply the attempts and ignore our backoff
+            client = DocumentIntelligenceClient(
+                endpoint, AzureKeyCredential(key), transport=transport, retry_total=0
+            )
+            _clients[cache_key] = client
+            print(f"✅ Azure DI client initialized (pool size {pool_size}).")
+    return client
+
+
+def _keepalive_adapter(http_adapter):
+    """
+    An HTTPAdapter subclass that honours HTTP_KEEPALIVE_SECONDS: urllib3 keeps
+    idle connections forever, so once the pool has sat idle longer than that
+    they are dropped instead of being reused after the server closed them.
+    """
+    class KeepAliveAdapter(http_adapter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.keepalive_seconds = _keepalive_seconds()
+            self._last_used = time.monotonic()
+
+        def send(self, request, *args, **kwargs):
+            now = time.monotonic()
+            if now - self._last_used > self.keepalive_seconds:
+                self.poolmanager.clear()
+            self._last_used = now
+            return super().send(request, *args, **kwargs)
+
+    return KeepAliveAdapter
+
+
+def get_genai_client():
+    """
+    Returns the shared Gemini client, or None if it could not be initialized.
+    The genai.Client() will automatically look for the key in the
+    GEMINI_API_KEY environment variable set by load_environment().
+    """
+    if "genai" in _overrides:
+        return _overrides["genai"]
+    load_environment()
+    cache_key = ("genai", os.getenv("GEMINI_API_KEY"))
+    with _lock:
+        if cache_key in _clients:
+            return _clients[cache_key]
+
+        import httpx
+        from google import genai
+        from google.genai import types
+
+        pool_size = _pool_size()
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=_keepalive_seconds(),
+        )
+        try:
+            try:
+                client = genai.Client(
+                    http_options=types.HttpOptions(
+                        client_args={"limits": limits},
+                        async_client_args={"limits": limits},
+                    )
+                )
+            except (TypeError, ValueError):
+                # Older google-genai releases do not accept client_args
+                client = genai.Client()
+            print(f"✅ Gemini API Client initialized successfully (pool size {pool_size}).")
+        except Exception as e:
+            print("FATAL ERROR: Could not initialize Gemini Client.")
+            print("Ensure GEMINI_API_KEY is correctly set in your .env file.")
+            print(f"Underlying Error: {e}")
+            client = None
+        _clients[cache_key] = client
+    return client
+
+
+def get_async_document_intelligence_client(endpoint=None, key=None) -> "AsyncDocumentIntelligenceClient":
+    """
+    Async counterpart of get_document_intelligence_client().
+    Async clients are bound to the event loop that created them, so one is
+    kept per running loop. Must be called from inside a coroutine.
+    """
+    if "azure_di_async" in _overrides:
+        return _overrides["azure_di_async"]
+
+    # aiohttp is only needed by the async pipeline
+    from azure.core.credentials import AzureKeyCredential
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.ai.documentintelligence.aio import DocumentIntelligenceClient as AsyncDocumentIntelligenceClient
+    import aiohttp
+
+    endpoint, key = _azure_credentials(endpoint, key)
+    loop = asyncio.get_running_loop()
+    cache_key = ("azure_di_async", endpoint, key, id(loop))
+    with _lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            pool_size = _pool_size()
+            connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=_keepalive_seconds())
+            session = aiohttp.ClientSession(connector=connector)
+            transport = AioHttpTransport(session=session, session_owner=False)
+            client = AsyncDocumentIntelligenceClient(
+                endpoint, AzureKeyCredential(key), transport=transport, retry_total=0
+            )
+            _clients[cache_key] = client
+            _async_sessions[cache_key] = session
+            print(f"✅ Async Azure DI client initialized (pool size {pool_size}).")
+    return client
+
+
+async def aclose_clients():
+    """
+    Closes the async clients that belong to the running event loop.
+    """
+    loop_id = id(asyncio.get_running_loop())
+    with _lock:
+        keys = [k for k in _clients if k[0] == "azure_di_async" and k[-1] == loop_id]
+        pairs = [(_clients.pop(k), _async_sessions.pop(k)) for k in keys]
+    for client, session in pairs:
+        try:
+            await client.close()
+            await session.close()
+        except Exception:
+            pass
+
+
+def close_clients():
+    """
+    Closes every pooled client. Called on shutdown.
+    """
+    with _lock:
+        for cache_key, client in _clients.items():
+            if cache_key[0] == "azure_di_async":
+                continue  # Closed by aclose_clients() on their own loop
+            close = getattr(client, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+        _clients.clear()
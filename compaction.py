@@ -0,0 +1,144 @@
+import html
+import os
+import re
+
+import metrics
+
+# --- Configuration ---
+# COMPACT_OCR=0 sends the DI markdown to Gemini verbatim.
+# OCR_STRUCTURED=1 builds the OCR text from DI's paragraphs and tables
+# (see render_structured) instead of the flat markdown string.
+
+# Any line carrying a money amount is kept, whatever else it contains
+_AMOUNT = re.compile(r"\d[\d,]*[.,]\d{2}(?!\d)")
+
+# Lines without an amount that never help find items or totals. Single words
+# only match as labels ("Tel:", "Date :") so item names like "PHONE CASE" stay.
+_BOILERPLATE = re.compile(
+    r"(?i)("
+    r"\b(gst|sst|co|company|roc|business|tax)[.\s-]*(reg|id|no)\b|"
+    r"\b(tel|phone|fax|h/p|e-?mail|website|cashier|counter|terminal|pos|table|"
+    r"served\s*by|salesperson|member|date|time|"
+    r"invoice|receipt|bill|doc|ref|trans(action)?)\s*(no\.?|#|id)?\s*:|"
+    r"@[\w-]+\.\w|www\.|https?://|"
+    r"\bthank\s*you\b|\bplease\s*come\s*again\b|\bhave\s*a\s*nice\s*day\b|"
+    r"\bgoods\s*sold\b|\bnot\s*(returnable|refundable|exchangeable)\b|\bno\s*(refund|exchange)\b"
+    r")"
+)
+
+# DI markup that carries no receipt content
+_DI_COMMENT = re.compile(r"<!--\s*(PageHeader|PageFooter|PageNumber|PageBreak)[^>]*-->")
+_SELECTION_MARK = re.compile(r":(un)?selected:")
+_SEPARATOR = re.compile(r"^[\s\-=_*~.#|:]+$")
+
+_TABLE = re.compile(r"<table>.*?</table>", re.S | re.I)
+_ROW = re.compile(r"<tr>(.*?)</tr>", re.S | re.I)
+_CELL = re.compile(r"<t[hd][^>]*>(.*?)</t[hd]>", re.S | re.I)
+_TAG = re.compile(r"<[^>]+>")
+
+# Paragraph roles from DI's structured output that are never needed
+SKIP_ROLES = {"pageHeader", "pageFooter", "pageNumber"}
+
+
+def estimate_tokens(text):
+    # Rough Gemini estimate: ~4 characters per token
+    return len(text) // 4 + 1
+
+
+def _table_to_rows(match):
+    """
+    Renders an HTML table from the DI markdown as one 'a | b | c' line per row.
+    """
+    lines = []
+    for row in _ROW.findall(match.group(0)):
+        cells = [" ".join(html.unescape(_TAG.sub(" ", c)).split()) for c in _CELL.findall(row)]
+        if any(cells):
+            lines.append(" | ".join(cells))
+    return "\n" + "\n".join(lines) + "\n"
+
+
+def _keep_line(line):
+    if _AMOUNT.search(line):
+        return True
+    if _SEPARATOR.match(line):
+        return False
+    return not _BOILERPLATE.search(line)
+
+
+def compact_markdown(markdown: str) -> str:
+    """
+    Shrinks DI layout markdown for the extraction prompt. Tables become pipe
+    rows, page headers/footers and known boilerplate lines (registration
+    numbers, contact details, greetings, cashier/date lines) are dropped
+    unless they contain an amount, and whitespace is normalized.
+    """
+    if not markdown:
+        return markdown
+    text = _DI_COMMENT.sub("\n", markdown)
+    text = _SELECTION_MARK.sub("", text)
+    text = _TABLE.sub(_table_to_rows, text)
+    text = _TAG.sub(" ", text)          # <figure>, <figcaption> and similar wrappers
+    text = html.unescape(text)
+
+    lines = []
+    for raw in text.splitlines():
+        line = " ".join(raw.lstrip("#> ").split())
+        if not line:
+            continue
+        if _keep_line(line) and (not lines or lines[-1] != line):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def render_structured(result) -> str:
+    """
+    Builds the OCR text from an AnalyzeResult's paragraphs and tables instead
+    of its markdown: header/footer/page-number paragraphs are skipped and
+    every table is rendered once as pipe rows, in reading order.
+    """
+    tables = getattr(result, "tables", None) or []
+    table_spans = [
+        (span.offset, span.offset + span.length)
+        for table in tables for span in (table.spans or [])
+    ]
+
+    def in_table(paragraph):
+        offset = paragraph.spans[0].offset if paragraph.spans else -1
+        return any(start <= offset < end for start, end in table_spans)
+
+    blocks = []
+    for paragraph in getattr(result, "paragraphs", None) or []:
+        if paragraph.role in SKIP_ROLES or in_table(paragraph):
+            continue
+        offset = paragraph.spans[0].offset if paragraph.spans else 0
+        blocks.append((offset, paragraph.content))
+
+    for table in tables:
+        grid = {}
+        for cell in table.cells:
+            grid.setdefault(cell.row_index, {})[cell.column_index] = " ".join((cell.content or "").split())
+        rows = [" | ".join(cols[c] for c in sorted(cols)) for _, cols in sorted(grid.items())]
+        offset = table.spans[0].offset if table.spans else 0
+        blocks.append((offset, "\n".join(rows)))
+
+    blocks.sort(key=lambda block: block[0])
+    return "\n".join(content for _, content in blocks if content)
+
+
+def structured_enabled() -> bool:
+    return os.getenv("OCR_STRUCTURED", "0") == "1"
+
+
+def compact_for_prompt(ocr_output: str) -> str:
+    """
+    Compaction stage between OCR and the Gemini prompt. Records the token
+    estimate before and after on the current document.
+    """
+    if os.getenv("COMPACT_OCR", "1") == "0" or not ocr_output:
+        return ocr_output
+    with metrics.stage("compact"):
+        compacted = compact_markdown(ocr_output)
+    before, after = estimate_tokens(ocr_output), estimate_tokens(compacted)
+    metrics.note(ocr_tokens=before, compact_tokens=after)
+    metrics.increment("prompt_tokens_saved", before - after)
+    return compacted
@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# --- Configuration ---
+DEFAULT_DEAD_LETTER_FILE = Path("agent_outputs") / "dead_letter.jsonl"
+
+
+class DeadLetterQueue:
+    """
+    Append-only JSONL list of documents whose API calls exhausted their
+    retries. An entry is removed only once its replay saved a result, so an
+    interrupted replay leaves the rest in place; failures are appended again.
+    """
+    def __init__(self, path=None):
+        self.path = Path(path or os.getenv("DEAD_LETTER_FILE", DEFAULT_DEAD_LETTER_FILE))
+        self._lock = threading.Lock()
+
+    def add(self, file_path, stage, error):
+        entry = {
+            "file_path": str(file_path),
+            "stage": stage,
+            "error": str(error),
+            "failed_at": time.time(),
+        }
+        with self._lock:
+            os.makedirs(self.path.parent, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        print(f"☠️ Moved {Path(file_path).name} to the dead-letter queue ({stage}): {error}")
+
+    def entries(self) -> list:
+        with self._lock:
+            return self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def latest(self) -> list:
+        """
+        Every entry, de-duplicated by file path (the most recent one wins).
+        """
+        latest = {}
+        for entry in self.entries():
+            latest[entry["file_path"]] = entry
+        return list(latest.values())
+
+    def remove(self, file_path):
+        """
+        Drops every entry for file_path, once it has been replayed (or can
+        no longer be). The file is rewritten atomically, so a crash leaves
+        either the old or the new list.
+        """
+        with self._lock:
+            entries = self._read()
+            keep = [e for e in entries if e["file_path"] != str(file_path)]
+            if len(keep) == len(entries):
+                return
+            if not keep:
+                os.remove(self.path)
+                return
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(e) + "\n" for e in keep)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+_dlq = None
+_dlq_lock = threading.Lock()
+
+
+def get_dead_letter_queue() -> DeadLetterQueue:
+    global _dlq
+    with _dlq_lock:
+        if _dlq is None:
+            _dlq = DeadLetterQueue()
+    return _dlq
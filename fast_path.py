@@ -0,0 +1,117 @@
+import re
+
+from compaction import compact_markdown
+
+# --- Configuration ---
+# FAST_PATH=0 sends every receipt to Gemini.
+MAX_ITEMS = 40   # Longer receipts are left to the LLM
+
+_AMOUNT = re.compile(r"(?<![\d.])-?\d{1,3}(?:,\d{3})*\.\d{2}(?![\d%])|(?<![\d.,])-?\d+\.\d{2}(?![\d%])")
+_LETTERS = re.compile(r"[A-Za-z]{2,}")
+
+# Key-value lines, checked in this order
+_SUBTOTAL = re.compile(r"(?i)\b(sub\s*-?\s*total|total\s*(excl\w*|before|w/o)|total\s*sales\s*\(?excl)")
+_ROUNDING = re.compile(r"(?i)\b(rounding|round(ed)?\s*adj\w*|adj(ustment)?)\b")
+_TOTAL_INCLUSIVE = re.compile(
+    r"(?i)\b(grand\s*total|total\s*(incl\w*|amount|amt|payable|due|sales|rm)|nett?\s*total|"
+    r"rounded\s*total|amount\s*due|total)\b"
+)
+_TAX = re.compile(r"(?i)\b(gst|sst|vat|tax|service\s*charge|svc\s*chg)\b")
+# Payment lines come after the totals and are never items; only matched as a
+# leading label, since item names may contain words like "card"
+_PAYMENT = re.compile(r"(?i)^(cash|change|tender\w*|paid|payment|visa|master\w*|card|balance|"
+                      r"debit|credit|e-?wallet|boost|grab\s*pay|tng)\b")
+# Lines that the simple rules cannot account for
+_UNSUPPORTED = re.compile(r"(?i)\b(discount|disc|void|refund|voucher|coupon|deposit|less|promo)\b")
+
+
+def _amounts(line):
+    return [float(a.replace(",", "")) for a in _AMOUNT.findall(line)]
+
+
+def _name_of(line):
+    """
+    Item text of a line: the first table cell, or the line without its
+    amounts, quantities and unit markers.
+    """
+    if " | " in line:
+        line = line.split(" | ")[0]
+    name = _AMOUNT.sub(" ", line)
+    name = re.sub(r"(?i)\b\d+\s*(pcs?|units?|qty)\b|(?<![a-z])[*@x](?![a-z])\s*\d*|\bRM\b", " ", name)
+    name = " ".join(name.split()).strip(" |:-")
+    return name if _LETTERS.search(name) else ""
+
+
+def _is_total(line):
+    # "Total incl. GST 9.00" is a total, "GST included in total 0.51" is tax
+    total = _TOTAL_INCLUSIVE.search(line)
+    tax = _TAX.search(line)
+    return total is not None and (tax is None or total.start() < tax.start())
+
+
+def extract_locally(ocr_text):
+    """
+    Rule-based receipt extraction from DI layout output (markdown or its
+    compacted form). Returns (record, None) with the same fields the LLM
+    produces, or (None, reason) when the receipt is not simple enough.
+    """
+    lines = compact_markdown(ocr_text or "").splitlines()
+
+    items = []
+    pending_name = ""
+    subtotal = total = None
+    rounding = 0.0
+    in_totals = paid = False
+
+    for line in lines:
+        amounts = _amounts(line)
+        if _UNSUPPORTED.search(line) and amounts:
+            return None, f"unsupported line: {line[:40]}"
+        if not amounts:
+            if not in_totals and _name_of(line):
+                pending_name = _name_of(line)
+            continue
+
+        value = amounts[-1]
+        if _SUBTOTAL.search(line):
+            subtotal = value
+            in_totals = True
+        elif _ROUNDING.search(line):
+            rounding += value
+            in_totals = True
+        elif _is_total(line):
+            # The last TOTAL before payment is the rounded amount due;
+            # totals repeated after the payment lines are ignored
+            if not paid or total is None:
+                total = value
+            in_totals = True
+        elif _TAX.search(line):
+            in_totals = True
+        elif _PAYMENT.search(line):
+            in_totals = paid = True
+        elif not in_totals:
+            name = _name_of(line) or pending_name
+            if not name:
+                return None, f"amount without an item name: {line[:40]}"
+            if value < 0:
+                return None, "negative item amount"
+            items.append({"item_name": name, "item_amount": value})
+            pending_name = ""
+
+    if total is None:
+        return None, "no total found"
+    if not items:
+        return None, "no items found"
+    if len(items) > MAX_ITEMS:
+        return None, f"more than {MAX_ITEMS} items"
+
+    # Items usually add up to the subtotal, or to the total before rounding
+    items_sum = round(sum(i["item_amount"] for i in items), 2)
+    candidates = [c for c in (subtotal, round(total - rounding, 2), total) if c is not None]
+    before_tax = next((c for c in candidates if round(c, 2) == items_sum), candidates[0])
+
+    return {
+        "total_amount_before_tax": before_tax,
+        "total_amount_after_tax": total,
+        "items": items,
+    }, None
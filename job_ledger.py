@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# --- Configuration ---
+DEFAULT_DB_PATH = Path("agent_outputs") / "jobs.db"
+
+# Job states, in pipeline order
+QUEUED = "queued"
+OCR_DONE = "ocr_done"
+LLM_DONE = "llm_done"
+SAVED = "saved"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    content_hash TEXT PRIMARY KEY,
+    file_path    TEXT NOT NULL,
+    state        TEXT NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    ocr_text     TEXT,
+    result       TEXT,
+    error        TEXT,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state);
+"""
+
+
+class JobLedger:
+    """
+    Persistent record of every document the agent has started, keyed by
+    content hash. Intermediate results (the OCR markdown, then the validated
+    record) are checkpointed on the job, so a restart resumes after the last
+    finished stage instead of paying for the API calls again. Checkpoints are
+    dropped once the result is saved.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = str(db_path or os.getenv("JOBS_DB", DEFAULT_DB_PATH))
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: a checkpoint reported as written survives a power loss
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.executescript(SCHEMA)
+
+    def _get(self, content_hash):
+        row = self._conn.execute("SELECT * FROM jobs WHERE content_hash = ?", (content_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def get(self, content_hash):
+        with self._lock:
+            return self._get(content_hash)
+
+    def start(self, file_path, content_hash) -> dict:
+        """
+        Registers an attempt and returns the job. An unfinished job keeps its
+        checkpoints; a job that was already saved starts over (explicit reprocess).
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            job = self._get(content_hash)
+            if job is None:
+                self._conn.execute(
+                    "INSERT INTO jobs (content_hash, file_path, state, attempts, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 1, ?, ?)",
+                    (content_hash, str(file_path), QUEUED, now, now),
+                )
+            elif job["state"] == SAVED:
+                self._conn.execute(
+                    "UPDATE jobs SET file_path = ?, state = ?, attempts = attempts + 1, ocr_text = NULL, "
+                    "result = NULL, error = NULL, updated_at = ? WHERE content_hash = ?",
+                    (str(file_path), QUEUED, now, content_hash),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET file_path = ?, attempts = attempts + 1, error = NULL, updated_at = ? "
+                    "WHERE content_hash = ?",
+                    (str(file_path), now, content_hash),
+                )
+            return self._get(content_hash)
+
+    def _update(self, content_hash, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {columns} WHERE content_hash = ?", (*fields.values(), content_hash)
+            )
+
+    def mark_ocr_done(self, content_hash, ocr_text):
+        self._update(content_hash, state=OCR_DONE, ocr_text=ocr_text)
+
+    def mark_llm_done(self, content_hash, record):
+        self._update(content_hash, state=LLM_DONE, result=json.dumps(record))
+
+    def mark_failed(self, content_hash, error):
+        self._update(content_hash, state=FAILED, error=str(error))
+
+    def mark_saved(self, content_hash, file_path):
+        """
+        Marks the job finished and drops its checkpoints. Inserts the job if it
+        was never started through start() (e.g. packed batches).
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (content_hash, file_path, state, attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT(content_hash) DO UPDATE SET file_path = excluded.file_path, state = excluded.state, "
+                "ocr_text = NULL, result = NULL, error = NULL, updated_at = excluded.updated_at",
+                (content_hash, str(file_path), SAVED, now, now),
+            )
+
+    @staticmethod
+    def checkpointed_result(job):
+        """
+        The validated record saved on the job before a crash, if any.
+        """
+        if job and job.get("result"):
+            return json.loads(job["result"])
+        return None
+
+    def unfinished(self) -> list:
+        """
+        Jobs started but never saved, oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE state != ? ORDER BY created_at", (SAVED,)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> JobLedger:
+    """
+    Returns the process-wide job ledger, opening it on first use.
+    """
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = JobLedger()
+    return _ledger
+
+
+def reset_ledger():
+    """
+    Closes the process-wide ledger, so the next get_ledger() opens JOBS_DB
+    again (benchmarks point it at a fresh file per run).
+    """
+    global _ledger
+    with _ledger_lock:
+        if _ledger is not None:
+            _ledger.close()
+        _ledger = None
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# --- Configuration ---
+# All values can be overridden from the .env file
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600   # 7 days
+
+
+def make_key(model: str, config, prompt: str) -> str:
+    """
+    Builds the cache key from the model name, the generation config and the prompt.
+    """
+    if hasattr(config, "model_dump_json"):
+        config_repr = config.model_dump_json(exclude_none=True)
+    elif isinstance(config, dict):
+        # Same text as the SDK object's dump, so keys match either form
+        config_repr = json.dumps(config, separators=(",", ":"))
+    else:
+        config_repr = repr(config)
+    digest = hashlib.sha256()
+    for part in (model, config_repr, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Memoizes LLM responses with an in-memory LRU and an optional SQLite store.
+
+    Concurrent callers asking for the same key while a request is in flight
+    wait for that request instead of issuing their own (request coalescing).
+    """
+    def __init__(self, max_entries=None, db_path=None, ttl_seconds=None):
+        self.max_entries = int(max_entries or os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        self.ttl_seconds = float(ttl_seconds or os.getenv("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lru = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        db_path = db_path or os.getenv("LLM_CACHE_DB")
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    # --- In-memory LRU ---
+    def _lru_get(self, key):
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        response, created_at = entry
+        if time.time() - created_at > self.ttl_seconds:
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return response
+
+    def _lru_put(self, key, response, created_at):
+        self._lru[key] = (response, created_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    # --- Optional SQLite store ---
+    def _db_get(self, key):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+        return row
+
+    def _db_put(self, key, response, created_at):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, created_at),
+            )
+            self._db.commit()
+
+    def _claim(self, key):
+        """
+        Returns (cached_response, future, owner). The owner must compute the
+        response and resolve the future; everyone else waits on it.
+        """
+        with self._lock:
+            response = self._lru_get(key)
+            if response is not None:
+                self.hits += 1
+                return response, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            future = Future()
+            self._inflight[key] = future
+            return None, future, True
+
+    def _load(self, key):
+        row = self._db_get(key)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._lru_put(key, *row)
+        return row[0]
+
+    def _store(self, key, response, cacheable):
+        if not cacheable(response):
+            return
+        created_at = time.time()
+        with self._lock:
+            self._lru_put(key, response, created_at)
+        self._db_put(key, response, created_at)
+
+    def _release(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def get_or_compute(self, key, compute, cacheable=lambda response: True):
+        """
+        Returns the cached response for key, or calls compute() exactly once
+        across all concurrent callers and caches its result if cacheable().
+        """
+        if not self.enabled:
+            return compute()
+
+        response, future, owner = self._claim(key)
+        if response is not None:
+            return response
+        if not owner:
+            return future.result()
+
+        try:
+            response = self._load(key)
+            if response is None:
+                response = compute()
+                self._store(key, response, cacheable)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._release(key)
+
+    async def aget_or_compute(self, key, acompute, cacheable=lambda response: True):
+        """
+        Async variant of get_or_compute(). Shares the same LRU, store and
+        in-flight table, so sync and async callers are coalesced together.
+        """
+        if not self.enabled:
+            return await acompute()
+
+        response, future, owner = self._claim(key)
+        if response is not None:
+            return response
+        if not owner:
+            return await asyncio.wrap_future(future)
+
+        try:
+            response = self._load(key)
+            if response is None:
+                response = await acompute()
+                self._store(key, response, cacheable)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._release(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "entries": len(self._lru),
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -1,56 +1,183 @@
-from google import genai
-from google.genai import errors
-from google.genai.types import GenerateContentConfig
+import json
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from the .env file in the current directory
-load_dotenv()
-
-# The genai.Client() will automatically look for the key in the 
-# GEMINI_API_KEY environment variable set by load_dotenv()
-try:
-    client = genai.Client()
-    print("✅ Gemini API Client initialized successfully.")
-except Exception as e:
-    print("FATAL ERROR: Could not initialize Gemini Client.")
-    print("Ensure GEMINI_API_KEY is correctly set in your .env file.")
-    print(f"Underlying Error: {e}")
-    client = None
-
-# --- Configuration for JSON Output ---
-# This remains critical to prevent JSONDecodeErrors in agent.py
-JSON_CONFIG = GenerateContentConfig(
-    response_mime_type="application/json"
-)
+import sys
+import threading
+from llm_cache import LLMResponseCache, make_key
+from clients import get_genai_client, is_override
+from rate_limit import get_limiter, is_retryable
+from compaction import estimate_tokens
+import metrics
+
+# The shared Gemini client (with a pooled HTTP connection) is created on
+# first use by clients.get_genai_client(), which also loads .env. The
+# google.genai SDK is only imported then, not when this module is imported,
+# and not at all when a stand-in client is installed.
+
+MODEL_NAME = "gemini-2.5-flash"
+
+# The generation config that enforces JSON output. This remains critical
+# to prevent JSONDecodeErrors in agent.py. Cache keys are built from this
+# plain form; the SDK object is only built for the real client.
+JSON_CONFIG = {"response_mime_type": "application/json"}
+
+_json_config = None
+_response_cache = None
+_init_lock = threading.Lock()
+
+
+def get_json_config():
+    """
+    JSON_CONFIG as a google.genai GenerateContentConfig, built on first use.
+    """
+    global _json_config
+    with _init_lock:
+        if _json_config is None:
+            from google.genai.types import GenerateContentConfig
+            _json_config = GenerateContentConfig(**JSON_CONFIG)
+    return _json_config
+
+
+def _config_for(client):
+    # Stand-in clients (clients.set_client_overrides) get the plain dict, so
+    # they run without the SDK installed
+    return JSON_CONFIG if is_override(client) else get_json_config()
+
+
+def _is_api_error(exc) -> bool:
+    # An APIError can only exist once the SDK has been imported
+    errors = sys.modules.get("google.genai.errors")
+    return errors is not None and isinstance(exc, errors.APIError)
+
+
+def get_response_cache() -> LLMResponseCache:
+    """
+    Identical prompts (the OCR markdown is deterministic) are answered from
+    here. Set LLM_CACHE_DB to also persist responses in SQLite across runs.
+    """
+    global _response_cache
+    with _init_lock:
+        if _response_cache is None:
+            _response_cache = LLMResponseCache()
+            metrics.register_collector("llm_cache", _response_cache.stats)
+    return _response_cache
+
+
+def _is_cacheable(response) -> bool:
+    # Only complete JSON is cached: never the structured error strings
+    # produced below, nor truncated or non-JSON output
+    try:
+        parsed = json.loads(response)
+    except (TypeError, ValueError):
+        return False
+    if isinstance(parsed, dict):
+        return "error" not in parsed
+    return isinstance(parsed, list)
+
 
 # ----------------------------------------------------------------
-# Removed the @retry decorator
+# Retries live in rate_limit.py: 429/5xx are retried with backoff and
+# rate_limit.RetriesExhausted is raised once the attempts are used up
 # ----------------------------------------------------------------
 def get_response(prompt: str):
     """
     Generates content from the Gemini model, enforcing JSON output.
+    Responses are memoized on (model, config, prompt) and concurrent identical
+    prompts share a single API call.
     """
+    key = make_key(MODEL_NAME, JSON_CONFIG, prompt)
+    called = []
+
+    def compute():
+        called.append(True)
+        return get_limiter("gemini").call(_generate, prompt, tokens=estimate_tokens(prompt))
+
+    response = get_response_cache().get_or_compute(key, compute, cacheable=_is_cacheable)
+    metrics.increment("llm_cache_misses" if called else "llm_cache_hits")
+    return response
+
+
+async def aget_response(prompt: str):
+    """
+    Async variant of get_response() using the genai async API (client.aio).
+    Shares the response cache and in-flight coalescing with get_response().
+    """
+    key = make_key(MODEL_NAME, JSON_CONFIG, prompt)
+    called = []
+
+    async def acompute():
+        called.append(True)
+        return await get_limiter("gemini").acall(_agenerate, prompt, tokens=estimate_tokens(prompt))
+
+    response = await get_response_cache().aget_or_compute(key, acompute, cacheable=_is_cacheable)
+    metrics.increment("llm_cache_misses" if called else "llm_cache_hits")
+    return response
+
+
+def _note_usage(response):
+    # Prompt/response token counts for the per-document metrics record
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        metrics.note(
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            response_tokens=getattr(usage, "candidates_token_count", None),
+        )
+
+
+def _generate(prompt: str):
+    """
+    Performs the actual Gemini API call.
+    """
+    client = get_genai_client()
     if client is None:
         # If client setup failed due to missing key, return a safe error response
         return '{"error": "API Client Not Initialized due to missing API Key"}' 
 
-    # The actual API call logic
-    # NOTE: The genai client still has some built-in retries for transient errors,
-    # so your code is not totally unprotected.
+    # The actual API call logic. Transient errors are re-raised so the
+    # limiter can back off and retry; permanent ones become an error response.
     try:
         response = client.models.generate_content(
-            model="gemini-2.5-flash",
+            model=MODEL_NAME,
             contents=prompt,
-            config=JSON_CONFIG
+            config=_config_for(client)
         )
+        _note_usage(response)
         return response.text
-    except errors.APIError as api_e:
-        # Catch specific API errors (like 429, 400, 500) and log them
-        print(f"🚨 API Error occurred during generate_content: {api_e}")
-        # Return a structured error to be caught by the calling agent
-        return f'{{"error": "API_CALL_FAILED", "message": "{str(api_e)}"}}'
     except Exception as e:
+        if is_retryable(e):
+            raise
+        if _is_api_error(e):
+            # Catch permanent API errors (like 400, 403) and log them
+            print(f"🚨 API Error occurred during generate_content: {e}")
+            metrics.increment("api_errors")
+            # Return a structured error to be caught by the calling agent
+            return f'{{"error": "API_CALL_FAILED", "message": "{str(e)}"}}'
         # Catch any other unexpected errors
         print(f"🚨 An unexpected error occurred: {e}")
-        return f'{{"error": "UNEXPECTED_ERROR", "message": "{str(e)}"}}'
\ No newline at end of file
+        return f'{{"error": "UNEXPECTED_ERROR", "message": "{str(e)}"}}'
+
+
+async def _agenerate(prompt: str):
+    """
+    Performs the Gemini API call on the async client.
+    """
+    client = get_genai_client()
+    if client is None:
+        return '{"error": "API Client Not Initialized due to missing API Key"}'
+
+    try:
+        response = await client.aio.models.generate_content(
+            model=MODEL_NAME,
+            contents=prompt,
+            config=_config_for(client)
+        )
+        _note_usage(response)
+        return response.text
+    except Exception as e:
+        if is_retryable(e):
+            raise
+        if _is_api_error(e):
+            print(f"🚨 API Error occurred during async generate_content: {e}")
+            metrics.increment("api_errors")
+            return f'{{"error": "API_CALL_FAILED", "message": "{str(e)}"}}'
+        print(f"🚨 An unexpected error occurred: {e}")
+        return f'{{"error": "UNEXPECTED_ERROR", "message": "{str(e)}"}}'
@@ -0,0 +1,359 @@
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# --- Configuration ---
+# METRICS_JSONL: one line per processed document ("" disables the file)
+# METRICS_PORT: serve Prometheus text format on http://localhost:<port>/metrics
+DEFAULT_METRICS_JSONL = Path("agent_outputs") / "metrics.jsonl"
+RESERVOIR_SIZE = 10000   # Most recent samples kept per stage for percentiles
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of an unsorted list (pct in 0-100).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class StageTimings:
+    """
+    Thread-safe collector of per-stage durations (in seconds).
+    Keeps exact count/sum plus a bounded window of recent samples for
+    percentiles, so a long-running monitor does not grow without bound.
+    """
+    def __init__(self, reservoir_size=RESERVOIR_SIZE):
+        self.reservoir_size = reservoir_size
+        self._durations = {}
+        self._counts = {}
+        self._sums = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._durations.get(stage)
+            if samples is None:
+                samples = self._durations[stage] = deque(maxlen=self.reservoir_size)
+            samples.append(seconds)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+            self._sums[stage] = self._sums.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        with self._lock:
+            snapshot = {
+                stage: (list(values), self._counts[stage], self._sums[stage])
+                for stage, values in self._durations.items()
+            }
+        return {
+            stage: {
+                "count": count,
+                "sum": total,
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+            for stage, (values, count, total) in snapshot.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._sums.clear()
+
+
+class Counters:
+    """
+    Thread-safe monotonically increasing counters (retries, cache hits, failures...).
+    """
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+# Process-wide metrics shared by agent(), async_agent() and the batch runner
+timings = StageTimings()
+counters = Counters()
+
+# Extra gauges pulled at export time, e.g. the OCR / LLM cache stats
+_collectors = {}
+
+# Document currently being processed on this thread / asyncio task
+_current_document = contextvars.ContextVar("current_document", default=None)
+_current_stage = contextvars.ContextVar("current_stage", default=None)
+_jsonl_lock = threading.Lock()
+
+# Stage completions are logged as structured records (see structured_log.py)
+_log = logging.getLogger("agent.stages")
+
+
+def current_context():
+    """
+    Returns (doc_id, stage) for the calling thread or task, for log records.
+    """
+    doc = _current_document.get()
+    return (doc.doc_id if doc is not None else None), _current_stage.get()
+
+
+def register_collector(name, collect):
+    """
+    Registers a callable returning a dict of numeric gauges, exported as
+    agent_<name>_<key>.
+    """
+    _collectors[name] = collect
+
+
+class DocumentMetrics:
+    """
+    Per-document record: stage durations, sizes, token counts and counters.
+    Written as one JSON line when the document finishes.
+    """
+    def __init__(self, doc_id):
+        self.doc_id = doc_id
+        self.started_at = time.time()
+        self.stages = {}
+        self.values = {}
+        self.counters = {}
+
+    def add_stage(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "doc_id": self.doc_id,
+            "started_at": self.started_at,
+            "stages": {k: round(v, 4) for k, v in self.stages.items()},
+            **self.values,
+            "counters": self.counters,
+        }
+
+
+@contextmanager
+def track_document(doc_id):
+    """
+    Makes doc_id the current document for stage()/note()/increment() calls
+    made on this thread or task, and writes its record on exit.
+    """
+    doc = DocumentMetrics(doc_id)
+    start = time.perf_counter()
+    try:
+        with document_scope(doc):
+            yield doc
+    finally:
+        finish_document(doc, time.perf_counter() - start)
+
+
+@contextmanager
+def document_scope(doc):
+    """
+    Makes doc the current document without finishing it on exit, for work on
+    one document that is split into several steps (see agent.agent_packed).
+    """
+    token = _current_document.set(doc)
+    try:
+        yield doc
+    finally:
+        _current_document.reset(token)
+
+
+def finish_document(doc, seconds):
+    """
+    Records the document's total time and writes its record.
+    """
+    timings.record("total", seconds)
+    doc.add_stage("total", seconds)
+    _write_jsonl(doc.to_dict())
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a pipeline stage into the global histograms and the current document.
+    """
+    token = _current_stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _current_stage.reset(token)
+        record_stage(name, seconds)
+        _log.info("stage %s finished in %.3fs", name, seconds,
+                  extra={"stage": name, "duration": round(seconds, 4)})
+
+
+def record_stage(name, seconds):
+    timings.record(name, seconds)
+    doc = _current_document.get()
+    if doc is not None:
+        doc.add_stage(name, seconds)
+
+
+def note(**values):
+    """
+    Attaches values (image_bytes, markdown_chars, prompt_tokens, ...) to the
+    current document. Numeric values for the same key are summed.
+    """
+    doc = _current_document.get()
+    if doc is None:
+        return
+    for key, value in values.items():
+        if value is None:
+            continue
+        previous = doc.values.get(key)
+        if isinstance(previous, (int, float)) and isinstance(value, (int, float)):
+            doc.values[key] = previous + value
+        else:
+            doc.values[key] = value
+    for key in ("prompt_tokens", "response_tokens"):
+        if values.get(key):
+            counters.increment(key, values[key])
+
+
+def increment(name, amount=1):
+    counters.increment(name, amount)
+    doc = _current_document.get()
+    if doc is not None:
+        doc.counters[name] = doc.counters.get(name, 0) + amount
+
+
+def _write_jsonl(record):
+    path = os.getenv("METRICS_JSONL", str(DEFAULT_METRICS_JSONL))
+    if not path:
+        return
+    line = json.dumps(record) + "\n"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _jsonl_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        print(f"⚠️ Could not write metrics record: {e}")
+
+
+# --- Export ---
+def snapshot() -> dict:
+    collected = {}
+    for name, collect in list(_collectors.items()):
+        try:
+            collected[name] = collect()
+        except Exception:
+            continue
+    return {
+        "timestamp": time.time(),
+        "stages": timings.summary(),
+        "counters": counters.snapshot(),
+        "gauges": collected,
+    }
+
+
+def prometheus_text() -> str:
+    """
+    Renders the current metrics in the Prometheus text exposition format.
+    """
+    data = snapshot()
+    lines = [
+        "# HELP agent_stage_duration_seconds Pipeline stage latency.",
+        "# TYPE agent_stage_duration_seconds summary",
+    ]
+    for stage_name, stats in data["stages"].items():
+        for q in ("50", "95", "99"):
+            lines.append(
+                f'agent_stage_duration_seconds{{stage="{stage_name}",quantile="0.{q}"}} {stats["p" + q]:.6f}'
+            )
+        lines.append(f'agent_stage_duration_seconds_sum{{stage="{stage_name}"}} {stats["sum"]:.6f}')
+        lines.append(f'agent_stage_duration_seconds_count{{stage="{stage_name}"}} {stats["count"]}')
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"# TYPE agent_{name}_total counter")
+        lines.append(f"agent_{name}_total {value}")
+    for group, values in sorted(data["gauges"].items()):
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"agent_{group}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the processing log
+
+
+def start_metrics_server(port=None):
+    """
+    Serves /metrics on localhost if METRICS_PORT (or port) is set.
+    Returns the server, or None when disabled.
+    """
+    port = port or os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("127.0.0.1", int(port)), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    print(f"📈 Prometheus metrics on http://127.0.0.1:{port}/metrics")
+    return server
+
+
+def load_jsonl(path, offset=0):
+    """
+    Reads document records appended after offset. Returns (records, new_offset).
+    Used by the dashboard to follow the metrics file incrementally.
+    """
+    records = []
+    try:
+        with open(path, "rb") as f:
+            if offset > os.fstat(f.fileno()).st_size:
+                offset = 0  # File was truncated or replaced, start over
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written line, pick it up next time
+                offset += len(line)
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        return [], 0
+    return records, offset
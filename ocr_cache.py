@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+# --- Configuration ---
+# All values can be overridden from the .env file
+DEFAULT_CACHE_DIR = Path(".cache") / "ocr"
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024        # 500 MB of markdown
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600     # 30 days
+EVICT_LOW_WATER = 0.9                        # Eviction frees space down to this share of max_bytes
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path) -> str:
+    """
+    Hashes a file in chunks so large documents are never fully loaded in memory.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Persistent, content-addressed cache for Document Intelligence output.
+
+    Entries are keyed by the SHA-256 of the document bytes plus the model id and
+    output format, so renaming or re-dropping a file is still a hit. Each entry
+    is a single markdown file; its mtime is refreshed on every hit and used for
+    least-recently-used eviction once the cache grows past max_bytes.
+    """
+    def __init__(self, cache_dir=None, max_bytes=None, max_age_seconds=None):
+        self.cache_dir = Path(cache_dir or os.getenv("OCR_CACHE_DIR", DEFAULT_CACHE_DIR))
+        self.max_bytes = int(max_bytes or os.getenv("OCR_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.max_age_seconds = float(
+            max_age_seconds or os.getenv("OCR_CACHE_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS)
+        )
+        self.enabled = os.getenv("OCR_CACHE_ENABLED", "1") != "0"
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._approx_bytes = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # One full scan at startup; afterwards the size is tracked incrementally
+        self.evict()
+
+    @staticmethod
+    def make_key(content_hash: str, model_id: str, output_format: str) -> str:
+        raw = f"{content_hash}:{model_id}:{output_format}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        # Two-level fan-out keeps directory listings small on large caches
+        return self.cache_dir / key[:2] / f"{key}.md"
+
+    def get(self, key: str):
+        """
+        Returns the cached markdown, or None on a miss or an expired entry.
+        """
+        if not self.enabled:
+            return None
+        path = self._entry_path(key)
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                with self._lock:
+                    self.misses += 1
+                    self.evictions += 1
+                return None
+            markdown = path.read_text(encoding="utf-8")
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return markdown
+
+    def put(self, key: str, markdown: str):
+        if not self.enabled:
+            return
+        path = self._entry_path(key)
+        os.makedirs(path.parent, exist_ok=True)
+        # Write to a temp file and rename so readers never see partial entries
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(markdown, encoding="utf-8")
+        size = tmp_path.stat().st_size
+        try:
+            # An overwrite replaces the old entry's bytes rather than adding to them
+            old_size = path.stat().st_size
+        except FileNotFoundError:
+            old_size = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._approx_bytes += size - old_size
+            over_budget = self._approx_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops expired entries, then, if the cache is over max_bytes, the
+        least recently used ones until it is back under the low-water mark,
+        so the next few puts do not trigger another scan.
+        """
+        now = time.time()
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.md"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                with self._lock:
+                    self.evictions += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        if total > self.max_bytes:
+            low_water = self.max_bytes * EVICT_LOW_WATER
+            for _, size, path in sorted(entries):
+                path.unlink(missing_ok=True)
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+                if total <= low_water:
+                    break
+        with self._lock:
+            self._approx_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "size_bytes": self._approx_bytes,
+            }
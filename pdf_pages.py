@@ -0,0 +1,85 @@
+import importlib.util
+import os
+import tempfile
+import threading
+
+# pypdf is optional: with it, page ranges are split into small local PDFs;
+# without it, PDFs are sent to Document Intelligence as one request. It is
+# only imported when a PDF is actually split or counted.
+#
+# PdfReader is always given an open file, never a path: with a path it
+# copies the whole file into memory, which adds up across large PDFs and
+# concurrent ranges. From a file it seeks and reads objects on demand.
+
+
+def can_split() -> bool:
+    # Looks pypdf up without importing it
+    return importlib.util.find_spec("pypdf") is not None
+
+
+def count_pages(path) -> int:
+    """
+    Number of pages in a PDF, or 0 if pypdf is missing or cannot read it.
+    """
+    if not can_split():
+        return 0
+    from pypdf import PdfReader
+
+    try:
+        with open(path, "rb") as f:
+            return len(PdfReader(f).pages)
+    except Exception:
+        return 0
+
+
+def page_ranges(page_count, pages_per_range):
+    """
+    1-based inclusive (first, last) ranges covering every page.
+    """
+    return [
+        (first, min(first + pages_per_range - 1, page_count))
+        for first in range(1, page_count + 1, pages_per_range)
+    ]
+
+
+class PdfSplitter:
+    """
+    Writes page ranges of one PDF to small temporary files. The PDF is
+    opened and parsed once and shared by every range; writes are
+    serialized, since the reader seeks in a single file. Requires pypdf.
+    """
+    def __init__(self, path):
+        from pypdf import PdfReader
+
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._reader = PdfReader(self._file)
+        except Exception:
+            self._file.close()
+            raise
+        self._lock = threading.Lock()
+
+    def write_range(self, first, last) -> str:
+        """
+        Writes pages first..last (1-based, inclusive) to a temporary file and
+        returns its path. The caller removes the file.
+        """
+        from pypdf import PdfWriter
+
+        writer = PdfWriter()
+        fd, out_path = tempfile.mkstemp(suffix=f"-p{first}-{last}.pdf")
+        with self._lock, os.fdopen(fd, "wb") as f:
+            for page in self._reader.pages[first - 1:last]:
+                writer.add_page(page)
+            writer.write(f)
+        return out_path
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
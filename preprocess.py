@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import metrics
+
+# Pillow is imported inside the worker functions: preprocessing is off by
+# default, and the agent should not pay for the import at startup.
+
+# --- Configuration ---
+# All values can be overridden from the .env file. Preprocessing is off
+# unless PREPROCESS_ENABLED=1.
+DEFAULT_MAX_LONG_EDGE = 2000     # Pixels; DI reads receipt text well below this
+DEFAULT_TARGET_DPI = 200         # Scans reporting a higher DPI are scaled down to it
+DEFAULT_JPEG_QUALITY = 80
+DEFAULT_WORKERS = 2
+DEFAULT_WORK_DIR = Path(".cache") / "preprocessed"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Receipt detection runs on a small, denoised thumbnail
+CROP_THUMB_SIZE = 256
+CROP_PADDING = 0.02              # Fraction of each side kept around the receipt
+CROP_MIN_AREA = 0.15             # Smaller boxes are treated as a failed detection
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() not in ("0", "false", "no", "")
+
+
+def _receipt_bbox(gray):
+    """
+    Bounding box of the receipt in a grayscale image, or None to keep it whole.
+    The paper is the bright region against a darker background; when the
+    paper fills the frame (a scan), the box around the ink is used instead.
+    """
+    from PIL import ImageFilter, ImageStat
+
+    thumb = gray.copy()
+    thumb.thumbnail((CROP_THUMB_SIZE, CROP_THUMB_SIZE))
+    thumb = thumb.filter(ImageFilter.MedianFilter(5))
+    threshold = ImageStat.Stat(thumb).mean[0]
+    thumb_area = thumb.width * thumb.height
+
+    paper = thumb.point(lambda v: 255 if v > threshold else 0).filter(ImageFilter.MinFilter(3))
+    bbox = paper.getbbox()
+    if bbox is not None and _area(bbox) > 0.95 * thumb_area:
+        ink = thumb.point(lambda v: 255 if v < threshold * 0.6 else 0)
+        bbox = ink.getbbox()
+    if bbox is None or _area(bbox) < CROP_MIN_AREA * thumb_area:
+        return None
+
+    scale_x = gray.width / thumb.width
+    scale_y = gray.height / thumb.height
+    pad_x = int(gray.width * CROP_PADDING)
+    pad_y = int(gray.height * CROP_PADDING)
+    left, top, right, bottom = bbox
+    return (
+        max(0, int(left * scale_x) - pad_x),
+        max(0, int(top * scale_y) - pad_y),
+        min(gray.width, int(right * scale_x) + pad_x),
+        min(gray.height, int(bottom * scale_y) + pad_y),
+    )
+
+
+def _area(bbox):
+    return (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+
+
+def preprocess_image(src_path, dst_path, options) -> dict:
+    """
+    Auto-orients, grayscales, crops and downsamples src_path, then writes it
+    to dst_path as a JPEG. Runs in a worker process, so it only takes and
+    returns picklable values.
+    """
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    with Image.open(src_path) as original:
+        dpi = original.info.get("dpi", (0, 0))[0] or 0
+        image = ImageOps.exif_transpose(original)
+        size_before = image.size
+        if options["grayscale"]:
+            image = image.convert("L")
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        cropped = False
+        if options["crop"]:
+            bbox = _receipt_bbox(image if image.mode == "L" else image.convert("L"))
+            if bbox is not None and bbox != (0, 0, image.width, image.height):
+                image = image.crop(bbox)
+                cropped = True
+
+        scale = 1.0
+        if options["target_dpi"] and dpi > options["target_dpi"]:
+            scale = options["target_dpi"] / dpi
+        long_edge = max(image.size) * scale
+        if options["max_long_edge"] and long_edge > options["max_long_edge"]:
+            scale *= options["max_long_edge"] / long_edge
+        if scale < 1.0:
+            image = image.resize(
+                (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                Image.LANCZOS,
+            )
+
+        image.save(dst_path, "JPEG", quality=options["quality"], optimize=True)
+
+    return {
+        "before_bytes": os.path.getsize(src_path),
+        "after_bytes": os.path.getsize(dst_path),
+        "size_before": size_before,
+        "size_after": image.size,
+        "cropped": cropped,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class ImagePreprocessor:
+    """
+    Optional stage that shrinks receipt photos before they are uploaded to
+    Document Intelligence. The Pillow work runs in a process pool so it does
+    not hold the GIL of the worker threads.
+    """
+    def __init__(self, enabled=None, max_long_edge=None, target_dpi=None, quality=None,
+                 grayscale=None, crop=None, workers=None, work_dir=None):
+        self.enabled = _env_flag("PREPROCESS_ENABLED", "0") if enabled is None else enabled
+        self.options = {
+            "max_long_edge": max_long_edge if max_long_edge is not None
+            else int(os.getenv("PREPROCESS_MAX_LONG_EDGE", DEFAULT_MAX_LONG_EDGE)),
+            "target_dpi": target_dpi if target_dpi is not None
+            else int(os.getenv("PREPROCESS_TARGET_DPI", DEFAULT_TARGET_DPI)),
+            "quality": quality if quality is not None
+            else int(os.getenv("PREPROCESS_JPEG_QUALITY", DEFAULT_JPEG_QUALITY)),
+            "grayscale": _env_flag("PREPROCESS_GRAYSCALE", "1") if grayscale is None else grayscale,
+            "crop": _env_flag("PREPROCESS_CROP", "1") if crop is None else crop,
+        }
+        self.workers = workers or int(os.getenv("PREPROCESS_WORKERS", DEFAULT_WORKERS))
+        self.work_dir = Path(work_dir or os.getenv("PREPROCESS_DIR", DEFAULT_WORK_DIR))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def signature(self) -> str:
+        """
+        Suffix for the OCR cache key, so results of differently preprocessed
+        uploads are never mixed. Empty when preprocessing is disabled.
+        """
+        if not self.enabled:
+            return ""
+        return "+pre:" + json.dumps(self.options, sort_keys=True)
+
+    def applies_to(self, path) -> bool:
+        return self.enabled and Path(path).suffix.lower() in IMAGE_EXTENSIONS
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _new_output(self) -> str:
+        os.makedirs(self.work_dir, exist_ok=True)
+        fd, out_path = tempfile.mkstemp(suffix=".jpg", dir=self.work_dir)
+        os.close(fd)
+        return out_path
+
+    def prepare(self, path) -> str:
+        """
+        Returns the path to upload: a preprocessed copy, or path itself when
+        preprocessing is off, fails, or would not make the file smaller.
+        """
+        if not self.applies_to(path):
+            return path
+        out_path = self._new_output()
+        try:
+            with metrics.stage("preprocess"):
+                stats = self._pool().submit(preprocess_image, str(path), out_path, self.options).result()
+        except Exception as e:
+            print(f"⚠️ Preprocessing failed for {Path(path).name}, uploading the original: {e}")
+            self.cleanup(out_path, path)
+            return path
+        return self._finish(path, out_path, stats)
+
+    async def aprepare(self, path) -> str:
+        if not self.applies_to(path):
+            return path
+        out_path = await asyncio.to_thread(self._new_output)
+        try:
+            with metrics.stage("preprocess"):
+                stats = await asyncio.wrap_future(
+                    self._pool().submit(preprocess_image, str(path), out_path, self.options)
+                )
+        except Exception as e:
+            print(f"⚠️ Preprocessing failed for {Path(path).name}, uploading the original: {e}")
+            self.cleanup(out_path, path)
+            return path
+        return self._finish(path, out_path, stats)
+
+    def _finish(self, path, out_path, stats):
+        before, after = stats["before_bytes"], stats["after_bytes"]
+        metrics.note(upload_bytes_before=before)
+        if after >= before:
+            metrics.note(upload_bytes_after=before)
+            self.cleanup(out_path, path)
+            return path
+        metrics.note(upload_bytes_after=after)
+        metrics.increment("preprocess_bytes_saved", before - after)
+        print(f"🗜️ Preprocessed {Path(path).name}: {before / 1024:.0f} KB -> {after / 1024:.0f} KB "
+              f"({stats['size_before'][0]}x{stats['size_before'][1]} -> "
+              f"{stats['size_after'][0]}x{stats['size_after'][1]}{', cropped' if stats['cropped'] else ''})")
+        return out_path
+
+    @staticmethod
+    def cleanup(upload_path, original_path):
+        """
+        Removes a preprocessed copy once it has been uploaded.
+        """
+        if str(upload_path) == str(original_path):
+            return
+        try:
+            os.remove(upload_path)
+        except OSError:
+            pass
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_preprocessor = None
+_preprocessor_lock = threading.Lock()
+
+
+def get_preprocessor() -> ImagePreprocessor:
+    """
+    Returns the process-wide preprocessor, configured from the environment.
+    """
+    global _preprocessor
+    with _preprocessor_lock:
+        if _preprocessor is None:
+            _preprocessor = ImagePreprocessor()
+    return _preprocessor
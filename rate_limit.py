@@ -0,0 +1,290 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+from worker_pool import StageLimits
+
+# --- Configuration ---
+# All values can be overridden from the .env file, e.g. GEMINI_RPM=2000
+DEFAULT_LIMITS = {
+    "azure_di": {"rpm": 900, "tpm": None},        # S0 tier: 15 requests/second
+    "gemini": {"rpm": 1000, "tpm": 1_000_000},
+}
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_BASE_DELAY = 1.0     # Seconds, doubled on every attempt
+DEFAULT_MAX_DELAY = 60.0
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class RetriesExhausted(Exception):
+    """
+    Raised when a call still fails after the last retry. The document is then
+    sent to the dead-letter queue instead of being saved as a failure.
+    """
+    def __init__(self, service, attempts, last_error):
+        super().__init__(f"{service}: gave up after {attempts} attempts: {last_error}")
+        self.service = service
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+def status_of(exc):
+    """
+    HTTP status of an Azure (status_code) or google-genai (code) error, if any.
+    """
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(exc) -> bool:
+    status = status_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Connection resets, timeouts and DNS hiccups carry no status code
+    name = type(exc).__name__
+    return name in ("ServiceRequestError", "ServiceResponseError", "ConnectionError",
+                    "ConnectError", "ReadTimeout", "ConnectTimeout", "TimeoutError")
+
+
+def retry_after_of(exc):
+    """
+    Seconds requested by a Retry-After header on the error's response, if any.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("Retry-After") is not None:
+            return max(0.0, float(headers["Retry-After"]))
+        if headers.get("retry-after-ms") is not None:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000.0)
+    except (TypeError, ValueError):
+        pass  # HTTP-date form, fall back to plain backoff
+    return None
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at rate_per_minute.
+    acquire() waits until the requested amount is available.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount):
+        """
+        Takes amount tokens (possibly going negative) and returns how long the
+        caller must wait before proceeding.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, amount=1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, amount=1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: grows by one after a full window of successes,
+    halves on throttling. Never exceeds the configured stage concurrency.
+    """
+    def __init__(self, maximum, minimum=1):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = self.maximum
+        self._in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def _try_enter(self):
+        with self._cond:
+            if self._in_flight < self.limit:
+                self._in_flight += 1
+                return True
+            return False
+
+    def enter(self):
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    async def aenter(self):
+        # Poll instead of blocking the event loop on the condition variable
+        while not self._try_enter():
+            await asyncio.sleep(0.05)
+
+    def leave(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify()
+
+    def on_throttle(self):
+        with self._cond:
+            new_limit = max(self.minimum, self.limit // 2)
+            if new_limit != self.limit:
+                print(f"⚠️ Throttled: lowering concurrency {self.limit} -> {new_limit}")
+            self.limit = new_limit
+            self._successes = 0
+
+
+class ServiceLimiter:
+    """
+    Rate limiting, adaptive concurrency and retry with exponential backoff
+    and full jitter (honoring Retry-After) for one external service.
+    """
+    def __init__(self, service, rpm=None, tpm=None, max_concurrency=None,
+                 max_attempts=None, base_delay=None, max_delay=None):
+        defaults = DEFAULT_LIMITS.get(service, {"rpm": 600, "tpm": None})
+        prefix = service.upper()
+        self.service = service
+        rpm = rpm or _env_float(f"{prefix}_RPM", defaults["rpm"])
+        tpm = tpm or _env_float(f"{prefix}_TPM", defaults["tpm"])
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        if max_concurrency is None:
+            max_concurrency = StageLimits().limits.get(service, 4)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_attempts = int(max_attempts or _env_float("RETRY_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        self.base_delay = base_delay or _env_float("RETRY_BASE_DELAY", DEFAULT_BASE_DELAY)
+        self.max_delay = max_delay or _env_float("RETRY_MAX_DELAY", DEFAULT_MAX_DELAY)
+
+    def backoff(self, attempt, exc):
+        """
+        Full-jitter exponential backoff; a Retry-After header sets the floor.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = retry_after_of(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _handle_failure(self, attempt, exc):
+        """
+        Returns the delay before the next attempt, or raises when the error is
+        permanent or the attempts are used up.
+        """
+        if not is_retryable(exc):
+            raise exc
+        if status_of(exc) == 429:
+            self.concurrency.on_throttle()
+            metrics.increment(f"{self.service}_throttled")
+        if attempt + 1 >= self.max_attempts:
+            metrics.increment(f"{self.service}_retries_exhausted")
+            raise RetriesExhausted(self.service, attempt + 1, exc) from exc
+        delay = self.backoff(attempt, exc)
+        metrics.increment("retries")
+        print(f"🔁 {self.service} call failed ({status_of(exc) or type(exc).__name__}), "
+              f"retry {attempt + 1}/{self.max_attempts - 1} in {delay:.1f}s")
+        return delay
+
+    @contextmanager
+    def _slot(self, tokens):
+        self.requests.acquire()
+        if self.tokens is not None and tokens:
+            self.tokens.acquire(tokens)
+        self.concurrency.enter()
+        try:
+            yield
+        finally:
+            self.concurrency.leave()
+
+    @asynccontextmanager
+    async def _aslot(self, tokens):
+        await self.requests.aacquire()
+        if self.tokens is not None and tokens:
+            await self.tokens.aacquire(tokens)
+        await self.concurrency.aenter()
+        try:
+            yield
+        finally:
+            self.concurrency.leave()
+
+    def call(self, fn, *args, tokens=0, **kwargs):
+        for attempt in range(self.max_attempts):
+            try:
+                with self._slot(tokens):
+                    result = fn(*args, **kwargs)
+                self.concurrency.on_success()
+                return result
+            except Exception as e:
+                time.sleep(self._handle_failure(attempt, e))
+
+    async def acall(self, fn, *args, tokens=0, **kwargs):
+        for attempt in range(self.max_attempts):
+            try:
+                async with self._aslot(tokens):
+                    result = await fn(*args, **kwargs)
+                self.concurrency.on_success()
+                return result
+            except Exception as e:
+                await asyncio.sleep(self._handle_failure(attempt, e))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(service) -> ServiceLimiter:
+    """
+    Returns the process-wide limiter for a service ("azure_di" or "gemini").
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(service)
+        if limiter is None:
+            limiter = _limiters[service] = ServiceLimiter(service)
+    return limiter
+
+
+def reset_limiters():
+    """
+    Drops the limiters so the next get_limiter() call re-reads the
+    environment. Used by the benchmarks between runs.
+    """
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,125 @@
+import math
+
+# Status filters offered by the dashboard, over results_store.check_status values
+STATUS_FILTERS = {
+    "All": None,
+    "Passed": {"passed"},
+    "Failed check": {"failed"},
+    "JSON_FAIL": {"JSON_FAIL"},
+    "PROCESS_FAIL": {"PROCESS_FAIL"},
+    "Any failure": {"failed", "JSON_FAIL", "PROCESS_FAIL"},
+}
+
+
+def _numeric(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return None if math.isnan(value) else float(value)
+
+
+class ResultsIndex:
+    """
+    In-memory columnar index of the dashboard's results table. Each column is
+    a plain list indexed by row number, so a sort, a status filter or a file
+    name search is one pass over a list rather than over Treeview items.
+    The table only ever materializes the rows of view() that are on screen.
+
+    Rows are (file name, before tax, after tax, check) display tuples plus the
+    results store check status. A file seen again is updated in place.
+    """
+    COLUMNS = ("file", "total_pre_tax", "total_post_tax", "check_passed")
+
+    def __init__(self):
+        self.version = 0
+        # Bumped when an existing row changes; appends alone keep cached sorts mergeable
+        self._rewrites = 0
+        self.values = []
+        self.statuses = []
+        self._lower_names = []
+        self._positions = {}
+        # Sort keys per column; None marks values that sort after all others
+        self._keys = {column: [] for column in self.COLUMNS}
+        self._orders = {}
+        self._view_key = None
+        self._view = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def upsert(self, values, status):
+        values = tuple(values)
+        keys = (str(values[0]).lower(), _numeric(values[1]), _numeric(values[2]), str(values[3]))
+        row = self._positions.get(values[0])
+        if row is None:
+            self._positions[values[0]] = len(self.values)
+            self.values.append(values)
+            self.statuses.append(status)
+            self._lower_names.append(keys[0])
+            for column, key in zip(self.COLUMNS, keys):
+                self._keys[column].append(key)
+        else:
+            self.values[row] = values
+            self.statuses[row] = status
+            for column, key in zip(self.COLUMNS, keys):
+                self._keys[column][row] = key
+            self._rewrites += 1
+        self.version += 1
+
+    def _order(self, column, descending):
+        """
+        Row numbers sorted by one column, cached until the data changes.
+        Rows without a value for the column come last in either direction.
+        If rows were only appended since the cached sort, the new rows are
+        added to the sorted run and Timsort merges them in linear time.
+        """
+        keys = self._keys[column]
+        cached = self._orders.get((column, descending))
+        if cached is not None and cached["version"] == self.version:
+            return cached["order"]
+        if cached is not None and cached["rewrites"] == self._rewrites:
+            first_new = cached["length"]
+            present, missing = cached["present"], cached["missing"]
+        else:
+            first_new = 0
+            present, missing = [], []
+        new_rows = range(first_new, len(keys))
+        if None in keys[first_new:]:
+            present = present + [row for row in new_rows if keys[row] is not None]
+            missing = missing + [row for row in new_rows if keys[row] is None]
+        else:
+            present = present + list(new_rows)
+        present.sort(key=keys.__getitem__, reverse=descending)
+        order = present + missing
+        self._orders[(column, descending)] = {
+            "version": self.version, "rewrites": self._rewrites, "length": len(keys),
+            "present": present, "missing": missing, "order": order,
+        }
+        return order
+
+    def view(self, sort_column=None, descending=False, status_filter="All", search="") -> list:
+        """
+        Row numbers to display, in order: sorted, then filtered on check status
+        and on a case-insensitive substring of the file name. Repeated calls
+        with the same arguments and no new data return the cached list.
+        """
+        search = search.strip().lower()
+        view_key = (self.version, sort_column, descending, status_filter, search)
+        if view_key == self._view_key:
+            return self._view
+
+        rows = self._order(sort_column, descending) if sort_column else range(len(self.values))
+        allowed = STATUS_FILTERS.get(status_filter)
+        if allowed is not None:
+            statuses = self.statuses
+            rows = [row for row in rows if statuses[row] in allowed]
+        if search:
+            names = self._lower_names
+            rows = [row for row in rows if search in names[row]]
+        self._view_key, self._view = view_key, list(rows)
+        return self._view
+
+    def window(self, view, first, count) -> list:
+        """
+        Display tuples for view[first:first + count].
+        """
+        return [self.values[row] for row in view[first:first + count]]
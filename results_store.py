@@ -0,0 +1,198 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+# --- Configuration ---
+DEFAULT_DB_PATH = Path("agent_outputs") / "results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name        TEXT NOT NULL UNIQUE,
+    content_hash     TEXT,
+    processed_at     REAL NOT NULL,
+    check_status     TEXT NOT NULL,
+    total_before_tax REAL,
+    total_after_tax  REAL,
+    data             TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_content_hash ON results (content_hash);
+CREATE INDEX IF NOT EXISTS idx_results_processed_at ON results (processed_at);
+CREATE INDEX IF NOT EXISTS idx_results_check_status ON results (check_status);
+"""
+
+
+def check_status(record: dict) -> str:
+    """
+    Classifies a record as passed / failed / JSON_FAIL / PROCESS_FAIL.
+    """
+    before_tax = record.get('total_amount_before_tax')
+    if isinstance(before_tax, str) and before_tax.endswith('_FAIL'):
+        return before_tax
+    return "passed" if record.get('internal_check_passed') else "failed"
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResultsStore:
+    """
+    Consolidated SQLite store of extraction results, indexed by file name,
+    content hash, processing time and check status.
+
+    Re-processing a file replaces its row in a single transaction and gives it
+    a new, larger id, so readers can poll changes_since(last_id) instead of
+    re-reading everything.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = str(db_path or os.getenv("RESULTS_DB", DEFAULT_DB_PATH))
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL lets the dashboard read while the agent writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def save(self, record: dict, content_hash=None, processed_at=None) -> int:
+        """
+        Atomically inserts or replaces the result for record['file_name'].
+        Returns the new row id.
+        """
+        row = (
+            record['file_name'],
+            content_hash,
+            processed_at or time.time(),
+            check_status(record),
+            _as_float(record.get('total_amount_before_tax')),
+            _as_float(record.get('total_amount_after_tax')),
+            json.dumps(record),
+        )
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO results (file_name, content_hash, processed_at, check_status, "
+                "total_before_tax, total_after_tax, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            return cursor.lastrowid
+
+    def get(self, file_name):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM results WHERE file_name = ?", (file_name,)).fetchone()
+        return dict(row) if row else None
+
+    def get_by_hash(self, content_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM results WHERE content_hash = ? ORDER BY id DESC LIMIT 1", (content_hash,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def changes_since(self, last_id=0, limit=1000) -> list:
+        """
+        Rows written after last_id, oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM results WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def query(self, status=None, since=None, limit=None) -> list:
+        sql = "SELECT * FROM results WHERE 1=1"
+        params = []
+        if status is not None:
+            sql += " AND check_status = ?"
+            params.append(status)
+        if since is not None:
+            sql += " AND processed_at >= ?"
+            params.append(since)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(r) for r in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def aggregates(self) -> dict:
+        """
+        Totals and per-status counts computed by SQLite, not by reading files.
+        """
+        with self._lock:
+            totals = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(total_before_tax), 0), COALESCE(SUM(total_after_tax), 0) "
+                "FROM results"
+            ).fetchone()
+            statuses = self._conn.execute(
+                "SELECT check_status, COUNT(*) FROM results GROUP BY check_status"
+            ).fetchall()
+        return {
+            "count": totals[0],
+            "total_before_tax": round(totals[1], 2),
+            "total_after_tax": round(totals[2], 2),
+            "by_status": {status: n for status, n in statuses},
+        }
+
+    def import_json_folder(self, folder) -> int:
+        """
+        One-time migration of existing per-file JSON outputs into the store.
+        """
+        imported = 0
+        for path in sorted(Path(folder).glob("*.json")):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"⚠️ Skipped {path.name}: {e}")
+                continue
+            if not isinstance(record, dict):
+                continue
+            record.setdefault('file_name', path.name)
+            self.save(record, processed_at=path.stat().st_mtime)
+            imported += 1
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ResultsStore:
+    """
+    Returns the process-wide results store, opening it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultsStore()
+    return _store
+
+
+if __name__ == "__main__":
+    # Usage: python results_store.py import [agent_outputs]
+    if len(sys.argv) >= 2 and sys.argv[1] == "import":
+        folder = sys.argv[2] if len(sys.argv) > 2 else "agent_outputs"
+        store = ResultsStore()
+        print(f"✅ Imported {store.import_json_folder(folder)} result(s) into {store.db_path}")
+        print(store.aggregates())
+    else:
+        print("Usage: python results_store.py import [folder]")
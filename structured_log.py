@@ -0,0 +1,276 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+import metrics
+
+# --- Configuration ---
+# All values can be overridden from the .env file
+DEFAULT_LOG_FILE = Path("agent_outputs") / "processing_log.jsonl"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024   # Rotate at 10 MB ...
+DEFAULT_BACKUP_COUNT = 5               # ... keeping 5 old files
+FLUSH_INTERVAL_SECONDS = 0.5           # Disk flushes are batched, at most one per interval
+FLUSH_MAX_RECORDS = 200
+
+LOGGER_NAME = "agent"
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, thread, msg and, when known,
+    doc_id, stage and duration.
+    """
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key in ("doc_id", "stage", "duration"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Stamps records with the document and stage active on the emitting thread.
+    Runs in the producer thread, before the record is queued.
+    """
+    def filter(self, record):
+        doc_id, stage = metrics.current_context()
+        if getattr(record, "doc_id", None) is None:
+            record.doc_id = doc_id
+        if getattr(record, "stage", None) is None:
+            record.stage = stage
+        return True
+
+
+class BatchedFlushMixin:
+    """
+    Makes a StreamHandler flush at most once per interval (or every N records)
+    instead of after every record. The queue listener forces a flush when idle.
+    """
+    def _init_batching(self):
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        self._pending += 1
+        if self._pending >= FLUSH_MAX_RECORDS or time.monotonic() - self._last_flush >= FLUSH_INTERVAL_SECONDS:
+            self.force_flush()
+
+    def force_flush(self):
+        self.acquire()
+        try:
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+        finally:
+            self.release()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.force_flush()
+        super().close()
+
+
+class BatchedRotatingFileHandler(BatchedFlushMixin, logging.handlers.RotatingFileHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_batching()
+
+
+class BatchedTimedRotatingFileHandler(BatchedFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_batching()
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that flushes its handlers whenever the queue goes idle,
+    so batched records never sit unwritten for longer than the flush interval.
+    """
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block=block, timeout=FLUSH_INTERVAL_SECONDS)
+            except queue.Empty:
+                for handler in self.handlers:
+                    if hasattr(handler, "force_flush"):
+                        handler.force_flush()
+
+
+class StdoutToLog:
+    """
+    Replacement for the old FileLogger: echoes print() output to the terminal
+    and forwards each complete line to the logger. Logging only enqueues the
+    record, so no worker thread ever waits on a disk flush. Partial lines are
+    buffered per thread so concurrent workers never interleave mid-line.
+    """
+    def __init__(self, terminal, logger):
+        self.terminal = terminal
+        self.logger = logger
+        self._local = threading.local()
+
+    def write(self, message):
+        self.terminal.write(message)
+        buffer = getattr(self._local, "buffer", "") + message
+        *lines, self._local.buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                self.logger.log(_level_for(line), line)
+        return len(message)
+
+    def flush(self):
+        self.terminal.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.terminal, name)
+
+
+def _level_for(line):
+    # The agent's prints already carry their severity as an emoji prefix
+    if line.startswith(("❌", "🚨")) or "ERROR" in line[:20]:
+        return logging.ERROR
+    if line.startswith(("⚠️", "⏳")):
+        return logging.WARNING
+    return logging.INFO
+
+
+_listener = None
+
+
+def setup_logging(log_file=None):
+    """
+    Routes print() output and the 'agent' logger through a queue to a
+    rotating JSON-lines file. Size rotation by default; set LOG_ROTATE_WHEN
+    (e.g. 'midnight') for time-based rotation. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return logging.getLogger(LOGGER_NAME)
+
+    log_file = Path(log_file or os.getenv("LOG_FILE", DEFAULT_LOG_FILE))
+    os.makedirs(log_file.parent, exist_ok=True)
+    backup_count = int(os.getenv("LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT))
+    rotate_when = os.getenv("LOG_ROTATE_WHEN")
+    if rotate_when:
+        file_handler = BatchedTimedRotatingFileHandler(
+            log_file, when=rotate_when, backupCount=backup_count, encoding="utf-8"
+        )
+    else:
+        file_handler = BatchedRotatingFileHandler(
+            log_file, maxBytes=int(os.getenv("LOG_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            backupCount=backup_count, encoding="utf-8"
+        )
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = FlushingQueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+
+    if not isinstance(sys.stdout, StdoutToLog):
+        sys.stdout = StdoutToLog(sys.stdout, logger)
+    return logger
+
+
+def shutdown_logging():
+    """
+    Drains the queue and flushes the log file. Call before exit.
+    """
+    global _listener
+    if _listener is None:
+        return
+    if isinstance(sys.stdout, StdoutToLog):
+        sys.stdout = sys.stdout.terminal
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+class LogFollower:
+    """
+    Tails a rotating log file by (inode, offset). When the file is rotated,
+    the rest of the old file is read from its backup before switching to the
+    new one, so no line is lost or repeated.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.inode = None
+        self.offset = 0
+
+    def read_new_lines(self):
+        lines = []
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return lines
+
+        if self.inode is not None and stat.st_ino != self.inode:
+            # Rotated: finish the old file, which now lives under a backup name,
+            # then any backups written after it (several rotations between polls)
+            rotated = self._find_rotated()
+            if rotated is not None:
+                lines.extend(self._read_from(rotated, self.offset))
+                rotated_mtime = os.stat(rotated).st_mtime
+                newer = [p for p in self._backups() if p != rotated and os.stat(p).st_mtime >= rotated_mtime]
+                for backup in sorted(newer, key=lambda p: os.stat(p).st_mtime):
+                    lines.extend(self._read_from(backup, 0))
+            self.offset = 0
+        elif stat.st_size < self.offset:
+            self.offset = 0  # Truncated in place
+
+        self.inode = stat.st_ino
+        new_lines = self._read_from(self.path, self.offset, advance=True)
+        lines.extend(new_lines)
+        return lines
+
+    def _backups(self):
+        return list(self.path.parent.glob(self.path.name + ".*"))
+
+    def _find_rotated(self):
+        for candidate in self._backups():
+            try:
+                if os.stat(candidate).st_ino == self.inode:
+                    return candidate
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _read_from(self, path, offset, advance=False):
+        lines = []
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # Partial line, read it on the next call
+                    offset += len(raw)
+                    lines.append(raw.decode("utf-8", errors="replace").rstrip("\n"))
+        except FileNotFoundError:
+            return lines
+        if advance:
+            self.offset = offset
+        return lines
@@ -4,14 +4,29 @@ from tkinter import ttk, filedialog
 import os
 import shutil
 import json  # NEW: For reading the structured output
+import queue
+import threading
 from pathlib import Path
 from PIL import Image  # FIX: Correct spacing to avoid SyntaxError
-import time 
+from results_store import ResultsStore
+from analytics import SpendingAggregates
+from results_index import STATUS_FILTERS, ResultsIndex
+from metrics import Counters, StageTimings, load_jsonl
+from structured_log import LogFollower
+from clients import load_environment
 
 # --- Configuration ---
+# LOG_FILE, METRICS_JSONL, RESULTS_DB and CHART_DAYS come from the same .env
+# as the agent's, read when the dashboard starts (load_environment() in __init__)
 IMG_FOLDER = "img"
 OUTPUT_FOLDER = "agent_outputs"
-LOG_FILE = os.path.join(OUTPUT_FOLDER, "processing_log.txt")
+DEFAULT_LOG_FILE = os.path.join(OUTPUT_FOLDER, "processing_log.jsonl")
+DEFAULT_METRICS_FILE = os.path.join(OUTPUT_FOLDER, "metrics.jsonl")
+DEFAULT_CHART_DAYS = 30          # Days shown on the spending chart
+SCAN_INTERVAL_SECONDS = 2.0      # How often the background scanner polls the results store
+MAX_UPDATES_PER_TICK = 500       # Row updates applied per UI tick, keeps the main loop responsive
+TABLE_ROW_HEIGHT = 25            # Treeview row height; the table shows as many rows as fit
+TABLE_HEADING_HEIGHT = 25
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
@@ -26,14 +41,34 @@ class InvoiceDashboard(ctk.CTk):
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=1)
         
+        # The agent reads .env, so the dashboard must too to find the same files
+        load_environment()
+        self.log_file = os.getenv("LOG_FILE", DEFAULT_LOG_FILE)
+        self.metrics_file = os.getenv("METRICS_JSONL", DEFAULT_METRICS_FILE)
+        self.chart_days = int(os.getenv("CHART_DAYS", DEFAULT_CHART_DAYS))
+
         # State Tracking for Refresh
-        self.last_log_size = 0
-        self.last_json_count = 0 
+        self.log_follower = LogFollower(self.log_file)
+        # Pipeline metrics, rebuilt incrementally from the agent's metrics.jsonl
+        self.metrics_offset = 0
+        self.stage_timings = StageTimings()
+        self.metric_counters = Counters()
+        self.metric_totals = {"docs": 0, "image_bytes": 0, "markdown_chars": 0,
+                              "prompt_tokens": 0, "response_tokens": 0}
+        # Incremental results loading into a columnar index; the table only shows a window of it
+        self.results = ResultsIndex()
+        self.table_first = 0
+        self.table_sort = (None, False)
+        self.scan_queue = queue.Queue()
+        self.scan_wakeup = threading.Event()
+        # Running spending aggregates, fed by the scanner; the chart redraws when the version moves
+        self.analytics = SpendingAggregates()
+        self.chart_version = -1
         
         # --- 1. Sidebar (Navigation) ---
         self.sidebar_frame = ctk.CTkFrame(self, width=140, corner_radius=0)
         self.sidebar_frame.grid(row=0, column=0, rowspan=4, sticky="nsew")
-        self.sidebar_frame.grid_rowconfigure(4, weight=1)
+        self.sidebar_frame.grid_rowconfigure(6, weight=1)
 
         self.logo_label = ctk.CTkLabel(self.sidebar_frame, text="🧾 Finance Agent", font=ctk.CTkFont(size=20, weight="bold"))
         self.logo_label.grid(row=0, column=0, padx=20, pady=(20, 10))
@@ -46,9 +81,15 @@ class InvoiceDashboard(ctk.CTk):
         
         self.btn_logs = ctk.CTkButton(self.sidebar_frame, text="System Logs", command=self.show_logs)
         self.btn_logs.grid(row=3, column=0, padx=20, pady=10)
+
+        self.btn_metrics = ctk.CTkButton(self.sidebar_frame, text="Metrics", command=self.show_metrics)
+        self.btn_metrics.grid(row=4, column=0, padx=20, pady=10)
+
+        self.btn_analytics = ctk.CTkButton(self.sidebar_frame, text="Spending", command=self.show_analytics)
+        self.btn_analytics.grid(row=5, column=0, padx=20, pady=10)
         
         self.status_label = ctk.CTkLabel(self.sidebar_frame, text="Status: ● Active", text_color="#00FF00", font=("Arial", 12))
-        self.status_label.grid(row=5, column=0, padx=20, pady=20)
+        self.status_label.grid(row=7, column=0, padx=20, pady=20)
 
         # --- 2. Main Frames (Pages) ---
         
@@ -68,7 +109,7 @@ class InvoiceDashboard(ctk.CTk):
                                         command=self.upload_file)
         self.btn_upload.pack(pady=20)
         
-        self.lbl_hint = ctk.CTkLabel(self.upload_card, text="Supports .jpg (Auto-processed via Watchdog)", text_color="gray")
+        self.lbl_hint = ctk.CTkLabel(self.upload_card, text="Supports .jpg, .jpeg, .png, .pdf (Auto-processed via Watchdog)", text_color="gray")
         self.lbl_hint.pack(pady=(0, 20))
 
         # Stats Section
@@ -88,12 +129,25 @@ class InvoiceDashboard(ctk.CTk):
         self.log_box = ctk.CTkTextbox(self.log_frame, width=800, height=600, font=("Consolas", 12))
         self.log_box.pack(padx=20, pady=20, fill="both", expand=True)
 
+        # D. Metrics Frame (Per-stage latency)
+        self.metrics_frame = ctk.CTkFrame(self, corner_radius=0, fg_color="transparent")
+        self.setup_metrics()
+
+        # E. Analytics Frame (Spending chart)
+        self.analytics_frame = ctk.CTkFrame(self, corner_radius=0, fg_color="transparent")
+        self.setup_analytics()
+
         # Start on Dashboard
         self.show_dashboard()
         
         # Start Auto-Refresh Loop
         self.after(1000, self.refresh_data)
 
+        # Results are scanned and parsed off the Tk main thread
+        self.scanner = threading.Thread(target=self.scan_outputs, daemon=True)
+        self.scanner.start()
+        self.after(200, self.poll_scan_queue)
+
     # --- Setup Methods ---
     def setup_table(self):
         # ... (Styling and setup logic is fine, no changes needed here)
@@ -102,7 +156,7 @@ class InvoiceDashboard(ctk.CTk):
         style.configure("Treeview", 
                         background="#2a2d2e", 
                         foreground="white", 
-                        rowheight=25, 
+                        rowheight=TABLE_ROW_HEIGHT, 
                         fieldbackground="#343638", 
                         bordercolor="#343638", 
                         borderwidth=0)
@@ -110,20 +164,65 @@ class InvoiceDashboard(ctk.CTk):
         style.configure("Treeview.Heading", background="#565b5e", foreground="white", relief="flat")
         style.map("Treeview.Heading", background=[('active', '#3484F0')])
 
-        columns = ("file", "total_pre_tax", "total_post_tax", "check_passed")
-        self.tree = ttk.Treeview(self.data_frame, columns=columns, show="headings", height=20)
+        # Toolbar: file name search, check status filter, row count
+        self.table_toolbar = ctk.CTkFrame(self.data_frame, fg_color="transparent")
+        self.table_toolbar.pack(padx=20, pady=(20, 0), fill="x")
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.render_table(reset=True))
+        self.entry_search = ctk.CTkEntry(self.table_toolbar, textvariable=self.search_var, width=260,
+                                         placeholder_text="Search file name")
+        self.entry_search.pack(side="left")
+        self.filter_menu = ctk.CTkOptionMenu(self.table_toolbar, values=list(STATUS_FILTERS),
+                                             command=lambda choice: self.render_table(reset=True))
+        self.filter_menu.pack(side="left", padx=10)
+        self.lbl_table_count = ctk.CTkLabel(self.table_toolbar, text="0 rows", text_color="gray")
+        self.lbl_table_count.pack(side="left")
+
+        # The Treeview holds one item per visible line; scrolling rewrites their values
+        self.table_body = ctk.CTkFrame(self.data_frame, fg_color="transparent")
+        self.table_body.pack(padx=20, pady=20, fill="both", expand=True)
+        columns = ResultsIndex.COLUMNS
+        self.tree = ttk.Treeview(self.table_body, columns=columns, show="headings", height=20)
+        self.table_scrollbar = ttk.Scrollbar(self.table_body, orient="vertical", command=self.scroll_table)
         
-        self.tree.heading("file", text="File Name")
-        self.tree.heading("total_pre_tax", text="Before Tax")
-        self.tree.heading("total_post_tax", text="After Tax")
-        self.tree.heading("check_passed", text="Math Check")
+        for column, title in zip(columns, ("File Name", "Before Tax", "After Tax", "Math Check")):
+            self.tree.heading(column, text=title, command=lambda c=column: self.sort_table(c))
         
         self.tree.column("file", width=200)
         self.tree.column("total_pre_tax", width=100)
         self.tree.column("total_post_tax", width=100)
         self.tree.column("check_passed", width=100)
         
-        self.tree.pack(padx=20, pady=20, fill="both", expand=True)
+        self.table_scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.bind("<Configure>", lambda event: self.render_table())
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_table("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_table("scroll", -1, "units"))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_table("scroll", 1, "units"))
+
+    def setup_metrics(self):
+        columns = ("stage", "count", "p50", "p95", "p99")
+        self.metrics_tree = ttk.Treeview(self.metrics_frame, columns=columns, show="headings", height=12)
+        for column, title in zip(columns, ("Stage", "Count", "p50 (s)", "p95 (s)", "p99 (s)")):
+            self.metrics_tree.heading(column, text=title)
+            self.metrics_tree.column(column, width=120)
+        self.metrics_tree.pack(padx=20, pady=(20, 10), fill="both", expand=True)
+
+        self.lbl_metrics_summary = ctk.CTkLabel(self.metrics_frame, text="No metrics recorded yet.",
+                                                font=("Consolas", 13), justify="left")
+        self.lbl_metrics_summary.pack(padx=20, pady=(0, 20), anchor="w")
+
+    def setup_analytics(self):
+        self.lbl_spending_summary = ctk.CTkLabel(self.analytics_frame, text="No results yet.",
+                                                 font=("Consolas", 13), justify="left")
+        self.lbl_spending_summary.pack(padx=20, pady=(20, 10), anchor="w")
+
+        self.chart = tk.Canvas(self.analytics_frame, height=320, background="#2a2d2e", highlightthickness=0)
+        self.chart.pack(padx=20, pady=10, fill="both", expand=True)
+        self.chart.bind("<Configure>", lambda event: self.render_analytics(force=True))
+
+        self.lbl_spending_top = ctk.CTkLabel(self.analytics_frame, text="", font=("Consolas", 12), justify="left")
+        self.lbl_spending_top.pack(padx=20, pady=(0, 20), anchor="w")
 
     # --- Navigation Methods ---
     def show_dashboard(self):
@@ -134,19 +233,32 @@ class InvoiceDashboard(ctk.CTk):
         self.hide_all_frames()
         self.data_frame.grid(row=0, column=1, sticky="nsew")
         self.load_json_data() # CALLS THE NEW JSON LOADER
+        self.render_table()
 
     def show_logs(self):
         self.hide_all_frames()
         self.log_frame.grid(row=0, column=1, sticky="nsew")
 
+    def show_metrics(self):
+        self.hide_all_frames()
+        self.metrics_frame.grid(row=0, column=1, sticky="nsew")
+        self.render_metrics()
+
+    def show_analytics(self):
+        self.hide_all_frames()
+        self.analytics_frame.grid(row=0, column=1, sticky="nsew")
+        self.render_analytics(force=True)
+
     def hide_all_frames(self):
         self.dashboard_frame.grid_forget()
         self.data_frame.grid_forget()
         self.log_frame.grid_forget()
+        self.metrics_frame.grid_forget()
+        self.analytics_frame.grid_forget()
 
     # --- Action Methods ---
     def upload_file(self):
-        file_path = filedialog.askopenfilename(title="Select Invoice", filetypes=[("Images", "*.jpg *.jpeg *.png")])
+        file_path = filedialog.askopenfilename(title="Select Invoice", filetypes=[("Invoices", "*.jpg *.jpeg *.png *.pdf")])
         if file_path:
             try:
                 file_name = Path(file_path).name
@@ -157,69 +269,257 @@ class InvoiceDashboard(ctk.CTk):
             except Exception as e:
                 self.log_box.insert("end", f"❌ Error: {e}\n")
 
-    # --- NEW METHOD: Loads data from all JSON files ---
+    # --- Incremental JSON loading ---
     def load_json_data(self):
-        # Clears table
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        try:
-            json_files = list(Path(OUTPUT_FOLDER).glob("*.json"))
-        except FileNotFoundError:
-            json_files = [] 
-        
-        count = 0
-        
-        for json_file_path in json_files:
+        # Ask the background scanner for an immediate pass; rows update as results arrive
+        self.scan_wakeup.set()
+
+    def scan_outputs(self):
+        """
+        Runs on a worker thread. Polls the results store for rows written since
+        the last pass, so each pass costs time proportional to the number of
+        changes. Existing per-file JSON outputs are imported once on first run.
+        """
+        store = ResultsStore()
+        if store.count() == 0:
+            imported = store.import_json_folder(OUTPUT_FOLDER)
+            if imported:
+                print(f"✅ Imported {imported} existing JSON result(s) into the results store.")
+
+        last_id = 0
+        while True:
             try:
-                # Open with UTF-8 encoding
-                with open(json_file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    if isinstance(data, dict):
-                        count += 1
-                        self.tree.insert("", "end", values=(
-                            data.get('file_name', json_file_path.name), 
-                            data.get('total_amount_before_tax', 'N/A'),
-                            data.get('total_amount_after_tax', 'N/A'),
-                            data.get('internal_check_passed', 'FAIL')
-                        ))
-                    
-            except json.JSONDecodeError:
-                print(f"Error: Skipped invalid JSON file: {json_file_path.name}")
+                changes = store.changes_since(last_id)
             except Exception as e:
-                print(f"Error reading file {json_file_path.name}: {e}")
+                print(f"Error querying results store: {e}")
+                changes = []
+            for row in changes:
+                self.scan_queue.put((self.row_values(row), row['check_status']))
+                self.analytics.add(row)
+                last_id = row['id']
 
-        self.lbl_total_processed.configure(text=f"Invoices Processed: {count}")
+            # A full page means more rows are waiting; fetch them right away
+            if len(changes) < 1000:
+                self.scan_wakeup.wait(SCAN_INTERVAL_SECONDS)
+                self.scan_wakeup.clear()
 
+    @staticmethod
+    def row_values(row):
+        """
+        Returns the Treeview values for one results store row.
+        """
+        try:
+            data = json.loads(row['data'])
+        except json.JSONDecodeError:
+            data = {}
+        return (
+            row['file_name'], 
+            data.get('total_amount_before_tax', 'N/A'),
+            data.get('total_amount_after_tax', 'N/A'),
+            data.get('internal_check_passed', 'FAIL')
+        )
+
+    def poll_scan_queue(self):
+        """
+        Applies queued row changes on the Tk main thread: updates the index,
+        then redraws the visible window of the table once.
+        """
+        changed = False
+        try:
+            for _ in range(MAX_UPDATES_PER_TICK):
+                values, status = self.scan_queue.get_nowait()
+                self.results.upsert(values, status)
+                changed = True
+        except queue.Empty:
+            pass
+
+        if changed:
+            self.lbl_total_processed.configure(text=f"Invoices Processed: {len(self.results)}")
+            if self.data_frame.winfo_ismapped():
+                self.render_table()
+        self.after(200, self.poll_scan_queue)
+
+    # --- Virtualized table ---
+    def visible_rows(self):
+        return max(1, (self.tree.winfo_height() - TABLE_HEADING_HEIGHT) // TABLE_ROW_HEIGHT)
+
+    def table_view(self):
+        column, descending = self.table_sort
+        return self.results.view(column, descending, self.filter_menu.get(), self.search_var.get())
+
+    def render_table(self, reset=False):
+        """
+        Shows the part of the current view that fits in the Treeview. The
+        widget never holds more items than visible lines, so its cost does
+        not depend on the number of results.
+        """
+        view = self.table_view()
+        visible = self.visible_rows()
+        if reset:
+            self.table_first = 0
+        self.table_first = max(0, min(self.table_first, len(view) - visible))
+        window = self.results.window(view, self.table_first, visible)
+
+        items = self.tree.get_children()
+        for item, values in zip(items, window):
+            self.tree.item(item, values=values)
+        for item in items[len(window):]:
+            self.tree.delete(item)
+        for values in window[len(items):]:
+            self.tree.insert("", "end", values=values)
+
+        if view:
+            self.table_scrollbar.set(self.table_first / len(view), (self.table_first + len(window)) / len(view))
+        else:
+            self.table_scrollbar.set(0.0, 1.0)
+        self.lbl_table_count.configure(text=f"{len(view)} of {len(self.results)} rows")
+
+    def scroll_table(self, action, amount, unit=None):
+        """
+        Scrollbar and mouse wheel callback (same arguments as yview).
+        """
+        view_length = len(self.table_view())
+        visible = self.visible_rows()
+        if action == "moveto":
+            self.table_first = int(float(amount) * view_length)
+        elif action == "scroll":
+            step = visible if unit == "pages" else 1
+            self.table_first += int(amount) * step
+        self.render_table()
+
+    def sort_table(self, column):
+        """
+        Heading click: sorts by the column, or reverses the current sort.
+        """
+        current, descending = self.table_sort
+        self.table_sort = (column, not descending if column == current else False)
+        for name, title in zip(ResultsIndex.COLUMNS, ("File Name", "Before Tax", "After Tax", "Math Check")):
+            arrow = ("  ▼" if self.table_sort[1] else "  ▲") if name == column else ""
+            self.tree.heading(name, text=title + arrow)
+        self.render_table(reset=True)
+
+    @staticmethod
+    def format_log_line(line):
+        """
+        Turns one JSON log record into the text shown in the log box.
+        Stage timing records are left to the Metrics page.
+        """
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            return line
+        if record.get("duration") is not None:
+            return None
+        return record.get("msg", "")
+
+    # --- Metrics Page ---
+    def add_metrics_record(self, record):
+        self.metric_totals["docs"] += 1
+        for stage, seconds in record.get("stages", {}).items():
+            self.stage_timings.record(stage, seconds)
+        for name, value in record.get("counters", {}).items():
+            self.metric_counters.increment(name, value)
+        for key in ("image_bytes", "markdown_chars", "prompt_tokens", "response_tokens"):
+            self.metric_totals[key] += record.get(key) or 0
+
+    def render_metrics(self):
+        for item in self.metrics_tree.get_children():
+            self.metrics_tree.delete(item)
+        # Slowest stages first: that is where to add capacity
+        summary = sorted(self.stage_timings.summary().items(), key=lambda kv: kv[1]["p95"], reverse=True)
+        for stage, stats in summary:
+            self.metrics_tree.insert("", "end", values=(
+                stage, stats["count"], f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", f"{stats['p99']:.2f}"
+            ))
+
+        docs = self.metric_totals["docs"]
+        if not docs:
+            return
+        counters = self.metric_counters.snapshot()
+        self.lbl_metrics_summary.configure(text=(
+            f"Documents: {docs}    Failures: {counters.get('failures', 0)}    "
+            f"Retries: {counters.get('retries', 0)}\n"
+            f"OCR cache hits/misses: {counters.get('ocr_cache_hits', 0)}/{counters.get('ocr_cache_misses', 0)}    "
+            f"LLM cache hits/misses: {counters.get('llm_cache_hits', 0)}/{counters.get('llm_cache_misses', 0)}\n"
+            f"Fast path / Gemini: {counters.get('path_fast', 0)}/{counters.get('path_llm', 0)}    "
+            f"Avg image: {self.metric_totals['image_bytes'] / docs / 1024:.0f} KB    "
+            f"Avg markdown: {self.metric_totals['markdown_chars'] / docs:.0f} chars    "
+            f"Tokens in/out: {self.metric_totals['prompt_tokens']}/{self.metric_totals['response_tokens']}"
+        ))
+
+    def render_analytics(self, force=False):
+        """
+        Redraws the spending page from the running aggregates. Only the last
+        CHART_DAYS days are drawn, so the cost does not grow with the number of
+        invoices; nothing is redrawn while no new result has arrived.
+        """
+        if not force and self.analytics.version == self.chart_version:
+            return
+        self.chart_version = self.analytics.version
+
+        summary = self.analytics.summary()
+        pass_rate = "n/a" if summary["pass_rate"] is None else f"{summary['pass_rate']:.0%}"
+        self.lbl_spending_summary.configure(text=(
+            f"Invoices: {summary['count']}    Before tax: {summary['total_before_tax']:.2f}    "
+            f"After tax: {summary['total_after_tax']:.2f}    Math check passed: {pass_rate}"
+        ))
+        vendors = "    ".join(f"{name}: {total:.2f}" for name, total in self.analytics.top_vendors())
+        items = "    ".join(f"{name} x{count} ({amount:.2f})" for name, count, amount in self.analytics.top_items())
+        self.lbl_spending_top.configure(text=f"Top vendors: {vendors or '-'}\nTop items:   {items or '-'}")
+
+        canvas = self.chart
+        canvas.delete("all")
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        window = self.analytics.daily_window(self.chart_days)
+        if width < 50 or height < 50 or not window:
+            return
+        left, right, top, bottom = 60, 20, 20, 30
+        plot_w, plot_h = width - left - right, height - top - bottom
+        max_daily = max(spent for _, spent, _ in window) or 1.0
+        max_total = max(total for _, _, total in window) or 1.0
+        step = plot_w / len(window)
+
+        canvas.create_line(left, top + plot_h, left + plot_w, top + plot_h, fill="gray")
+        canvas.create_text(left - 5, top, text=f"{max_total:.0f}", anchor="ne", fill="#3484F0")
+        canvas.create_text(left - 5, top + 15, text=f"{max_daily:.0f}/day", anchor="ne", fill="#2CC985")
+        points = []
+        for i, (day, spent, total) in enumerate(window):
+            x = left + i * step
+            bar_top = top + plot_h * (1 - spent / max_daily)
+            canvas.create_rectangle(x + 1, bar_top, x + step - 1, top + plot_h, fill="#2CC985", outline="")
+            points += [x + step / 2, top + plot_h * (1 - total / max_total)]
+            if i % 7 == 0 or i == len(window) - 1:
+                canvas.create_text(x + step / 2, top + plot_h + 12, text=day[5:], fill="gray")
+        if len(points) >= 4:
+            canvas.create_line(*points, fill="#3484F0", width=2)
 
     # --- Auto-Refresh Loop ---
     def refresh_data(self):
-        # 1. Update Logs
-        if os.path.exists(LOG_FILE):
-            try:
-                current_size = os.stat(LOG_FILE).st_size
-                if current_size > self.last_log_size:
-                    # Read the new content with UTF-8 encoding
-                    with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                        f.seek(self.last_log_size)
-                        new_text = f.read()
-                        self.log_box.insert("end", new_text)
-                        self.log_box.see("end")
-                    self.last_log_size = current_size
-            except Exception:
-                pass # Ignore errors if the file is being actively written to
-
-        # 2. Update JSON Data (Check file count)
+        # 1. Update Logs (follows rotation by inode and offset)
+        try:
+            new_lines = [self.format_log_line(line) for line in self.log_follower.read_new_lines()]
+            new_lines = [line for line in new_lines if line]
+            if new_lines:
+                self.log_box.insert("end", "\n".join(new_lines) + "\n")
+                self.log_box.see("end")
+        except Exception:
+            pass # Ignore errors if the file is being actively written to
+
+        # 2. JSON results are picked up by the background scanner (scan_outputs)
+
+        # 3. Update Metrics (only the records appended since the last refresh)
         try:
-            current_json_files = list(Path(OUTPUT_FOLDER).glob("*.json"))
-            current_json_count = len(current_json_files)
-            
-            if current_json_count > self.last_json_count:
-                self.load_json_data()
-                self.last_json_count = current_json_count
+            records, self.metrics_offset = load_jsonl(self.metrics_file, self.metrics_offset)
+            for record in records:
+                self.add_metrics_record(record)
+            if records and self.metrics_frame.winfo_ismapped():
+                self.render_metrics()
         except Exception:
-            pass 
+            pass
+
+        # 4. Redraw the spending chart if new results arrived
+        if self.analytics_frame.winfo_ismapped():
+            self.render_analytics()
 
         self.after(2000, self.refresh_data) # Check again in 2 seconds
 
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from watchdog.events import FileSystemEventHandler
+
+from ocr_cache import file_sha256
+import metrics
+
+# --- Configuration ---
+# The same types the dashboard lets users upload
+SUPPORTED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".pdf")
+DEFAULT_QUIET_PERIOD = 1.0   # Seconds a file's size and mtime must stay unchanged
+DEFAULT_DEDUP_SECONDS = 60.0   # Identical content dispatched within this window is skipped
+DEFAULT_DEDUP_ENTRIES = 4096   # Most recent dispatches remembered for that check
+
+
+def is_supported(path) -> bool:
+    name = Path(path).name
+    return name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith("~")
+
+
+class DebouncedFileHandler(FileSystemEventHandler):
+    """
+    Coalesces created/modified/moved events per path and hands a file to
+    on_ready() once, after its size and mtime have been stable for the quiet
+    period. A file is skipped if the same content was dispatched within the
+    last WATCHER_DEDUP_SECONDS (bursts of events, copies dropped together),
+    or if is_known(content_hash) says it is already saved or in progress.
+    Content whose run failed is therefore dispatched again when re-dropped.
+
+    A single scheduler thread waits on a condition variable until the next
+    deadline, so no thread sleeps per event.
+    """
+    def __init__(self, on_ready, quiet_period=None, is_known=None):
+        super().__init__()
+        self.on_ready = on_ready
+        self.is_known = is_known
+        self.quiet_period = float(quiet_period or os.getenv("WATCHER_QUIET_PERIOD", DEFAULT_QUIET_PERIOD))
+        self.dedup_seconds = float(os.getenv("WATCHER_DEDUP_SECONDS", DEFAULT_DEDUP_SECONDS))
+        self._pending = {}          # path -> [deadline, (size, mtime), first_event_time]
+        self._recent = OrderedDict()  # content hash -> dispatch time, oldest first
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    # --- watchdog callbacks ---
+    def on_created(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+        with self._cond:
+            self._pending.pop(event.src_path, None)
+        self._touch(event.dest_path)
+
+    def _touch(self, path):
+        if not is_supported(path):
+            return
+        with self._cond:
+            entry = self._pending.get(path)
+            deadline = time.monotonic() + self.quiet_period
+            if entry is None:
+                self._pending[path] = [deadline, _snapshot(path), time.monotonic()]
+            else:
+                entry[0] = deadline
+            self._cond.notify()
+
+    # --- Scheduler ---
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="watcher-debounce", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                due = [path for path, entry in self._pending.items() if entry[0] <= now]
+                if not due:
+                    next_deadline = min((entry[0] for entry in self._pending.values()), default=None)
+                    timeout = None if next_deadline is None else next_deadline - now
+                    self._cond.wait(timeout)
+                    continue
+                ready = []
+                for path in due:
+                    _, previous, first_seen = self._pending[path]
+                    current = _snapshot(path)
+                    if current is None:
+                        # File vanished (moved away or deleted) before it settled
+                        del self._pending[path]
+                    elif current != previous:
+                        # Still being written: wait another quiet period
+                        self._pending[path] = [now + self.quiet_period, current, first_seen]
+                    elif current[0] == 0:
+                        del self._pending[path]
+                        print(f"⚠️ Skipping empty file: {Path(path).name}")
+                    else:
+                        del self._pending[path]
+                        ready.append(path)
+                        metrics.record_stage("watcher_wait", now - first_seen)
+
+            for path in ready:
+                self._dispatch(path)
+
+    def _dispatch(self, path):
+        try:
+            content_hash = file_sha256(path)
+        except OSError as e:
+            print(f"⚠️ Could not read {path}: {e}")
+            return
+        if self._recently_dispatched(content_hash):
+            print(f"⏭️ Skipping {Path(path).name}: identical content was just queued.")
+            return
+        if self.is_known is not None and self.is_known(content_hash):
+            print(f"⏭️ Skipping {Path(path).name}: identical content already processed.")
+            return
+        self._recent[content_hash] = time.monotonic()
+        while len(self._recent) > DEFAULT_DEDUP_ENTRIES:
+            self._recent.popitem(last=False)
+        self.on_ready(path)
+
+    def _recently_dispatched(self, content_hash):
+        # Only the scheduler thread touches _recent; expired entries go first
+        cutoff = time.monotonic() - self.dedup_seconds
+        while self._recent and next(iter(self._recent.values())) < cutoff:
+            self._recent.popitem(last=False)
+        return content_hash in self._recent
+
+
+def _snapshot(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,532 @@
+import hmac
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import metrics
+from ocr_cache import file_sha256
+from worker_pool import MemoryCeiling
+
+# --- Configuration ---
+# All values can be overridden from the .env file
+DEFAULT_DB_PATH = Path("agent_outputs") / "work_queue.db"
+DEFAULT_LEASE_SECONDS = 120      # A job whose worker stops heartbeating is reclaimed after this
+DEFAULT_MAX_ATTEMPTS = 3         # Leases per job before it is marked failed
+DEFAULT_POLL_SECONDS = 1.0       # Idle workers check for new jobs this often
+DEFAULT_QUEUE_WORKERS = 4
+# Multi-host: the coordinator serves the queue over HTTP when WORK_QUEUE_PORT
+# is set, and workers with WORK_QUEUE_URL lease through it (RemoteWorkQueue)
+DEFAULT_SERVER_BIND = "127.0.0.1"  # Set WORK_QUEUE_BIND=0.0.0.0 to accept other hosts
+DEFAULT_SPOOL_DIR = Path("agent_outputs") / "spool"
+DEFAULT_HTTP_TIMEOUT = 30
+
+# Job states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    content_hash  TEXT PRIMARY KEY,
+    file_path     TEXT NOT NULL,
+    state         TEXT NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    worker_id     TEXT,
+    lease_expires REAL,
+    error         TEXT,
+    enqueued_at   REAL NOT NULL,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_work_items_state ON work_items (state, enqueued_at);
+"""
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class WorkQueue:
+    """
+    Work queue shared by every agent process on this host that opens the
+    same SQLite file. The file itself is single-host: WAL mode keeps its
+    index in shared memory, and file locks over network filesystems are
+    unreliable, so other hosts reach it through serve_queue() and
+    RemoteWorkQueue instead of a mount. Jobs are keyed by content hash, so
+    publishing the same document twice queues it once. File paths are
+    stored absolute, so workers need not share the coordinator's working
+    directory.
+
+    A worker leases a job for lease_seconds and renews the lease while it
+    works (heartbeat). A lease that runs out, because its worker crashed or
+    its host went away, makes the job available to the next worker. Claims
+    run in BEGIN IMMEDIATE transactions, so two workers never lease the
+    same job.
+    """
+    def __init__(self, db_path=None, max_attempts=None):
+        self.db_path = str(db_path or os.getenv("WORK_QUEUE_DB", DEFAULT_DB_PATH))
+        self.max_attempts = int(max_attempts or os.getenv("WORK_QUEUE_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        # Autocommit mode: transactions are opened explicitly in _transaction()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Write transaction that takes the database write lock up front, so the
+        read-then-update in lease() cannot interleave with another process.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def publish(self, file_path, content_hash=None) -> bool:
+        """
+        Queues a document. Returns False if the same content is already queued,
+        leased or done; a job that failed is queued again.
+        """
+        content_hash = content_hash or file_sha256(file_path)
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO work_items (content_hash, file_path, state, enqueued_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(content_hash) DO UPDATE SET file_path = excluded.file_path, state = excluded.state, "
+                "attempts = 0, worker_id = NULL, lease_expires = NULL, error = NULL, "
+                "enqueued_at = excluded.enqueued_at, updated_at = excluded.updated_at "
+                "WHERE work_items.state = ?",
+                (content_hash, os.path.abspath(file_path), PENDING, now, now, FAILED),
+            )
+            return cursor.rowcount > 0
+
+    def lease(self, worker_id, lease_seconds=None):
+        """
+        Claims the oldest pending job, or one whose lease expired, and returns
+        it as a dict; None if there is nothing to do. Jobs whose lease expired
+        max_attempts times are marked failed instead.
+        """
+        lease_seconds = lease_seconds or _env_float("WORK_QUEUE_LEASE_SECONDS", DEFAULT_LEASE_SECONDS)
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT * FROM work_items WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                    "ORDER BY enqueued_at LIMIT 1",
+                    (PENDING, LEASED, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                job = dict(row)
+                if job["state"] == LEASED and job["attempts"] >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE work_items SET state = ?, error = ?, updated_at = ? WHERE content_hash = ?",
+                        (FAILED, f"lease expired {job['attempts']} times", now, job["content_hash"]),
+                    )
+                    metrics.increment("queue_failed")
+                    continue
+                conn.execute(
+                    "UPDATE work_items SET state = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE content_hash = ?",
+                    (LEASED, worker_id, now + lease_seconds, now, job["content_hash"]),
+                )
+            if job["state"] == LEASED:
+                print(f"♻️ Reclaimed expired lease on {Path(job['file_path']).name} (was {job['worker_id']}).")
+                metrics.increment("queue_reclaimed")
+            job.update(state=LEASED, worker_id=worker_id, attempts=job["attempts"] + 1,
+                       lease_expires=now + lease_seconds)
+            return job
+
+    def get(self, content_hash):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM work_items WHERE content_hash = ?", (content_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def _update_owned(self, content_hash, worker_id, sql, params) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE work_items SET {sql}, updated_at = ? "
+                "WHERE content_hash = ? AND state = ? AND worker_id = ?",
+                (*params, time.time(), content_hash, LEASED, worker_id),
+            )
+            return cursor.rowcount > 0
+
+    def heartbeat(self, content_hash, worker_id, lease_seconds=None) -> bool:
+        """
+        Extends a lease. False if the worker no longer holds it.
+        """
+        lease_seconds = lease_seconds or _env_float("WORK_QUEUE_LEASE_SECONDS", DEFAULT_LEASE_SECONDS)
+        return self._update_owned(content_hash, worker_id, "lease_expires = ?", (time.time() + lease_seconds,))
+
+    def complete(self, content_hash, worker_id, result=None) -> bool:
+        # result is only used by RemoteWorkQueue; local workers saved it already
+        return self._update_owned(content_hash, worker_id, "state = ?, lease_expires = NULL", (DONE,))
+
+    def fail(self, content_hash, worker_id, error) -> bool:
+        """
+        Gives a job back after an error: pending again while it has attempts
+        left, failed after that.
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE work_items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE content_hash = ? AND state = ? AND worker_id = ?",
+                (self.max_attempts, FAILED, PENDING, str(error), time.time(), content_hash, LEASED, worker_id),
+            )
+            return cursor.rowcount > 0
+
+    def release(self, content_hash, worker_id) -> bool:
+        """
+        Hands a leased job back untouched (worker shutting down), without
+        counting the attempt.
+        """
+        return self._update_owned(content_hash, worker_id,
+                                  "state = ?, lease_expires = NULL, attempts = attempts - 1", (PENDING,))
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM work_items GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class QueueWorker:
+    """
+    Pulls jobs from a WorkQueue with `workers` threads and runs handler(file_path)
+    for each. One heartbeat thread renews the leases of every running job.
+    A handler that returns a result completes its job; one that returns
+    None (nothing was saved) or raises gives it back for another attempt.
+
+    Start as many QueueWorkers, in as many processes and hosts, as needed:
+    they coordinate only through the queue (a WorkQueue on the queue's host,
+    a RemoteWorkQueue elsewhere).
+    """
+    def __init__(self, handler, work_queue, workers=None, lease_seconds=None, exit_when_idle=False):
+        self.handler = handler
+        self.queue = work_queue
+        self.workers = workers or int(os.getenv("QUEUE_WORKERS", DEFAULT_QUEUE_WORKERS))
+        self.lease_seconds = lease_seconds or _env_float("WORK_QUEUE_LEASE_SECONDS", DEFAULT_LEASE_SECONDS)
+        self.poll_seconds = _env_float("WORK_QUEUE_POLL_SECONDS", DEFAULT_POLL_SECONDS)
+        self.exit_when_idle = exit_when_idle
+        self.id = f"{socket.gethostname()}-{os.getpid()}"
+        self.memory = MemoryCeiling.for_workers(self.workers)
+        self._active = {}             # content hash -> worker id
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Heartbeats go on until the running jobs are finished, after _stop
+        self._finished = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(f"{self.id}-{i}",),
+                                      name=f"queue-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._heartbeat, name="queue-heartbeat", daemon=True).start()
+        print(f"⭐ Queue worker {self.id} started: {self.workers} workers, lease {self.lease_seconds:.0f}s, "
+              f"queue {self.queue.db_path}")
+        return self
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.lease(worker_id, self.lease_seconds)
+            except (sqlite3.Error, OSError) as e:
+                # Queue busy or coordinator unreachable: try again after a pause
+                print(f"⚠️ Could not lease a job: {e}")
+                self._stop.wait(self.poll_seconds)
+                continue
+            if job is None:
+                if self.exit_when_idle and not self._any_active():
+                    return
+                self._stop.wait(self.poll_seconds)
+                continue
+            content_hash = job["content_hash"]
+            with self._active_lock:
+                self._active[content_hash] = worker_id
+            try:
+                self._process(job, worker_id)
+            except (sqlite3.Error, OSError) as e:
+                # The ack did not reach the queue; the lease runs out and the job is retried
+                print(f"⚠️ Could not report {Path(job['file_path']).name} to the queue: {e}")
+            finally:
+                with self._active_lock:
+                    self._active.pop(content_hash, None)
+
+    def _process(self, job, worker_id):
+        content_hash = job["content_hash"]
+        try:
+            with self.memory.admit():
+                result = self.handler(job["file_path"])
+        except Exception as e:
+            print(f"❌ Queue worker error while processing {job['file_path']}: {e}")
+            self.queue.fail(content_hash, worker_id, e)
+            return
+        if result is None:
+            print(f"⚠️ No result saved for {job['file_path']}, giving the job back.")
+            self.queue.fail(content_hash, worker_id, "no result saved (missing file or dead-lettered)")
+        elif not self.queue.complete(content_hash, worker_id, result):
+            print(f"⚠️ Lease on {Path(job['file_path']).name} was lost before it finished.")
+
+    def _any_active(self):
+        with self._active_lock:
+            return bool(self._active)
+
+    def _heartbeat(self):
+        while not self._finished.wait(self.lease_seconds / 3):
+            with self._active_lock:
+                active = list(self._active.items())
+            for content_hash, worker_id in active:
+                try:
+                    self.queue.heartbeat(content_hash, worker_id, self.lease_seconds)
+                except (sqlite3.Error, OSError) as e:
+                    print(f"⚠️ Heartbeat failed: {e}")
+
+    def join(self):
+        """
+        Waits for the worker threads; returns once they exit (exit_when_idle)
+        or stop() was called.
+        """
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(0.5)
+        self._finished.set()
+
+    def stop(self, wait=True):
+        """
+        Stops leasing new jobs. With wait=True running jobs finish; otherwise
+        their leases are handed back so another worker picks them up now.
+        """
+        self._stop.set()
+        if wait:
+            self.join()
+            return
+        with self._active_lock:
+            active = list(self._active.items())
+        for content_hash, worker_id in active:
+            self.queue.release(content_hash, worker_id)
+        self._finished.set()
+
+
+class _QueueHandler(BaseHTTPRequestHandler):
+    """
+    JSON-over-HTTP front of a WorkQueue (see serve_queue). Every request must
+    carry the shared token when WORK_QUEUE_TOKEN is set.
+    """
+    def _authorized(self):
+        token = self.server.token
+        given = self.headers.get("Authorization", "")
+        if token and not hmac.compare_digest(given, f"Bearer {token}"):
+            self.send_error(401)
+            return False
+        return True
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        queue = self.server.queue
+        if self.path == "/counts":
+            self._send_json(queue.counts())
+            return
+        if not self.path.startswith("/documents/"):
+            self.send_error(404)
+            return
+        # Only documents currently leased out are served
+        job = queue.get(self.path[len("/documents/"):])
+        if job is None or job["state"] != LEASED:
+            self.send_error(404)
+            return
+        try:
+            f = open(job["file_path"], "rb")
+        except OSError:
+            self.send_error(404)
+            return
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            queue, content_hash, worker_id = self.server.queue, request.get("content_hash"), request.get("worker_id")
+            if self.path == "/lease":
+                self._send_json(queue.lease(worker_id, request.get("lease_seconds")))
+            elif self.path == "/heartbeat":
+                self._send_json(queue.heartbeat(content_hash, worker_id, request.get("lease_seconds")))
+            elif self.path == "/complete":
+                job = queue.get(content_hash)
+                if (request.get("result") is not None and self.server.on_complete is not None
+                        and job is not None and job["state"] == LEASED and job["worker_id"] == worker_id):
+                    self.server.on_complete(job, request["result"])
+                self._send_json(queue.complete(content_hash, worker_id))
+            elif self.path == "/fail":
+                self._send_json(queue.fail(content_hash, worker_id, request.get("error")))
+            elif self.path == "/release":
+                self._send_json(queue.release(content_hash, worker_id))
+            else:
+                self.send_error(404)
+        except (ValueError, sqlite3.Error) as e:
+            self.send_error(400 if isinstance(e, ValueError) else 503, str(e))
+
+    def log_message(self, format, *args):
+        pass  # Keep worker polling out of the processing log
+
+
+def serve_queue(work_queue, on_complete=None, port=None):
+    """
+    Serves work_queue over HTTP on WORK_QUEUE_BIND:WORK_QUEUE_PORT (or port)
+    so workers on other hosts can lease from it with RemoteWorkQueue.
+    on_complete(job, result) stores the result a remote worker sends back.
+    Returns the server, or None when WORK_QUEUE_PORT is not set.
+    """
+    port = port or os.getenv("WORK_QUEUE_PORT")
+    if not port:
+        return None
+    bind = os.getenv("WORK_QUEUE_BIND", DEFAULT_SERVER_BIND)
+    server = ThreadingHTTPServer((bind, int(port)), _QueueHandler)
+    server.queue = work_queue
+    server.on_complete = on_complete
+    server.token = os.getenv("WORK_QUEUE_TOKEN")
+    threading.Thread(target=server.serve_forever, name="work-queue-http", daemon=True).start()
+    print(f"📡 Work queue served on http://{bind}:{port}/"
+          f"{'' if server.token else ' (no WORK_QUEUE_TOKEN set, any client may lease)'}")
+    return server
+
+
+class RemoteWorkQueue:
+    """
+    WorkQueue interface for workers on other hosts: every call goes to the
+    coordinator's serve_queue() endpoint at WORK_QUEUE_URL. A leased
+    document is downloaded into the spool folder, so hosts share no
+    filesystem; the result goes back to the coordinator with complete().
+    """
+    def __init__(self, url=None, spool_dir=None):
+        self.url = (url or os.getenv("WORK_QUEUE_URL", "")).rstrip("/")
+        self.db_path = self.url  # Shown in the worker's start-up line
+        self.spool_dir = Path(spool_dir or os.getenv("WORK_QUEUE_SPOOL", DEFAULT_SPOOL_DIR))
+        self.token = os.getenv("WORK_QUEUE_TOKEN")
+
+    def _request(self, path, payload=None):
+        request = urllib.request.Request(
+            self.url + path,
+            data=None if payload is None else json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        return urllib.request.urlopen(request, timeout=DEFAULT_HTTP_TIMEOUT)
+
+    def _call(self, path, payload=None):
+        with self._request(path, payload) as response:
+            return json.loads(response.read())
+
+    def _spool_path(self, content_hash, file_name):
+        return self.spool_dir / content_hash / Path(file_name).name
+
+    def _discard(self, content_hash):
+        shutil.rmtree(self.spool_dir / content_hash, ignore_errors=True)
+
+    def lease(self, worker_id, lease_seconds=None):
+        while True:
+            job = self._call("/lease", {"worker_id": worker_id, "lease_seconds": lease_seconds})
+            if job is None:
+                return None
+            # Same file name as on the coordinator, so the result is saved under it
+            local_path = self._spool_path(job["content_hash"], job["file_path"])
+            os.makedirs(local_path.parent, exist_ok=True)
+            try:
+                with self._request(f"/documents/{job['content_hash']}") as response, \
+                        open(local_path, "wb") as f:
+                    shutil.copyfileobj(response, f)
+            except urllib.error.HTTPError as e:
+                self._discard(job["content_hash"])
+                self.fail(job["content_hash"], worker_id, f"document download failed: {e}")
+                continue
+            job["file_path"] = str(local_path)
+            return job
+
+    def heartbeat(self, content_hash, worker_id, lease_seconds=None) -> bool:
+        return self._call("/heartbeat", {"content_hash": content_hash, "worker_id": worker_id,
+                                         "lease_seconds": lease_seconds})
+
+    def complete(self, content_hash, worker_id, result=None) -> bool:
+        try:
+            return self._call("/complete", {"content_hash": content_hash, "worker_id": worker_id,
+                                            "result": result})
+        finally:
+            self._discard(content_hash)
+
+    def fail(self, content_hash, worker_id, error) -> bool:
+        try:
+            return self._call("/fail", {"content_hash": content_hash, "worker_id": worker_id,
+                                        "error": str(error)})
+        finally:
+            self._discard(content_hash)
+
+    def release(self, content_hash, worker_id) -> bool:
+        try:
+            return self._call("/release", {"content_hash": content_hash, "worker_id": worker_id})
+        finally:
+            self._discard(content_hash)
+
+    def counts(self) -> dict:
+        return self._call("/counts")
+
+    def close(self):
+        pass
+
+
+_work_queue = None
+_work_queue_lock = threading.Lock()
+
+
+def get_work_queue():
+    """
+    Returns the process-wide work queue, opening it on first use: the
+    coordinator's served queue when WORK_QUEUE_URL is set, the local SQLite
+    queue otherwise.
+    """
+    global _work_queue
+    with _work_queue_lock:
+        if _work_queue is None:
+            _work_queue = RemoteWorkQueue() if os.getenv("WORK_QUEUE_URL") else WorkQueue()
+    return _work_queue
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import queue
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+
+# --- Configuration ---
+# All values can be overridden from the .env file
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_STAGE_CONCURRENCY = {
+    "azure_di": 4,   # Concurrent Document Intelligence analyses
+    "gemini": 4,     # Concurrent Gemini generate_content calls
+}
+
+# WORKER_MEMORY_MB (default 0 = no limit): resident memory allowed per worker.
+# New documents wait while the process is over workers x WORKER_MEMORY_MB.
+MEMORY_POLL_SECONDS = 0.5
+
+# Sentinel pushed once per worker to stop it after the queue is drained
+_STOP = object()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class StageLimits:
+    """
+    Caps how many workers may be inside each pipeline stage at once,
+    so the Azure DI and Gemini calls can be sized independently.
+    """
+    def __init__(self, limits=None):
+        limits = dict(limits or {})
+        self.limits = {}
+        self._semaphores = {}
+        for stage, default in DEFAULT_STAGE_CONCURRENCY.items():
+            value = limits.pop(stage, None)
+            if value is None:
+                value = _env_int(f"{stage.upper()}_CONCURRENCY", default)
+            self.limits[stage] = max(1, value)
+        for stage, value in limits.items():
+            self.limits[stage] = max(1, value)
+        for stage, value in self.limits.items():
+            self._semaphores[stage] = threading.BoundedSemaphore(value)
+
+    @contextmanager
+    def stage(self, name):
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+
+class AsyncStageLimits:
+    """
+    asyncio counterpart of StageLimits for the async pipeline.
+    Create it inside the running event loop.
+    """
+    def __init__(self, limits):
+        self.limits = dict(limits)
+        self._semaphores = {stage: asyncio.Semaphore(value) for stage, value in self.limits.items()}
+
+    @asynccontextmanager
+    async def stage(self, name):
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+
+
+def current_rss_bytes():
+    """
+    Resident set size of this process, or None where it cannot be read.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryCeiling:
+    """
+    Admission control on resident memory. A document may start only while
+    the process is under the limit; otherwise it waits for running documents
+    to finish and free memory. A document is always admitted when nothing
+    else is running, so one oversized document cannot stall the pool.
+    """
+    def __init__(self, limit_bytes=0):
+        self.limit_bytes = limit_bytes
+        self._active = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def for_workers(cls, workers):
+        return cls(_env_int("WORKER_MEMORY_MB", 0) * 1024 * 1024 * workers)
+
+    def _over_limit(self):
+        rss = current_rss_bytes()
+        return rss is not None and rss > self.limit_bytes
+
+    @contextmanager
+    def admit(self):
+        if not self.limit_bytes:
+            yield
+            return
+        with self._condition:
+            if self._active and self._over_limit():
+                metrics.increment("memory_waits")
+                while self._active and self._over_limit():
+                    self._condition.wait(MEMORY_POLL_SECONDS)
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def aadmit(self):
+        """
+        admit() for coroutines on one event loop: polls instead of blocking.
+        """
+        if not self.limit_bytes:
+            yield
+            return
+        if self._active and self._over_limit():
+            metrics.increment("memory_waits")
+            while self._active and self._over_limit():
+                await asyncio.sleep(MEMORY_POLL_SECONDS)
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+
+
+class WorkerPool:
+    """
+    Bounded thread pool fed by a queue of file paths.
+
+    submit() only enqueues, so the watchdog observer thread is never blocked by
+    OCR or LLM calls. When the queue is full submit() blocks, which pushes
+    back on the producer instead of buffering an unbounded backlog. With
+    WORKER_MEMORY_MB set, workers also wait for memory before starting.
+    """
+    def __init__(self, handler, workers=None, queue_size=None, name="agent-worker"):
+        self.handler = handler
+        self.workers = workers or _env_int("AGENT_WORKERS", DEFAULT_WORKERS)
+        self.queue_size = queue_size or _env_int("AGENT_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)
+        self.name = name
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.memory = MemoryCeiling.for_workers(self.workers)
+        self._threads = []
+        self._accepting = False
+
+    def start(self):
+        self._accepting = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"⭐ Worker pool started: {self.workers} workers, queue size {self.queue_size}"
+              + (f", memory ceiling {self.memory.limit_bytes // 2**20} MB" if self.memory.limit_bytes else ""))
+        return self
+
+    def submit(self, item, timeout=None):
+        """
+        Enqueues an item for processing. Blocks while the queue is full.
+        Returns False if the pool is shutting down or the timeout expired.
+        """
+        if not self._accepting:
+            return False
+        if self.queue.full():
+            print(f"⏳ Queue full ({self.queue_size}), waiting for a free slot...")
+        try:
+            self.queue.put(item, timeout=timeout)
+        except queue.Full:
+            print(f"⚠️ Queue still full after {timeout}s, dropped: {item}")
+            return False
+        return True
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                with self.memory.admit():
+                    self.handler(item)
+            except Exception as e:
+                print(f"❌ Worker error while processing {item}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting new work. With wait=True every queued item is processed
+        before the workers exit (graceful drain).
+        """
+        self._accepting = False
+        if wait:
+            pending = self.pending()
+            if pending:
+                print(f"⏳ Draining {pending} queued file(s) before exit...")
+            self.queue.join()
+        else:
+            # Discard whatever has not been started yet
+            try:
+                while True:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+            except queue.Empty:
+                pass
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []